@@ -0,0 +1,116 @@
+"""
+usage: benchmark_eps_ri_conversion.py [-h] [--shape SHAPE] [--chunk_shape CHUNK_SHAPE] [--repeat REPEAT]
+
+Compare the throughput of the permittivity <-> RI conversion engines of `convert_between_eps_ri.py`.
+
+The legacy path reshapes the (t, 9, z, y, x) array into (t, z, y, x, 3, 3), rechunks the
+tensor axes, squares the tensors voxel by voxel and reverses the reshaping.
+The chunk-local path transforms blocks spanning all 9 channels with batched einsum/eigh.
+
+optional arguments:
+    -h, --help      show this help message and exit
+    --shape         Shape of the synthetic (t, 9, z, y, x) tensor field. (Default: "(1,9,32,128,128)")
+    --chunk_shape   Chunk shape of the zarr arrays. (Default: "(1,1,32,64,64)")
+    --repeat        Number of timed repetitions; the best one is reported. (Default: 3)
+"""
+
+import argparse
+from timeit import default_timer
+import numpy as np
+import dask.array as da
+import zarr
+from convert_between_eps_ri import ri2eps, eps2ri_taylor, eps2ri_eigh, convert_tensor
+
+def legacy_ri2eps(x):
+    x_arr = x.reshape((-1,3,3))
+    y_arr = np.empty_like(x_arr)
+    for i in range(x_arr.shape[0]):
+        y_arr[i] =  x_arr[i] @ x_arr[i]
+    y = y_arr.reshape(x.shape)
+    return y
+
+def legacy_eps2ri_taylor(x):
+    x_arr = x.reshape((-1,3,3))
+    x0_sqrt_arr = np.zeros_like(x_arr, shape=(x_arr.shape[0],3))
+    x_delta_arr = x_arr.copy()
+    y_arr = np.zeros_like(x_arr)
+    for i in range(3):
+        x0_sqrt_arr[:,i] = np.sqrt(x_arr[:,i,i])
+        x_delta_arr[:,i,i] = 0
+    for i in range(3):
+        y_arr[:,i,i] += x0_sqrt_arr[:,i]
+    y_arr += x_delta_arr/2
+    for i in range(3):
+        for j in range(3):
+            y_arr[:,j,i] -= np.sum(x_delta_arr[:,j,:]/x0_sqrt_arr*x_delta_arr[:,:,i],axis=1)/8
+    y = y_arr.reshape(x.shape)
+    return y
+
+def legacy_convert_tensor(input_array, output_array, fn):
+    input_zarr = da.from_zarr(input_array)
+    reshaped_input_zarr = da.moveaxis(input_zarr, 1, -1) # t,c,z,y,x -> t,z,y,x,c
+    reshaped_input_zarr = reshaped_input_zarr.reshape(reshaped_input_zarr.shape[:-1] + (3,3))
+    reshaped_input_zarr = reshaped_input_zarr.rechunk(
+        reshaped_input_zarr.chunks[:-2] + ((3,),(3,))
+    )
+    reshaped_output_data = da.map_blocks(fn, reshaped_input_zarr, dtype = reshaped_input_zarr.dtype)
+    reshaped_output_data = reshaped_output_data.reshape(reshaped_output_data.shape[:-2] + (9,))
+    reshaped_output_data = da.moveaxis(reshaped_output_data, -1, 1)
+    output_data = reshaped_output_data.rechunk(input_zarr.chunks)
+    output_data.store(output_array, lock = False)
+
+def synthesize_permittivity(shape, seed = 12345):
+    """Random symmetric positive definite permittivity field around water (n = 1.337)."""
+    rng = np.random.default_rng(seed)
+    t, c, z, y, x = shape
+    perturbation = rng.uniform(-5e-3, 5e-3, (t, z, y, x, 3, 3))
+    ri = 1.337 * np.eye(3) + (perturbation + np.swapaxes(perturbation, -1, -2)) / 2
+    eps = ri @ ri
+    return np.moveaxis(eps.reshape(t, z, y, x, 9), -1, 1).astype(np.float32)
+
+def time_conversion(convert, src, chunk_shape, fn, repeat):
+    input_array = zarr.array(src, chunks = chunk_shape, compressor = None, store = zarr.MemoryStore())
+    best_time = np.inf
+    for _ in range(repeat):
+        output_array = zarr.create(
+            shape = src.shape,
+            chunks = chunk_shape,
+            dtype = src.dtype,
+            compressor = None,
+            store = zarr.MemoryStore()
+        )
+        start_time = default_timer()
+        convert(input_array, output_array, fn)
+        end_time = default_timer()
+        best_time = min(best_time, end_time - start_time)
+    return best_time, output_array[...]
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare the throughput of the permittivity <-> RI conversion engines."
+    )
+    parser.add_argument("--shape", default="(1,9,32,128,128)", help="Shape of the synthetic tensor field.")
+    parser.add_argument("--chunk_shape", default="(1,1,32,64,64)", help="Chunk shape of the zarr arrays.")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of timed repetitions.")
+    args = parser.parse_args()
+    shape = eval(args.shape)
+    chunk_shape = eval(args.chunk_shape)
+    eps = synthesize_permittivity(shape)
+    ri = eps2ri_eigh(eps)
+    num_voxels = np.prod(shape) // 9
+    cases = [
+        ("RI -> eps", ri, legacy_ri2eps, ri2eps),
+        ("eps -> RI (taylor)", eps, legacy_eps2ri_taylor, eps2ri_taylor),
+        ("eps -> RI (eigh)", eps, legacy_eps2ri_taylor, eps2ri_eigh),
+    ]
+    for name, src, legacy_fn, fn in cases:
+        legacy_time, legacy_result = time_conversion(legacy_convert_tensor, src, chunk_shape, legacy_fn, args.repeat)
+        new_time, new_result = time_conversion(convert_tensor, src, chunk_shape, fn, args.repeat)
+        max_diff = np.max(np.abs(legacy_result - new_result))
+        print(f"{name}")
+        print(f"  legacy      : {num_voxels / legacy_time:.3e} voxels/sec ({src.nbytes / legacy_time / 2**20:.1f} MiB/s)")
+        print(f"  chunk-local : {num_voxels / new_time:.3e} voxels/sec ({src.nbytes / new_time / 2**20:.1f} MiB/s)")
+        print(f"  speedup     : {legacy_time / new_time:.1f}x, max abs difference: {max_diff:.3e}")
+
+if __name__ == "__main__":
+    main()
@@ -7,44 +7,101 @@ from os import path
 sys.path.append(path.dirname(path.dirname(path.abspath(__file__))))
 from utils import *
 
+def ri2eps(x):
+    """
+    Square the 3x3 RI tensor of every voxel to get the permittivity tensor.
+
+    Parameters:
+    - x: block of shape (t, 9, z, y, x). The channel axis holds the row-major 3x3 tensor.
+    """
+    tensor = x.reshape(x.shape[:1] + (3, 3) + x.shape[2:])
+    y = np.einsum('tijzyx,tjkzyx->tikzyx', tensor, tensor, optimize=True)
+    return y.reshape(x.shape).astype(x.dtype, copy=False)
+
+def eps2ri_taylor(x):
+    """
+    Approximate the square root of the 3x3 permittivity tensor of every voxel.
+
+    sqrt(x) = sqrt(x_0) * sqrt(1 + dx) ~ sqrt(x_0) * (1 + dx/2 - dx^2/8),
+    where x_0 is the diagonal and dx the off-diagonal part of the tensor.
+
+    Parameters:
+    - x: block of shape (t, 9, z, y, x). The channel axis holds the row-major 3x3 tensor.
+    """
+    tensor = x.reshape(x.shape[:1] + (3, 3) + x.shape[2:])
+    diag = np.diagonal(tensor, axis1=1, axis2=2) # t, z, y, x, 3
+    x0_sqrt = np.sqrt(np.moveaxis(diag, -1, 1)) # t, 3, z, y, x
+    x_delta = tensor.copy()
+    for i in range(3):
+        x_delta[:, i, i] = 0
+    y = x_delta / 2
+    y -= np.einsum('tjkzyx,tkzyx,tkizyx->tjizyx', x_delta, 1 / x0_sqrt, x_delta, optimize=True) / 8
+    for i in range(3):
+        y[:, i, i] += x0_sqrt[:, i]
+    return y.reshape(x.shape).astype(x.dtype, copy=False)
+
+def eps2ri_eigh(x):
+    """
+    Exact square root of the symmetric 3x3 permittivity tensor of every voxel.
+
+    The root is computed by the batched eigendecomposition x = V diag(w) V^T,
+    so that sqrt(x) = V diag(sqrt(w)) V^T. Only the lower triangle is read.
+
+    Parameters:
+    - x: block of shape (t, 9, z, y, x). The channel axis holds the row-major 3x3 tensor.
+    """
+    tensor = x.reshape(x.shape[:1] + (3, 3) + x.shape[2:])
+    matrices = np.moveaxis(tensor, (1, 2), (-2, -1)) # t, z, y, x, 3, 3
+    w, v = np.linalg.eigh(matrices)
+    # negative eigenvalues only come from rounding noise of a positive definite tensor
+    np.clip(w, 0, None, out=w)
+    root = (v * np.sqrt(w)[..., np.newaxis, :]) @ np.swapaxes(v, -1, -2)
+    y = np.moveaxis(root, (-2, -1), (1, 2))
+    return y.reshape(x.shape).astype(x.dtype, copy=False)
+
 def apply_func(input_zarr_path, output_zarr_path, fn, compressor = configure_compression('zstd-19'), filters = []):
     """
-    Reads a Zarr file, adds random noise within the given range, and writes to a new Zarr file.
+    Reads a Zarr file, applies a per-voxel tensor transform, and writes to a new Zarr file.
+
+    The input is read with blocks spanning all 9 channels, so each block is transformed
+    in place without any rechunking: every stored chunk is read once and written once.
 
     Parameters:
     - input_zarr_path: Path to the input Zarr file.
     - output_zarr_path: Path to the output Zarr file.
-    - noise_range: Tuple (min_noise, max_noise) defining the range of random noise.
+    - fn: Block-wise transform on (t, 9, z, y, x) arrays, e.g. `ri2eps` or `eps2ri_taylor`.
     """
     # Open the input Zarr file
-    input_zarr = da.from_zarr(input_zarr_path, component='0')
-    chunksize = input_zarr.chunksize
+    input_array = zarr.open_group(input_zarr_path, mode='r')['0']
     # Create a new Zarr file to store the modified data
     output_group = zarr.open_group(output_zarr_path, mode='w')
     output_zarr = output_group.require_dataset(
         "0",
-        shape = input_zarr.shape,
-        chunks = chunksize,
-        dtype = input_zarr.dtype,
+        shape = input_array.shape,
+        chunks = input_array.chunks,
+        dtype = input_array.dtype,
         compressor = compressor,
         filters = filters,
         dimension_separator = '/'
     )
-    # reshape the input
-    reshaped_input_zarr = da.moveaxis(input_zarr, 1, -1) # t,c,z,y,x -> t,z,y,x,c
-    reshaped_input_zarr = reshaped_input_zarr.reshape(reshaped_input_zarr.shape[:-1] + (3,3))
-    reshaped_input_zarr = reshaped_input_zarr.rechunk(
-        reshaped_input_zarr.chunks[:-2] + ((3,),(3,))
-    )
-    reshaped_output_data = da.map_blocks(fn, reshaped_input_zarr, dtype = reshaped_input_zarr.dtype)
-    # reshape the output
-    reshaped_output_data = reshaped_output_data.reshape(reshaped_output_data.shape[:-2] + (9,))
-    reshaped_output_data = da.moveaxis(reshaped_output_data, -1, 1)
-    output_data = reshaped_output_data.rechunk(input_zarr.chunks)
-    # Store the noisy data in the output Zarr file
     print("Start conversion...")
     with ProgressBar():
-        output_data.store(output_zarr, lock = False)
+        convert_tensor(input_array, output_zarr, fn)
+
+def convert_tensor(input_array, output_array, fn):
+    """
+    Applies `fn` on blocks spanning all 9 channels of `input_array` and stores them in `output_array`.
+
+    Parameters:
+    - input_array: zarr array of shape (t, 9, z, y, x).
+    - output_array: zarr array with the same shape, chunked like `input_array`.
+    - fn: Block-wise transform on (t, 9, z, y, x) arrays.
+    """
+    chunksize = input_array.chunks
+    # one block holds every channel of a chunk column
+    input_data = da.from_zarr(input_array, chunks = chunksize[:1] + (input_array.shape[1],) + chunksize[2:])
+    output_data = da.map_blocks(fn, input_data, dtype = input_data.dtype)
+    output_data.store(output_array, lock = False)
 
 import argparse
 import os
@@ -75,6 +132,13 @@ def main():
             "Target compressor. Examples: 'gzip-5', 'blosc-zstd-3', or 'none' for no compression."
         ),
     )
+    parser.add_argument(
+        "--sqrt",
+        type=str,
+        choices=["taylor", "eigh"],
+        default="taylor",
+        help="Matrix square root used for permittivity -> RI (default: taylor).",
+    )
     parser.add_argument(
         "filters",
         type=str,
@@ -95,33 +159,13 @@ def main():
     # Ensure output directory exists
     os.makedirs(os.path.dirname(dst_zarr_path), exist_ok=True)
 
-    # Add noise to the Zarr file
+    # Convert the tensor of each voxel
     if args.isRI:
-        def fn(x):
-            x_arr = x.reshape((-1,3,3))
-            y_arr = np.empty_like(x_arr)
-            for i in range(x_arr.shape[0]):
-                y_arr[i] =  x_arr[i] @ x_arr[i]
-            y = y_arr.reshape(x.shape)
-            return y
+        fn = ri2eps
+    elif args.sqrt == "eigh":
+        fn = eps2ri_eigh
     else:
-        def fn(x):
-            x_arr = x.reshape((-1,3,3))
-            x0_sqrt_arr = np.zeros_like(x_arr, shape=(x_arr.shape[0],3))
-            x_delta_arr = x_arr.copy()
-            y_arr = np.zeros_like(x_arr)
-            for i in range(3):
-                x0_sqrt_arr[:,i] = np.sqrt(x_arr[:,i,i])
-                x_delta_arr[:,i,i] = 0
-            # taylor sum of sqrt(x) = sqrt(x_0) * sqrt(1 + dx) = sqrt(x_0) * (1 + dx/2 - dx^2/8)
-            for i in range(3):
-                y_arr[:,i,i] += x0_sqrt_arr[:,i]
-            y_arr += x_delta_arr/2
-            for i in range(3):
-                for j in range(3):
-                    y_arr[:,j,i] -= np.sum(x_delta_arr[:,j,:]/x0_sqrt_arr*x_delta_arr[:,:,i],axis=1)/8
-            y = y_arr.reshape(x.shape)
-            return y
+        fn = eps2ri_taylor
     apply_func(src_zarr_path, dst_zarr_path, fn, compressor = compressor, filters = filters)
 
 if __name__ == "__main__":
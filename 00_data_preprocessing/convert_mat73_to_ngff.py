@@ -7,7 +7,7 @@ import ome_zarr.format
 # Warning: This function is too specific to my case,
 # So it is not recommended to use it directly.
 
-def convert_mat2ngff(src_mat_path, dst_ngff_path, compressor, filters):
+def convert_mat2ngff(src_mat_path, dst_ngff_path, compressor, filters, chunk_shape=(1, 1, 32, 256, 256), chunks_per_shard=None):
     with h5py.File(src_mat_path, 'r') as mat:
         raw_data = da.from_array(mat['e']) # z, y, x, c (3 x 3)
         transposed_data = raw_data.transpose(3, 4, 0, 1, 2) # c (3 x 3), z, y, x
@@ -15,18 +15,21 @@ def convert_mat2ngff(src_mat_path, dst_ngff_path, compressor, filters):
         metadata = mat['para']
         resolution = (1, 1, metadata['imres'][2].item(), metadata['imres'][1].item(), metadata['imres'][0].item())
         # save the result
-        data_group = zarr.open_group(dst_ngff_path, mode='w')
+        store = open_store(dst_ngff_path, chunks_per_shard)
+        data_group = zarr.open_group(store, mode='w')
         zarray_data = data_group.require_dataset(
             "0",
             shape=data.shape,
             exact=True,
-            chunks=(1, 1, 32, 256, 256),
+            chunks=chunk_shape,
             dtype=data.dtype,
             compressor=compressor,
             filters=filters,
             dimension_separator='/'
         )
         da.to_zarr(data, zarray_data, lock=False, compute=True)
+        if chunks_per_shard is not None:
+            store.close()
         assert da.all(da.equal(zarray_data, data)).compute(), "The save array and original array should be the same"
     ome_zarr.writer.write_multiscales_metadata(
         group=data_group,
@@ -86,6 +89,7 @@ import sys
 from os import path
 sys.path.append(path.dirname(path.dirname(path.abspath(__file__))))
 from utils import *
+from utils.shard_store import open_store
 # command-line handler
 def main():
     import argparse
@@ -104,13 +108,31 @@ def main():
             "Target compressor. Examples: 'gzip-5', 'blosc-zstd-3', or 'none' for no compression."
         ),
     )
+    parser.add_argument(
+        "--chunk_shape",
+        type=str,
+        default="(1,1,32,256,256)",
+        help=(
+            "Chunk shape. Use '(1,9,32,256,256)' to keep the tensor channels in one chunk for 'ChannelSymmetry'."
+        ),
+    )
     parser.add_argument(
         "filters",
         type=str,
         nargs="*",
         help=(
             "List of filters to apply before compression. Options: 'FixedScaleOffset', "
-            "'Delta', 'SpatialDelta'."
+            "'Delta', 'SpatialDelta', 'ChannelSymmetry'."
+        ),
+    )
+    parser.add_argument(
+        "--shard",
+        type=str,
+        default=None,
+        help=(
+            "Chunks per shard, e.g. '(1,1,2,4,4)', to pack each block of chunks into one file. "
+            "The sharded arrays have no '.zarray' file, so plain zarr, ome-zarr and napari readers cannot "
+            "open them: read the output through utils.shard_store.ShardedStore only. (Default: no sharding)"
         ),
     )
     args = parser.parse_args()
@@ -122,7 +144,8 @@ def main():
     if not os.path.exists(src_mat):
         raise FileNotFoundError(f"Source file '{src_mat}' not found.")
     os.makedirs(dst_dir, exist_ok=True)
-    convert_mat2ngff(src_mat, dst_dir, compressor, filters)
+    chunks_per_shard = None if args.shard is None else eval(args.shard)
+    convert_mat2ngff(src_mat, dst_dir, compressor, filters, chunk_shape=eval(args.chunk_shape), chunks_per_shard=chunks_per_shard)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
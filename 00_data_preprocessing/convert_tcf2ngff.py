@@ -13,17 +13,19 @@ import sys
 from os import path
 sys.path.append(path.dirname(path.dirname(path.abspath(__file__))))
 from utils import *
+from utils.shard_store import open_store
 import os
 from TCFile import TCFile
 import numpy as np
 
-def tcf_to_omezarr(tcf_file_path, output_path, compressor, filters, noise_range = None):
+def tcf_to_omezarr(tcf_file_path, output_path, compressor, filters, noise_range = None, chunks_per_shard = None):
     """
     Convert TCF to ome-zarr
 
     Parameters:
     - tcf_file_path: path to the input HDF5 file.
     - output_path: path where the output HDF5 file will be created.
+    - chunks_per_shard: if given, the chunks are packed into shards of this many chunks (see `utils.shard_store`).
     Note: This function does not return anything.
     """
     axes = [
@@ -47,7 +49,8 @@ def tcf_to_omezarr(tcf_file_path, output_path, compressor, filters, noise_range
             noise = da.random.uniform(noise_range[0], noise_range[1], tcf_array.shape, chunks=tcf_array.chunks)
             tcf_array += noise
         # create zarr
-        data_group = zarr.open_group(os.path.join(output_path,data_name+".ome.zarr"),mode='w')
+        store = open_store(os.path.join(output_path,data_name+".ome.zarr"), chunks_per_shard)
+        data_group = zarr.open_group(store,mode='w')
         zarray_data = data_group.require_dataset(
             "0",
             shape = tcf_array.shape,
@@ -59,6 +62,8 @@ def tcf_to_omezarr(tcf_file_path, output_path, compressor, filters, noise_range
             dimension_separator = '/'
         )
         tcf_array.store(zarray_data, lock = False, compute = True)
+        if chunks_per_shard is not None:
+            store.close()
         ome_zarr.writer.write_multiscales_metadata(
             group = data_group,
             datasets = [{
@@ -117,6 +122,16 @@ def main():
             "'Delta', 'SpatialDelta'."
         ),
     )
+    parser.add_argument(
+        "--shard",
+        type=str,
+        default=None,
+        help=(
+            "Chunks per shard, e.g. '(1,1,2,4,4)', to pack each block of chunks into one file. "
+            "The sharded arrays have no '.zarray' file, so plain zarr, ome-zarr and napari readers cannot "
+            "open them: read the output through utils.shard_store.ShardedStore only. (Default: no sharding)"
+        ),
+    )
     args = parser.parse_args()
     # validate arguments
     src_tcf = os.path.abspath(args.src)
@@ -130,7 +145,8 @@ def main():
     else:
         noise_range=(args.min_noise, args.max_noise)
     os.makedirs(dst_dir, exist_ok=True)
-    tcf_to_omezarr(src_tcf, dst_dir, compressor, filters, noise_range = noise_range)
+    chunks_per_shard = None if args.shard is None else eval(args.shard)
+    tcf_to_omezarr(src_tcf, dst_dir, compressor, filters, noise_range = noise_range, chunks_per_shard = chunks_per_shard)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
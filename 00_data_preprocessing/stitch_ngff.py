@@ -18,7 +18,7 @@ def fuse_spatial_images(spatial_images):
     )
     return fused_sim
 
-def fuse_ngff_files(src_ngff_pathes, dst_ngff_path, compressor, filters):
+def fuse_ngff_files(src_ngff_pathes, dst_ngff_path, compressor, filters, chunks_per_shard = None):
     # load all ngff data
     sims = []
     for path in src_ngff_pathes:
@@ -63,7 +63,8 @@ def fuse_ngff_files(src_ngff_pathes, dst_ngff_path, compressor, filters):
     fused_sim = fuse_spatial_images(sims)
     fused_arr_data = fused_sim.data
     # save the result
-    data_group = zarr.open_group(dst_ngff_path, mode='w')
+    store = open_store(dst_ngff_path, chunks_per_shard)
+    data_group = zarr.open_group(store, mode='w')
     zarray_data = data_group.require_dataset(
         "0",
         shape = fused_arr_data.shape,
@@ -77,6 +78,8 @@ def fuse_ngff_files(src_ngff_pathes, dst_ngff_path, compressor, filters):
     print("save the fused data...")
     with ProgressBar():
        da.to_zarr(fused_arr_data, zarray_data, lock=False, compute=True)
+    if chunks_per_shard is not None:
+        store.close()
     ome_zarr.writer.write_multiscales_metadata(
         group = data_group,
         datasets = [{
@@ -109,6 +112,7 @@ import sys
 from os import path
 sys.path.append(path.dirname(path.dirname(path.abspath(__file__))))
 from utils import *
+from utils.shard_store import open_store
 def main():    
     parser = argparse.ArgumentParser(
         prog='simple OME-Zarr stitcher',
@@ -134,6 +138,16 @@ def main():
             "'Delta', 'SpatialDelta'."
         ),
     )
+    parser.add_argument(
+        "--shard",
+        type=str,
+        default=None,
+        help=(
+            "Chunks per shard, e.g. '(1,1,2,4,4)', to pack each block of chunks into one file. "
+            "The sharded arrays have no '.zarray' file, so plain zarr, ome-zarr and napari readers cannot "
+            "open them: read the output through utils.shard_store.ShardedStore only. (Default: no sharding)"
+        ),
+    )
     args = parser.parse_args()
     # validate arguments
     src_ngff_pathes = glob(os.path.abspath(args.src))
@@ -143,7 +157,8 @@ def main():
     if len(src_ngff_pathes) == 0:
         raise ValueError("No NGFF files found in the source directory.")
     os.makedirs(dst_ngff_path, exist_ok=True)
-    fuse_ngff_files(src_ngff_pathes, dst_ngff_path, compressor, filters)
+    chunks_per_shard = None if args.shard is None else eval(args.shard)
+    fuse_ngff_files(src_ngff_pathes, dst_ngff_path, compressor, filters, chunks_per_shard = chunks_per_shard)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
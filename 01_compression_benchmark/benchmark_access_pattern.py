@@ -0,0 +1,230 @@
+"""
+usage: benchmark_access_pattern.py [-h] [--chunk-shape CHUNK_SHAPE] [--requests REQUESTS] [--roi-shape ROI_SHAPE]
+                                   [--seed SEED] [--cold-read] [--keep] [--db DB] [--dataset DATASET] bench_recipe src dst
+
+Replay viewer-style partial reads on full OME-Zarr outputs of every condition of a recipe.
+
+Each condition (compressor, filters, chunk shape) is written as a full OME-Zarr image, then the same seeded traces are read back:
+  z-scroll     consecutive XY planes, as when scrolling through z.
+  orthogonal   XY, XZ and YZ planes at random positions.
+  roi          random crops of '--roi-shape'.
+
+positional arguments:
+  bench_recipe  Path to the benchmark recipe. Its optional [[chunks]] tables list the chunk shapes.
+  src           Path to the source OME-Zarr dataset.
+  dst           Directory to save the OME-Zarr outputs and the benchmark results.
+
+optional arguments:
+  -h, --help     show this help message and exit
+  --chunk-shape  Chunk shape when the recipe has no [[chunks]] tables. (Default: (1,1,32,256,256))
+  --requests     Number of requests per trace. (Default: 64)
+  --roi-shape    (z, y, x) shape of the ROI crops. (Default: (32,128,128))
+  --seed         Seed of the traces. (Default: 0)
+  --cold-read    Evict the output files from the page cache before replaying each trace.
+  --keep         Keep the OME-Zarr outputs instead of deleting them after their traces.
+  --db           Results database (sqlite) the table is appended to.
+  --dataset      Dataset name of the run in the database. (Default: name of src)
+"""
+
+import argparse
+import os
+import shutil
+from glob import glob
+from timeit import default_timer
+import numpy as np
+import pandas as pd
+import zarr
+import dask.array as da
+from tqdm import tqdm
+from ome_zarr.io import parse_url
+from ome_zarr.reader import Reader
+from ome_zarr.writer import write_multiscales_metadata
+from ome_zarr.format import FormatV04
+import sys
+from os import path
+sys.path.append(path.dirname(path.dirname(path.abspath(__file__))))
+from utils import *
+from benchmark_engine import read_benchmark_recipe, read_benchmark_chunk_shapes, list_store_files, evict_page_cache
+from results_db import append_run
+
+TRACE_KINDS = ("z-scroll", "orthogonal", "roi")
+
+def generate_trace(kind, shape, num_requests, roi_shape, rng):
+    """
+    Return a list of requests, each a tuple of slices over an array of `shape` whose last three axes are (z, y, x).
+
+    The leading axes (e.g. time and channel) are drawn at random for every request except in 'z-scroll',
+    which stays on one volume and moves one plane at a time.
+    """
+    leading_shape, (size_z, size_y, size_x) = shape[:-3], shape[-3:]
+    def leading_index():
+        return tuple(slice(i, i + 1) for i in (int(rng.integers(n)) for n in leading_shape))
+    trace = []
+    if kind == "z-scroll":
+        leading = leading_index()
+        start_z = int(rng.integers(size_z))
+        for i in range(num_requests):
+            z = (start_z + i) % size_z
+            trace.append(leading + (slice(z, z + 1), slice(0, size_y), slice(0, size_x)))
+    elif kind == "orthogonal":
+        for i in range(num_requests):
+            z, y, x = (int(rng.integers(n)) for n in (size_z, size_y, size_x))
+            planes = (
+                (slice(z, z + 1), slice(0, size_y), slice(0, size_x)), # XY
+                (slice(0, size_z), slice(y, y + 1), slice(0, size_x)), # XZ
+                (slice(0, size_z), slice(0, size_y), slice(x, x + 1)), # YZ
+            )
+            trace.append(leading_index() + planes[i % 3])
+    elif kind == "roi":
+        roi_shape = [min(roi_size, size) for roi_size, size in zip(roi_shape, (size_z, size_y, size_x))]
+        for _ in range(num_requests):
+            corner = [int(rng.integers(size - roi_size + 1)) for roi_size, size in zip(roi_shape, (size_z, size_y, size_x))]
+            trace.append(leading_index() + tuple(slice(start, start + roi_size) for start, roi_size in zip(corner, roi_shape)))
+    else:
+        raise ValueError(f"Unknown trace: {kind}")
+    return trace
+
+def touched_chunks(request, chunks):
+    """Return the grid coordinates of the chunks overlapping `request`."""
+    ranges = [range(s.start // c, (s.stop - 1) // c + 1) for s, c in zip(request, chunks)]
+    return np.stack(np.meshgrid(*ranges, indexing = "ij"), axis = -1).reshape(-1, len(chunks))
+
+def replay_trace(z, store, trace):
+    """
+    Read every request of `trace` from the zarr array `z` and return one dict per request.
+
+    The decoded bytes count whole chunks, and the fetched bytes are the stored sizes of those chunks.
+    """
+    chunk_nbytes = int(np.prod(z.chunks)) * z.dtype.itemsize
+    results = []
+    for request in trace:
+        chunk_coords = touched_chunks(request, z.chunks)
+        fetched_bytes = sum(store.getsize(z._chunk_key(tuple(coords))) for coords in chunk_coords)
+        start_time = default_timer()
+        z[request]
+        end_time = default_timer()
+        results.append({
+            "latency" : end_time - start_time,
+            "requested bytes" : int(np.prod([s.stop - s.start for s in request])) * z.dtype.itemsize,
+            "decoded bytes" : len(chunk_coords) * chunk_nbytes,
+            "fetched bytes" : fetched_bytes})
+    return results
+
+def summarize_trace(results):
+    latency = np.array([result["latency"] for result in results])
+    requested_bytes = sum(result["requested bytes"] for result in results)
+    decoded_bytes = sum(result["decoded bytes"] for result in results)
+    fetched_bytes = sum(result["fetched bytes"] for result in results)
+    return {
+        "latency p50 (sec)" : np.percentile(latency, 50),
+        "latency p90 (sec)" : np.percentile(latency, 90),
+        "latency p99 (sec)" : np.percentile(latency, 99),
+        "latency max (sec)" : latency.max(),
+        "decoded bytes per request" : decoded_bytes / len(results),
+        "fetched bytes per request" : fetched_bytes / len(results),
+        "read amplification" : decoded_bytes / requested_bytes}
+
+def write_condition(src_data, metadata, dst_path, chunk_shape, compressor, filters):
+    """
+    Write `src_data` as a single-scale OME-Zarr image and return the elapsed time.
+
+    The array is created with zarr directly, as in the converters, because `write_image` drops the
+    compressor and filters from `storage_options` for dask arrays.
+    """
+    root = zarr.open_group(dst_path, mode = "w")
+    start_time = default_timer()
+    z = root.create_dataset(
+        "0",
+        shape = src_data.shape,
+        chunks = chunk_shape,
+        dtype = src_data.dtype,
+        compressor = compressor,
+        filters = filters,
+        dimension_separator = '/'
+    )
+    da.store(src_data.rechunk(chunk_shape), z, lock = False, compute = True)
+    elapsed_time = default_timer() - start_time
+    write_multiscales_metadata(
+        group = root,
+        datasets = [{
+            "path" : "0",
+            "coordinateTransformations" : metadata['coordinateTransformations'][0]
+        }],
+        fmt = FormatV04(),
+        axes = metadata['axes'],
+        name = 'Refractive index',
+    )
+    return elapsed_time
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Replay viewer-style partial reads on full OME-Zarr outputs of every condition of a recipe."
+    )
+    parser.add_argument("bench_recipe", type=str, help="Path to the benchmark recipe.")
+    parser.add_argument("src", type=str, help="Path to the source OME-Zarr dataset.")
+    parser.add_argument("dst", type=str, help="Directory to save the OME-Zarr outputs and the benchmark results.")
+    parser.add_argument("--chunk-shape", type=str, default="(1,1,32,256,256)", help="Chunk shape when the recipe has no [[chunks]] tables. (Default: (1,1,32,256,256))")
+    parser.add_argument("--requests", type=int, default=64, help="Number of requests per trace. (Default: 64)")
+    parser.add_argument("--roi-shape", type=str, default="(32,128,128)", help="(z, y, x) shape of the ROI crops. (Default: (32,128,128))")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the traces. (Default: 0)")
+    parser.add_argument("--cold-read", action='store_true', help="Evict the output files from the page cache before replaying each trace.")
+    parser.add_argument("--keep", action='store_true', help="Keep the OME-Zarr outputs instead of deleting them after their traces.")
+    parser.add_argument("--db", type=str, default=None, help="Results database (sqlite) the table is appended to. (Default: None)")
+    parser.add_argument("--dataset", type=str, default=None, help="Dataset name of the run in the database. (Default: name of src)")
+    args = parser.parse_args()
+    compression_recipes, filters_recipes = read_benchmark_recipe(args.bench_recipe)
+    chunk_shapes = read_benchmark_chunk_shapes(args.bench_recipe) or [eval(args.chunk_shape)]
+    roi_shape = eval(args.roi_shape)
+    # Validate source path
+    src_path = args.src
+    if not os.path.exists(src_path):
+        raise FileNotFoundError(f"Error: Source path '{src_path}' does not exist.")
+    dst_path = args.dst
+    os.makedirs(dst_path, exist_ok=True)
+    # read Zarr data
+    reader = Reader(parse_url(src_path, mode = "r"))
+    node = list(reader())[0]
+    src_data = node.data[0]
+    # the same traces are replayed for every condition
+    rng = np.random.default_rng(args.seed)
+    traces = {kind : generate_trace(kind, src_data.shape, args.requests, roi_shape, rng) for kind in TRACE_KINDS}
+    conditions = [("none", [])] + [
+        (compression_name, filter_name_list)
+        for compression_name in compression_recipes
+        for filter_name_list in filters_recipes]
+    rows = []
+    for chunk_shape in chunk_shapes:
+        chunk_shape = tuple(chunk_shape[-src_data.ndim:])
+        for compression_name, filter_name_list in tqdm(conditions, desc = str(chunk_shape)):
+            filter_name = "-".join(filter_name_list) if filter_name_list else "none"
+            compressor = configure_compression(compression_name)
+            filters = configure_filters(filter_name_list)
+            output_path = os.path.join(dst_path, f"{compression_name}_{filter_name}_{'x'.join(map(str, chunk_shape))}.ome.zarr")
+            write_time = write_condition(src_data, node.metadata, output_path, chunk_shape, compressor, filters)
+            store = zarr.DirectoryStore(output_path)
+            z = zarr.open_array(store, path = "0", mode = "r")
+            # nbytes_stored does not descend into the nested chunk directories
+            stored_size = sum(os.path.getsize(fname) for fname in list_store_files(os.path.join(output_path, "0")))
+            for kind, trace in traces.items():
+                if args.cold_read:
+                    evict_page_cache(list_store_files(output_path))
+                rows.append({
+                    "compression option" : compression_name,
+                    "filter option" : filter_name,
+                    "chunk shape" : str(chunk_shape),
+                    "trace" : kind,
+                    "compression ratio" : z.nbytes / stored_size,
+                    "write time (sec)" : write_time,
+                    **summarize_trace(replay_trace(z, store, trace))})
+            if not args.keep:
+                shutil.rmtree(output_path)
+    df = pd.DataFrame(rows)
+    csv_id = len(glob(os.path.join(dst_path, "access_benchmark*"))) + 1
+    df.to_csv(os.path.join(dst_path, f"access_benchmark_{csv_id}.csv"), index=False)
+    if args.db is not None:
+        append_run(
+            args.db, df, "access-pattern", os.path.basename(os.path.normpath(src_path)) if args.dataset is None else args.dataset,
+            recipe = os.path.basename(args.bench_recipe), sample = os.path.abspath(src_path), arguments = vars(args))
+
+if __name__ == "__main__":
+    main()
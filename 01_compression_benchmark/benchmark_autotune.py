@@ -0,0 +1,136 @@
+"""
+usage: benchmark_autotune.py [-h] [--initial-chunks N] [--max-chunks N] [--eta ETA] [--repeat REPEAT] [--seed SEED]
+                             [--blosc-shuffles] [--min-compression-speed BYTES] [--min-decompression-speed BYTES]
+                             [--db DB] [--dataset DATASET] bench_recipe src dst
+
+Search the conditions of a recipe for the compression ratio/throughput Pareto front with successive halving.
+
+Every condition is measured on a few random chunks, the ones far from the Pareto front are dropped,
+and the survivors are measured again on more chunks. The codecs are timed directly, bypassing zarr
+and dask, as in `benchmark_codec_only.py`.
+
+positional arguments:
+  bench_recipe  Path to the benchmark recipe.
+  src           Path to the target npy file.
+  dst           Directory to save the the benchmark results.
+
+optional arguments:
+  -h, --help                 show this help message and exit
+  --initial-chunks           Number of random chunks of the first round. (Default: 4)
+  --max-chunks               Number of chunks of the last round. (Default: all chunks)
+  --eta                      Growth of the chunks and reduction of the conditions between rounds. (Default: 3)
+  --repeat                   Number of timed passes over the chunks; the fastest one is reported. (Default: 1)
+  --seed                     Seed of the chunk selection. (Default: 0)
+  --blosc-shuffles           Try every blosc compressor with no, byte and bit shuffle.
+  --min-compression-speed    Compression speed floor of the recommendation in bytes/sec. (Default: 0)
+  --min-decompression-speed  Decompression speed floor of the recommendation in bytes/sec. (Default: 0)
+  --db                       Results database (sqlite) the table is appended to.
+  --dataset                  Dataset name of the run in the database. (Default: name of src)
+"""
+
+import argparse
+import pandas as pd
+from tqdm import tqdm
+import sys
+from os import path
+sys.path.append(path.dirname(path.dirname(path.abspath(__file__))))
+from benchmark_engine import read_benchmark_recipe, successive_halving, load_sample
+from results_db import append_run
+import os
+from glob import glob
+
+BLOSC_SHUFFLES = (0, 1, 2) # no shuffle, byte shuffle, bit shuffle
+
+def expand_blosc_shuffles(compression_recipes):
+    """Replace every 'blosc-<cname>-<level>' spec by its three shuffle variants."""
+    expanded = []
+    for compression_name in compression_recipes:
+        if compression_name.startswith("blosc-") and compression_name.count("-") == 2:
+            expanded.extend(f"{compression_name}-{shuffle}" for shuffle in BLOSC_SHUFFLES)
+        else:
+            expanded.append(compression_name)
+    return expanded
+
+def recommend(pareto_df, min_compression_speed, min_decompression_speed):
+    """Return the row of the Pareto set with the best ratio among those above the speed floors, or None."""
+    eligible = pareto_df[
+        (pareto_df["compression speed (bytes/sec)"] >= min_compression_speed) &
+        (pareto_df["decompression speed (bytes/sec)"] >= min_decompression_speed)]
+    if eligible.empty:
+        return None
+    return eligible.loc[eligible["compression ratio"].idxmax()]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Search the conditions of a recipe for the compression ratio/throughput Pareto front with successive halving."
+    )
+    parser.add_argument("bench_recipe", type=str, help="Path to the benchmark recipe")
+    parser.add_argument("src", type=str, help="Path to the source npy-dask dataset.")
+    parser.add_argument("dst", type=str, help="Path to the save benchmark result.")
+    parser.add_argument("--initial-chunks", type=int, default=4, help="Number of random chunks of the first round. (Default: 4)")
+    parser.add_argument("--max-chunks", type=int, default=None, help="Number of chunks of the last round. (Default: all chunks)")
+    parser.add_argument("--eta", type=int, default=3, help="Growth of the chunks and reduction of the conditions between rounds. (Default: 3)")
+    parser.add_argument("--repeat", type=int, default=1, help="Number of timed passes over the chunks. (Default: 1)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the chunk selection. (Default: 0)")
+    parser.add_argument("--blosc-shuffles", action='store_true', help="Try every blosc compressor with no, byte and bit shuffle.")
+    parser.add_argument("--min-compression-speed", type=float, default=0, help="Compression speed floor of the recommendation in bytes/sec. (Default: 0)")
+    parser.add_argument("--min-decompression-speed", type=float, default=0, help="Decompression speed floor of the recommendation in bytes/sec. (Default: 0)")
+    parser.add_argument("--db", type=str, default=None, help="Results database (sqlite) the table is appended to. (Default: None)")
+    parser.add_argument("--dataset", type=str, default=None, help="Dataset name of the run in the database. (Default: name of src)")
+    args = parser.parse_args()
+    if args.eta < 2:
+        raise ValueError("--eta must be at least 2.")
+    compression_recipes, filters_recipes = read_benchmark_recipe(args.bench_recipe)
+    if args.blosc_shuffles:
+        compression_recipes = expand_blosc_shuffles(compression_recipes)
+    dst_path = args.dst
+    os.makedirs(dst_path, exist_ok=True)
+    # Validate source path
+    src_path = args.src
+    if not os.path.exists(src_path):
+        raise FileNotFoundError(f"Error: Source path '{src_path}' does not exist.")
+    # the chunks are loaded on demand
+    src_sampled_array = load_sample(src_path)
+    # Prepare required parameters
+    conditions = [("none", [])]
+    for compression_name in compression_recipes:
+        for filter_name_list in filters_recipes:
+            conditions.append((compression_name, filter_name_list))
+    # Search
+    with tqdm(unit = " measurements") as pbar:
+        rows = successive_halving(
+            src_sampled_array, conditions, initial_chunks = args.initial_chunks, max_chunks = args.max_chunks,
+            eta = args.eta, repeat = args.repeat, seed = args.seed, progress = pbar.update)
+    if not rows:
+        raise RuntimeError("No condition could be measured.")
+    df = pd.DataFrame(rows)
+    df.insert(0, "compression option", [conditions[idx][0] for idx in df["condition"]])
+    df.insert(1, "filter option", ["-".join(conditions[idx][1]) if conditions[idx][1] else "none" for idx in df["condition"]])
+    df = df.drop(columns = "condition")
+    csv_id = len(glob(os.path.join(dst_path,"autotune_*.csv"))) + 1
+    df.to_csv(os.path.join(dst_path,f"autotune_{csv_id}.csv"),index=False)
+    if args.db is not None:
+        append_run(
+            args.db, df, "autotune", os.path.basename(os.path.normpath(src_path)) if args.dataset is None else args.dataset,
+            recipe = os.path.basename(args.bench_recipe), sample = os.path.abspath(src_path), arguments = vars(args))
+    # Report
+    last_round = df[df["round"] == df["round"].max()]
+    pareto_df = last_round[last_round["survived"]].sort_values("compression ratio", ascending = False)
+    pareto_columns = ["compression option", "filter option", "compression ratio", "compression speed (bytes/sec)", "decompression speed (bytes/sec)"]
+    report = [
+        f"{len(conditions)} conditions, {len(df)} measurements in {df['round'].max() + 1} rounds "
+        f"(last round on {last_round['chunks'].iloc[0]} chunks).",
+        "Pareto-optimal conditions:",
+        pareto_df[pareto_columns].to_string(index = False)]
+    best = recommend(pareto_df, args.min_compression_speed, args.min_decompression_speed)
+    if best is None:
+        report.append("No Pareto-optimal condition meets the throughput floors.")
+    else:
+        report.append(
+            f"Recommended: compressor '{best['compression option']}', filters '{best['filter option']}' "
+            f"(ratio {best['compression ratio']:.3f}, "
+            f"compression {best['compression speed (bytes/sec)'] / 1e6:.1f} MB/s, "
+            f"decompression {best['decompression speed (bytes/sec)'] / 1e6:.1f} MB/s)")
+    print("\n".join(report))
+    with open(os.path.join(dst_path,f"autotune_{csv_id}.txt"), 'w') as f:
+        f.write("\n".join(report) + "\n")
@@ -0,0 +1,95 @@
+"""
+usage: benchmark_codec_only.py [-h] [--repeat REPEAT] [--db DB] [--dataset DATASET] bench_recipe src dst
+
+Benchmark the raw throughput of the codecs of a recipe, bypassing zarr and dask.
+
+Every chunk of the sample is pushed through the filters and the compressor directly,
+with decoding buffers reused between iterations. The same conditions are also measured
+through the zarr path (single-threaded, like the codec path), with as many passes, and the
+difference of the fastest passes of the two is reported as the framework overhead.
+
+positional arguments:
+  bench_recipe  Path to the benchmark recipe.
+  src           Path to the target npy file.
+  dst           Directory to save the the benchmark results.
+
+optional arguments:
+  -h, --help    show this help message and exit
+  --repeat      Number of timed passes of each path; the fastest one is reported. (Default: 3)
+  --db          Results database (sqlite) the table is appended to.
+  --dataset     Dataset name of the run in the database. (Default: name of src)
+"""
+
+import argparse
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+import sys
+from os import path
+sys.path.append(path.dirname(path.dirname(path.abspath(__file__))))
+from utils import *
+import dask.array as da
+from benchmark_engine import read_benchmark_recipe, benchmark_condition, benchmark_codec_pipeline, split_chunks, load_sample
+from results_db import append_run
+import os
+from glob import glob
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the raw throughput of the codecs of a recipe, bypassing zarr and dask."
+    )
+    parser.add_argument("bench_recipe", type=str, help="Path to the benchmark recipe")
+    parser.add_argument("src", type=str, help="Path to the source npy-dask dataset.")
+    parser.add_argument("dst", type=str, help="Path to the save benchmark result.")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of timed passes of each path; the fastest one is reported. (Default: 3)")
+    parser.add_argument("--db", type=str, default=None, help="Results database (sqlite) the table is appended to. (Default: None)")
+    parser.add_argument("--dataset", type=str, default=None, help="Dataset name of the run in the database. (Default: name of src)")
+    args = parser.parse_args()
+    compression_recipes, filters_recipes = read_benchmark_recipe(args.bench_recipe)
+    dst_path = args.dst
+    os.makedirs(dst_path, exist_ok=True)
+    # Validate source path
+    src_path = args.src
+    if not os.path.exists(src_path):
+        raise FileNotFoundError(f"Error: Source path '{src_path}' does not exist.")
+    # load the chunks once
+    src_sampled_array_tmp = load_sample(src_path)
+    chunksize = src_sampled_array_tmp.chunksize
+    src_arr = src_sampled_array_tmp.compute()
+    src_sampled_array = da.from_array(src_arr, chunks=chunksize)
+    chunks = split_chunks(src_arr, chunksize)
+    # Prepare required parameters
+    conditions = [("none", [])]
+    for compression_name in compression_recipes:
+        for filter_name_list in filters_recipes:
+            conditions.append((compression_name, filter_name_list))
+    # Benchmark
+    rows = []
+    for compression_name, filter_name_list in tqdm(conditions, unit = f" / {len(conditions)}"):
+        compressor = configure_compression(compression_name)
+        filters = configure_filters(filter_name_list)
+        src_size, compressed_size, encoding_time, decoding_time = benchmark_codec_pipeline(chunks, compressor, filters, repeat = args.repeat)
+        # the zarr path gets the same number of passes as the codec path, and its fastest one as well
+        zarr_rows = [benchmark_condition(src_sampled_array, compressor, filters, scheduler = "synchronous") for _ in range(args.repeat)]
+        zarr_compression_speed = max(zarr_row["compression speed (bytes/sec)"] for zarr_row in zarr_rows)
+        zarr_decompression_speed = max(zarr_row["decompression speed (bytes/sec)"] for zarr_row in zarr_rows)
+        zarr_encoding_time = src_size / zarr_compression_speed
+        zarr_decoding_time = src_size / zarr_decompression_speed
+        rows.append({
+            "compression option" : compression_name,
+            "filter option" : "-".join(filter_name_list) if filter_name_list else "none",
+            "compression ratio" : src_size / compressed_size,
+            "codec compression speed (bytes/sec)" : np.nan if encoding_time == 0 else src_size / encoding_time,
+            "codec decompression speed (bytes/sec)" : np.nan if decoding_time == 0 else src_size / decoding_time,
+            "zarr compression speed (bytes/sec)" : zarr_compression_speed,
+            "zarr decompression speed (bytes/sec)" : zarr_decompression_speed,
+            "compression framework overhead (sec)" : zarr_encoding_time - encoding_time,
+            "decompression framework overhead (sec)" : zarr_decoding_time - decoding_time,
+        })
+    df = pd.DataFrame(rows)
+    csv_id = len(glob(os.path.join(dst_path,"codec_benchmark*"))) + 1
+    df.to_csv(os.path.join(dst_path,f"codec_benchmark_{csv_id}.csv"),index=False)
+    if args.db is not None:
+        append_run(
+            args.db, df, "codec-only", os.path.basename(os.path.normpath(src_path)) if args.dataset is None else args.dataset,
+            recipe = os.path.basename(args.bench_recipe), sample = os.path.abspath(src_path), arguments = vars(args))
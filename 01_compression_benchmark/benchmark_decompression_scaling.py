@@ -0,0 +1,100 @@
+"""
+usage: benchmark_decompression_scaling.py [-h] [--max-workers MAX_WORKERS] [--no-processes] [--db DB] [--dataset DATASET] bench_recipe src dst
+
+Benchmark how the decompression of the chunks scales with the number of workers.
+
+For each condition of the recipe, the chunks of the sample are encoded once and decoded
+by thread pools of 1, 2, 4, ... workers up to the number of cores, and by process pools
+of the same sizes. Codecs which release the GIL scale with threads; the others only
+scale with processes.
+
+positional arguments:
+  bench_recipe  Path to the benchmark recipe.
+  src           Path to the target npy file.
+  dst           Directory to save the the benchmark results.
+
+optional arguments:
+  -h, --help      show this help message and exit
+  --max-workers   Largest pool size. (Default: number of CPUs available)
+  --no-processes  Skip the process pools.
+  --db            Results database (sqlite) the table is appended to.
+  --dataset       Dataset name of the run in the database. (Default: name of src)
+"""
+
+import argparse
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+import sys
+from os import path
+sys.path.append(path.dirname(path.dirname(path.abspath(__file__))))
+from utils import *
+import dask.array as da
+from benchmark_engine import read_benchmark_recipe, encode_chunk, split_chunks, split_cpu_sets, worker_count_sweep, measure_decompression_scaling, load_sample
+from results_db import append_run
+import os
+from glob import glob
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark how the decompression of the chunks scales with the number of workers."
+    )
+    parser.add_argument("bench_recipe", type=str, help="Path to the benchmark recipe")
+    parser.add_argument("src", type=str, help="Path to the source npy-dask dataset.")
+    parser.add_argument("dst", type=str, help="Path to the save benchmark result.")
+    parser.add_argument("--max-workers", type=int, default=None, help="Largest pool size. (Default: number of CPUs available)")
+    parser.add_argument("--no-processes", action='store_true', help="Skip the process pools.")
+    parser.add_argument("--db", type=str, default=None, help="Results database (sqlite) the table is appended to. (Default: None)")
+    parser.add_argument("--dataset", type=str, default=None, help="Dataset name of the run in the database. (Default: name of src)")
+    args = parser.parse_args()
+    compression_recipes, filters_recipes = read_benchmark_recipe(args.bench_recipe)
+    dst_path = args.dst
+    os.makedirs(dst_path, exist_ok=True)
+    # Validate source path
+    src_path = args.src
+    if not os.path.exists(src_path):
+        raise FileNotFoundError(f"Error: Source path '{src_path}' does not exist.")
+    max_workers = args.max_workers if args.max_workers else len(split_cpu_sets(1)[0])
+    worker_counts = worker_count_sweep(max_workers)
+    executor_kinds = ["thread"] if args.no_processes else ["thread", "process"]
+    # load the chunks once
+    src_sampled_array_tmp = load_sample(src_path)
+    chunksize = src_sampled_array_tmp.chunksize
+    chunks = split_chunks(src_sampled_array_tmp.compute(), chunksize)
+    src_size = sum(chunk.nbytes for chunk in chunks)
+    # Prepare required parameters
+    conditions = [("none", [])]
+    for compression_name in compression_recipes:
+        for filter_name_list in filters_recipes:
+            conditions.append((compression_name, filter_name_list))
+    # Benchmark
+    rows = []
+    for compression_name, filter_name_list in tqdm(conditions, unit = f" / {len(conditions)}"):
+        compressor = configure_compression(compression_name)
+        filters = configure_filters(filter_name_list)
+        encoded_chunks = [encode_chunk(chunk, compressor, filters) for chunk in chunks]
+        for executor_kind in executor_kinds:
+            elapsed_times = measure_decompression_scaling(
+                encoded_chunks, compression_name, filter_name_list, chunksize, chunks[0].dtype,
+                worker_counts, executor_kind = executor_kind)
+            for num_workers, elapsed_time in elapsed_times.items():
+                rows.append({
+                    "compression option" : compression_name,
+                    "filter option" : "-".join(filter_name_list) if filter_name_list else "none",
+                    "executor" : executor_kind,
+                    "workers" : num_workers,
+                    "decompression speed (bytes/sec)" : src_size / elapsed_time,
+                    "scaling efficiency" : elapsed_times[1] / elapsed_time / num_workers,
+                })
+    df = pd.DataFrame(rows)
+    print(df.pivot_table(
+        index = ["compression option", "filter option"],
+        columns = ["executor", "workers"],
+        values = "decompression speed (bytes/sec)",
+        sort = False) / 2**20)
+    csv_id = len(glob(os.path.join(dst_path,"decompression_scaling*"))) + 1
+    df.to_csv(os.path.join(dst_path,f"decompression_scaling_{csv_id}.csv"),index=False)
+    if args.db is not None:
+        append_run(
+            args.db, df, "decompression-scaling", os.path.basename(os.path.normpath(src_path)) if args.dataset is None else args.dataset,
+            recipe = os.path.basename(args.bench_recipe), sample = os.path.abspath(src_path), arguments = vars(args))
@@ -0,0 +1,1110 @@
+"""
+Measurement routines shared by the sampled compression benchmarks.
+
+A benchmark condition is a (compressor, filters) pair given by spec strings
+(e.g. 'zstd-3' and ['BitRound-14', 'Shuffle']). `benchmark_condition` measures
+one condition on an in-memory dask array, `benchmark_condition_streaming` on a memory-mapped
+one with a bounded window of chunks, and `run_conditions_parallel` spreads
+the conditions of a recipe across a process pool sharing the sample read-only.
+`measure_chunk_latency` times the encoding and decoding of every chunk,
+`benchmark_codec_pipeline` times the codecs alone on preloaded chunks, and
+`measure_decompression_scaling` decodes the chunks with pools of growing size.
+`successive_halving` searches the conditions for the ratio/throughput Pareto front.
+`measure_store_io` writes and reads the sample through an on-disk zarr store.
+`decode_and_verify` decompresses the chunks and computes their error metrics in one pass.
+`load_sample` opens the samples written by `generate_benchmark_sample.py`.
+`track_memory` records the peak RSS and traced allocations of a phase.
+`measure_stable_speed` repeats the timed passes of a condition on pinned, pre-faulted buffers
+until the confidence interval of its speeds is tight enough.
+"""
+
+import os
+import json
+import math
+import mmap
+import shutil
+import tempfile
+import time
+import threading
+import tracemalloc
+from contextlib import contextmanager
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from multiprocessing import shared_memory
+from timeit import default_timer
+import tomllib
+import numpy as np
+from scipy.stats import t as student_t
+from numcodecs.compat import ensure_ndarray, ensure_contiguous_ndarray, ndarray_copy
+import dask
+import dask.array as da
+import zarr
+import sys
+from os import path
+try:
+    import resource
+except ImportError: # Windows
+    resource = None
+sys.path.append(path.dirname(path.dirname(path.abspath(__file__))))
+from utils import configure_compression, configure_filters
+
+SAMPLE_FILE = "sample.npy"
+SAMPLE_MANIFEST = "manifest.json"
+
+def load_sample(src_path):
+    """
+    Open a benchmark sample as a dask array whose blocks are the sampled chunks.
+
+    A sample written by `generate_benchmark_sample.py` is one memory-mapped npy file described by its
+    manifest; older samples are npy stacks.
+    """
+    manifest_fname = os.path.join(src_path, SAMPLE_MANIFEST)
+    if not os.path.exists(manifest_fname):
+        return da.from_npy_stack(src_path)
+    with open(manifest_fname) as f:
+        manifest = json.load(f)
+    src_arr = np.load(os.path.join(src_path, manifest["file"]), mmap_mode = "r")
+    return da.from_array(src_arr, chunks = tuple(manifest["chunk_shape"]))
+
+def read_benchmark_recipe(recipe_file):
+    with open(recipe_file, 'rb') as f:
+        data = tomllib.load(f)
+    
+    compression_recipes = []
+    for comp in data['compressors']:
+        name = comp['name']
+        levels = comp['level']
+        for level in levels:
+            compression_recipes.append(f'{name}-{level}')
+    
+    filters_recipes = []
+    for filt in data['filters']:
+        filters_recipes.append(filt['name'])
+    
+    return compression_recipes, filters_recipes
+
+def read_benchmark_chunk_shapes(recipe_file):
+    """Return the chunk shapes of the recipe's optional `[[chunks]]` tables, or None if there are none."""
+    with open(recipe_file, 'rb') as f:
+        data = tomllib.load(f)
+    if 'chunks' not in data:
+        return None
+    return [tuple(int(size) for size in chunk['shape']) for chunk in data['chunks']]
+
+def superblock_shape(chunk_shapes):
+    """Return the smallest block shape which every chunk shape tiles, i.e. their per-axis least common multiple."""
+    ndim = max(len(chunk_shape) for chunk_shape in chunk_shapes)
+    padded = [(1,) * (ndim - len(chunk_shape)) + tuple(chunk_shape) for chunk_shape in chunk_shapes]
+    return tuple(math.lcm(*sizes) for sizes in zip(*padded))
+
+def retile_sample(src_sampled_array, chunk_shape):
+    """
+    Return the sample re-tiled into `chunk_shape` chunks.
+
+    Every chunk shape must tile the chunks (super-blocks) of the sample, so that the new
+    chunks are slices of the existing ones; for an in-memory sample they are views.
+    """
+    chunk_shape = tuple(chunk_shape[-src_sampled_array.ndim:])
+    if any(block % chunk != 0 for block, chunk in zip(src_sampled_array.chunksize, chunk_shape)):
+        raise ValueError(f"Chunk shape {chunk_shape} does not tile the sampled blocks {src_sampled_array.chunksize}.")
+    return src_sampled_array.rechunk(chunk_shape)
+
+def read_benchmark_stores(recipe_file):
+    """Return the store names of the recipe's optional `[[stores]]` tables, or None if there are none."""
+    with open(recipe_file, 'rb') as f:
+        data = tomllib.load(f)
+    if 'stores' not in data:
+        return None
+    store_names = [store['name'] for store in data['stores']]
+    for store_name in store_names:
+        if split_store_name(store_name)[0] not in STORE_SUFFIXES:
+            raise ValueError(f"Unsupported store: {store_name}")
+    return store_names
+
+def encode_chunk(chunk, compressor, filters):
+    """Encode one chunk like zarr does: filters first, then the compressor."""
+    for f in filters:
+        chunk = f.encode(chunk)
+    if compressor is not None:
+        chunk = compressor.encode(chunk)
+    return chunk
+
+def decode_chunk(cdata, compressor, filters, shape, dtype):
+    """Decode one chunk encoded by `encode_chunk` back into an array of `shape`."""
+    chunk = cdata if compressor is None else compressor.decode(cdata)
+    for f in reversed(filters):
+        chunk = f.decode(chunk)
+    return ensure_ndarray(chunk).view(dtype).reshape(shape)
+
+def measure_chunk_latency(src_sampled_array, compressor, filters, repeat, warmup = 1, num_threads = 1):
+    """
+    Time the encoding and decoding of every chunk of the sample.
+
+    Each chunk is loaded once, warmed up `warmup` times and then timed `repeat` times.
+    With `num_threads` > 1, chunks are processed concurrently, so that codecs holding
+    the GIL show a CPU time well below their wall time.
+
+    Returns the latency percentiles of single chunks and the per-pass CPU and wall time
+    (both summed over chunks, averaged over repeats) as a dict of table columns.
+    CPU time is the one of the calling thread, so internal codec threads are not counted.
+    """
+    def chunk_task(block_idx):
+        chunk = np.ascontiguousarray(src_sampled_array.blocks[block_idx].compute(scheduler = "sync"))
+        for _ in range(warmup):
+            decode_chunk(encode_chunk(chunk, compressor, filters), compressor, filters, chunk.shape, chunk.dtype)
+        timings = np.zeros((repeat, 4)) # encode wall, encode cpu, decode wall, decode cpu
+        for i in range(repeat):
+            wall_0, cpu_0 = time.perf_counter(), time.thread_time()
+            cdata = encode_chunk(chunk, compressor, filters)
+            wall_1, cpu_1 = time.perf_counter(), time.thread_time()
+            decode_chunk(cdata, compressor, filters, chunk.shape, chunk.dtype)
+            wall_2, cpu_2 = time.perf_counter(), time.thread_time()
+            timings[i] = (wall_1 - wall_0, cpu_1 - cpu_0, wall_2 - wall_1, cpu_2 - cpu_1)
+        return timings
+    with ThreadPoolExecutor(max_workers = num_threads) as executor:
+        timings = np.stack(list(executor.map(chunk_task, np.ndindex(src_sampled_array.numblocks)))) # chunk, repeat, 4
+    columns = {}
+    for phase, (wall, cpu) in (("encode", timings[..., 0:2].T), ("decode", timings[..., 2:4].T)):
+        for q in (50, 90, 99):
+            columns[f"chunk {phase} p{q} (sec)"] = np.percentile(wall, q)
+        columns[f"chunk {phase} max (sec)"] = wall.max()
+        columns[f"{phase} cpu time (sec)"] = cpu.sum(axis = -1).mean()
+        columns[f"{phase} wall time (sec)"] = wall.sum(axis = -1).mean()
+    return columns
+
+def split_chunks(src_arr, chunksize):
+    """Split an in-memory array into a list of C-contiguous chunks."""
+    chunks = []
+    for block_idx in np.ndindex(*(s // c for s, c in zip(src_arr.shape, chunksize))):
+        chunks.append(np.ascontiguousarray(src_arr[tuple(slice(i * c, (i + 1) * c) for i, c in zip(block_idx, chunksize))]))
+    return chunks
+
+def benchmark_codec_pipeline(chunks, compressor, filters, repeat = 3):
+    """
+    Time the filters and the compressor alone on preloaded chunks, without zarr and dask.
+
+    The decoding writes every stage into buffers allocated once and reused between
+    chunks and repeats (for the codecs which honour `out`).
+    Returns the total raw size, the compressed size and the fastest encoding and decoding
+    time over `repeat` passes.
+    """
+    # warm-up pass: record the size of every decoding stage
+    stage_nbytes = []
+    for chunk in chunks:
+        stage = chunk
+        sizes = []
+        for f in filters:
+            stage = f.encode(stage)
+            sizes.append(ensure_contiguous_ndarray(stage).nbytes)
+        stage_nbytes.append(sizes)
+    stage_buffers = [np.empty(max(sizes), dtype = 'u1') for sizes in zip(*stage_nbytes)]
+    out = np.empty_like(chunks[0])
+    # timed passes
+    encoding_time = decoding_time = np.inf
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        encoded = [encode_chunk(chunk, compressor, filters) for chunk in chunks]
+        encoding_time = min(encoding_time, time.perf_counter() - start_time)
+        start_time = time.perf_counter()
+        for cdata, sizes in zip(encoded, stage_nbytes):
+            # stage_outs[j] receives the input of the (j+1)-th filter, i.e. the output of the j-th one
+            stage_outs = [out] + [buffer[:size] for buffer, size in zip(stage_buffers, sizes)]
+            stage = cdata if compressor is None else compressor.decode(cdata, out = stage_outs[-1])
+            for j in reversed(range(len(filters))):
+                stage = filters[j].decode(stage, out = stage_outs[j])
+            # codecs ignoring `out` leave the last copy to the caller, as in zarr
+            if not np.shares_memory(ensure_ndarray(stage), out):
+                ndarray_copy(stage, out)
+        decoding_time = min(decoding_time, time.perf_counter() - start_time)
+    compressed_size = sum(ensure_contiguous_ndarray(cdata).nbytes for cdata in encoded)
+    return sum(chunk.nbytes for chunk in chunks), compressed_size, encoding_time, decoding_time
+
+def reset_peak_rss():
+    """Reset the peak RSS of this process to its current RSS. Only supported on Linux."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+def read_peak_rss():
+    """
+    Return the peak RSS of this process in bytes, since the last `reset_peak_rss` where it is
+    supported, otherwise over the lifetime of the process; NaN where it is not available at all.
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if resource is not None:
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss if sys.platform == "darwin" else maxrss * 1024
+    return np.nan
+
+@contextmanager
+def track_memory(columns, phase, enabled = True):
+    """
+    Record the peak memory of the enclosed phase into the `columns` dict.
+
+    '{phase} peak rss (bytes)' is the peak resident size of the process, which includes the
+    buffers allocated inside the codec libraries. '{phase} traced peak (bytes)' is the peak of
+    the Python and NumPy allocations made during the phase, as traced by tracemalloc.
+    The peak RSS is NaN where it cannot be reset (outside Linux), as the lifetime peak of the
+    process would then be reported for every phase.
+    """
+    if not enabled:
+        yield
+        return
+    peak_reset = reset_peak_rss()
+    tracemalloc.start()
+    try:
+        yield
+    finally:
+        _, traced_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        columns[f"{phase} peak rss (bytes)"] = read_peak_rss() if peak_reset else np.nan
+        columns[f"{phase} traced peak (bytes)"] = traced_peak
+
+# file name suffix of each store; '' for the in-memory store
+STORE_SUFFIXES = {
+    "memory" : "",
+    "directory" : ".zarr", # flat keys, one directory per array
+    "directory-nested" : ".zarr", # '/' separated keys, as written by the converters
+    "zip" : ".zarr.zip",
+    "sqlite" : ".sqlite",
+    "lmdb" : ".lmdb",
+    "shard" : ".zarr", # utils.shard_store.ShardedStore, e.g. 'shard-16x1x1x1x1' for 16 chunks per shard along t
+}
+
+def split_store_name(store_name):
+    """Split a store name into its kind and its chunks per shard, e.g. 'shard-16x1x1x1x1' -> ('shard', (16, 1, 1, 1, 1))."""
+    if store_name.startswith("shard-"):
+        return "shard", tuple(int(n) for n in store_name[len("shard-"):].split("x"))
+    return store_name, None
+
+def open_benchmark_store(store_name, store_path, mode = "w"):
+    """Open the zarr store `store_name` at `store_path` for writing ('w') or reading ('r')."""
+    store_name, chunks_per_shard = split_store_name(store_name)
+    if store_name == "memory":
+        return zarr.MemoryStore()
+    if store_name in ("directory", "directory-nested"):
+        return zarr.DirectoryStore(store_path)
+    if store_name == "zip":
+        return zarr.ZipStore(store_path, mode = mode)
+    if store_name == "sqlite":
+        return zarr.SQLiteStore(store_path)
+    if store_name == "lmdb":
+        try:
+            return zarr.LMDBStore(store_path, readonly = (mode == "r"))
+        except ImportError as e:
+            raise ImportError("The 'lmdb' store requires the lmdb package.") from e
+    if store_name == "shard":
+        from utils.shard_store import ShardedStore, DEFAULT_CHUNKS_PER_SHARD
+        return ShardedStore(store_path, chunks_per_shard or DEFAULT_CHUNKS_PER_SHARD)
+    raise ValueError(f"Unsupported store: {store_name}")
+
+def list_store_files(store_path):
+    """Return the files making up an on-disk store."""
+    if os.path.isfile(store_path):
+        return [store_path]
+    return [os.path.join(root, name) for root, _, names in os.walk(store_path) for name in names]
+
+def evict_page_cache(files):
+    """Flush `files` to disk and drop them from the page cache, so that the next read hits the disk."""
+    for fname in files:
+        fd = os.open(fname, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+
+def measure_store_io(src_sampled_array, compressor, filters, store_name, work_dir = None, cold_read = False, chunk_by_chunk = False):
+    """
+    Write the sample into a zarr store and read it back, timing both ends including the store overhead.
+
+    Parameters:
+    - src_sampled_array: dask array of the sample. Its chunks are used as zarr chunks.
+    - compressor, filters: numcodecs codecs of the condition.
+    - store_name: one of `STORE_SUFFIXES`, see also `split_store_name`.
+    - work_dir: directory in which the store is created and deleted afterwards.
+    - cold_read: evict the store files from the page cache before reading them.
+    - chunk_by_chunk: read the store back one chunk at a time into a reused buffer instead of as a whole array.
+    Returns the store columns of the benchmark table as a dict.
+    """
+    if cold_read and store_name != "memory" and not hasattr(os, "posix_fadvise"):
+        raise ValueError("Cold reads require os.posix_fadvise, which is not available on this platform.")
+    tmp_dir = None if store_name == "memory" else tempfile.mkdtemp(dir = work_dir)
+    store_path = None if tmp_dir is None else os.path.join(tmp_dir, "benchmark" + STORE_SUFFIXES[split_store_name(store_name)[0]])
+    try:
+        start_time = default_timer()
+        store = open_benchmark_store(store_name, store_path, mode = "w")
+        z = zarr.create(
+            shape = src_sampled_array.shape,
+            chunks = src_sampled_array.chunksize,
+            dtype = src_sampled_array.dtype,
+            compressor = compressor,
+            filters = filters,
+            store = store,
+            dimension_separator = "." if store_name == "directory" else "/"
+        )
+        da.store(src_sampled_array, z, lock=False, compute=True, return_stored=False)
+        if hasattr(store, "close"):
+            store.close()
+        elapsed_write_time = default_timer() - start_time
+        src_size = z.nbytes
+        if store_path is None:
+            files = []
+            stored_size = sum(len(value) for value in store.values())
+        else:
+            files = list_store_files(store_path)
+            stored_size = sum(os.path.getsize(fname) for fname in files)
+            if cold_read:
+                evict_page_cache(files)
+        del z
+
+        start_time = default_timer()
+        if store_path is not None:
+            store = open_benchmark_store(store_name, store_path, mode = "r")
+        z = zarr.open_array(store, mode = "r")
+        if chunk_by_chunk:
+            out_buffer = np.empty(z.chunks, dtype = z.dtype)
+            for slices in da.core.slices_from_chunks(src_sampled_array.chunks):
+                z.get_basic_selection(slices, out = out_buffer[tuple(slice(0, s.stop - s.start) for s in slices)])
+            del out_buffer
+        else:
+            np_arr = z[...]
+            del np_arr
+        if hasattr(store, "close"):
+            store.close()
+        elapsed_read_time = default_timer() - start_time
+        del z
+    finally:
+        if tmp_dir is not None:
+            shutil.rmtree(tmp_dir, ignore_errors = True)
+    return {
+        "write speed (bytes/sec)" : src_size / elapsed_write_time if elapsed_write_time > 0 else np.nan,
+        "read speed (bytes/sec)" : src_size / elapsed_read_time if elapsed_read_time > 0 else np.nan,
+        "stored size (bytes)" : stored_size,
+        "file count" : len(files)}
+
+def _read_block(z, slices, nvcomp = False):
+    if not nvcomp:
+        return z[slices]
+    # nvcomp codecs fail on some full chunk reads: read the last x column separately
+    block = np.zeros(tuple(s.stop - s.start for s in slices), dtype = z.dtype)
+    x_slice = slices[-1]
+    block[..., :-1] = z[slices[:-1] + (slice(x_slice.start, x_slice.stop - 1),)]
+    block[..., -1] = z[slices[:-1] + (x_slice.stop - 1,)]
+    return block
+
+def verify_block(src_block, dec_block):
+    """Return the maximum absolute error, the sum of squared errors and the bit-exactness of a decoded block."""
+    bit_exact = src_block.shape == dec_block.shape and bool(np.array_equal(
+        np.ascontiguousarray(src_block).view(f"u{src_block.dtype.itemsize}"),
+        np.ascontiguousarray(dec_block).view(f"u{dec_block.dtype.itemsize}")))
+    if bit_exact:
+        return 0.0, 0.0, True
+    error = np.abs(dec_block.astype(np.float64) - src_block.astype(np.float64))
+    if np.issubdtype(src_block.dtype, np.floating):
+        # NaNs kept at their place are not errors
+        error[np.isnan(src_block) & np.isnan(dec_block)] = 0
+    return float(np.max(error)), float(np.sum(error ** 2)), False
+
+def new_verification_stats():
+    """Return an empty accumulator of `accumulate_verification`."""
+    return dict(max_abs_error = 0.0, chunks = [], bit_exact = True, value_min = np.inf, value_max = -np.inf)
+
+def accumulate_verification(stats, src_block, dec_block):
+    """Add the comparison of one decoded block with its source block to the `stats` accumulator."""
+    block_max_abs_error, block_squared_error, block_bit_exact = verify_block(src_block, dec_block)
+    stats["max_abs_error"] = max(stats["max_abs_error"], block_max_abs_error) if not np.isnan(block_max_abs_error) else np.nan
+    stats["chunks"].append((block_max_abs_error, block_squared_error, src_block.size, block_bit_exact))
+    stats["bit_exact"] = stats["bit_exact"] and block_bit_exact
+    if src_block.size > 0:
+        stats["value_min"] = min(stats["value_min"], float(np.nanmin(src_block)))
+        stats["value_max"] = max(stats["value_max"], float(np.nanmax(src_block)))
+
+def verification_columns(stats):
+    """
+    Return the verification columns of the accumulated blocks: the maximum absolute error, the RMSE and
+    the PSNR over the sample, the lowest PSNR of a chunk and whether every chunk is bit-exact.
+    The PSNR uses the value range of the sample, and is infinite for lossless chunks.
+    """
+    total_squared_error = sum(chunk[1] for chunk in stats["chunks"])
+    total_size = sum(chunk[2] for chunk in stats["chunks"])
+    return {
+        "max abs error" : stats["max_abs_error"],
+        "rmse" : float(np.sqrt(total_squared_error / max(total_size, 1))),
+        "psnr (dB)" : _psnr(stats, total_squared_error, total_size),
+        "min chunk psnr (dB)" : min((_psnr(stats, chunk[1], chunk[2]) for chunk in stats["chunks"]), default = np.inf),
+        "bit exact" : stats["bit_exact"]}
+
+def _psnr(stats, squared_error, size):
+    value_range = stats["value_max"] - stats["value_min"]
+    mse = squared_error / max(size, 1)
+    if mse == 0:
+        return np.inf
+    return 20 * np.log10(value_range) - 10 * np.log10(mse) if value_range > 0 else np.nan
+
+def chunk_verification_stats(stats, compressed_sizes):
+    """Return the statistics of every accumulated chunk, in order, as a list of dicts."""
+    return [
+        {
+            "compressed size (bytes)" : int(compressed_size),
+            "max abs error" : max_abs_error,
+            "rmse" : float(np.sqrt(squared_error / max(size, 1))),
+            "psnr (dB)" : _psnr(stats, squared_error, size),
+            "bit exact" : bit_exact}
+        for (max_abs_error, squared_error, size, bit_exact), compressed_size in zip(stats["chunks"], compressed_sizes)]
+
+def decode_and_verify(z, src_sampled_array, out = None, stats = None):
+    """
+    Decompress a zarr array chunk by chunk and compare every chunk with the sample while it is still in cache.
+
+    Parameters:
+    - z: zarr array holding the compressed sample, chunked like `src_sampled_array`.
+    - src_sampled_array: dask array of the sample.
+    - out: if given, array of the sample shape receiving the decompressed data.
+    - stats: if given, `new_verification_stats` accumulator receiving the chunks, e.g. for `chunk_verification_stats`.
+    Returns the decompression time (without the comparison) and the `verification_columns`.
+    """
+    nvcomp = z.compressor is not None and 'nvcomp' in z.compressor.codec_id
+    decompression_time = 0
+    if stats is None:
+        stats = new_verification_stats()
+    block_indices = np.ndindex(src_sampled_array.numblocks)
+    for block_idx, slices in zip(block_indices, da.core.slices_from_chunks(src_sampled_array.chunks)):
+        start_time = default_timer()
+        dec_block = _read_block(z, slices, nvcomp)
+        decompression_time += default_timer() - start_time
+        src_block = np.asarray(src_sampled_array.blocks[block_idx].compute(scheduler = "synchronous"))
+        accumulate_verification(stats, src_block, dec_block)
+        if out is not None:
+            out[slices] = dec_block
+    return decompression_time, verification_columns(stats)
+
+def benchmark_condition(src_sampled_array, compressor, filters, debug_path = None, label = "", latency_options = None, scheduler = "threads", store_options = None, memory = False, chunk_stats = False, stable_options = None):
+    """
+    Compress the sample into an in-memory zarr array, decompress it back and check the result
+    chunk by chunk with `decode_and_verify`.
+
+    Parameters:
+    - src_sampled_array: dask array of the sample. Its chunks are used as zarr chunks.
+    - compressor, filters: numcodecs codecs of the condition.
+    - debug_path: if given, mismatching decompressed data are saved in this directory.
+    - label: name of the condition used in messages and debug file names.
+    - latency_options: if given, keyword arguments of `measure_chunk_latency`, whose columns are added.
+    - scheduler: dask scheduler of the compression.
+    - store_options: if given, a list with the keyword arguments of `measure_store_io` for each store. The in-memory
+      columns are measured once and the store columns of every store are listed under the 'store io' key.
+    - memory: add the `track_memory` columns of the encode and decode phases (the decode phase includes the verification).
+      Tracing slows down Python-level allocations, so the speeds are slightly lower.
+    - chunk_stats: add the `chunk_verification_stats` of every chunk, with its compressed size, under the 'chunk stats' key.
+    - stable_options: if given, keyword arguments of `measure_stable_speed`, whose speeds replace the ones of the single
+      pass and whose confidence, outlier and CPU frequency columns are added.
+    Returns the row of the benchmark table as a dict.
+    """
+    memory_columns = {}
+    z = zarr.create(
+        shape = src_sampled_array.shape,
+        chunks = src_sampled_array.chunksize,
+        dtype = src_sampled_array.dtype,
+        compressor = compressor,
+        filters = filters,
+        store = zarr.MemoryStore()
+    )
+    with track_memory(memory_columns, "encode", memory):
+        start_time = default_timer()
+        da.store(src_sampled_array, z, lock=False, compute=True, return_stored=False, scheduler=scheduler)
+        end_time = default_timer()
+    elapsed_compression_time = end_time - start_time
+    src_size = z.nbytes
+    compressed_size = z.nbytes_stored
+    ratio = src_size / compressed_size
+    if elapsed_compression_time == 0:
+        compression_speed = np.nan
+    else:
+        compression_speed = src_size / elapsed_compression_time
+    # Check the decompression speed, and the decompressed data chunk by chunk in the same pass
+    # decompression does not use dask
+    with track_memory(memory_columns, "decode", memory):
+        np_arr = None if debug_path is None else np.zeros(z.shape, dtype = z.dtype)
+        stats = new_verification_stats()
+        elapsed_decompression_time, verification_columns = decode_and_verify(z, src_sampled_array, out = np_arr, stats = stats)
+    if elapsed_decompression_time == 0:
+        decompression_speed = np.nan
+    else:
+        decompression_speed = src_size / elapsed_decompression_time
+    matched = verification_columns["max abs error"] <= 1e-4
+    if not matched:
+        print("\nDecompressed data does not match the original data.")
+        print(label)
+        if debug_path is not None:
+            orig_fname = os.path.join(debug_path, f"original_data.npy")
+            if not os.path.exists(orig_fname):
+                np.save(orig_fname, src_sampled_array.compute())
+            np.save(os.path.join(debug_path, f"decompressed_data_{label}.npy"),np_arr)
+    if chunk_stats:
+        compressed_sizes = [len(z.store.get(z._chunk_key(block_idx), b"")) for block_idx in np.ndindex(src_sampled_array.numblocks)]
+    del z, np_arr
+    row = {
+        "compression ratio" : ratio,
+        "compression speed (bytes/sec)" : compression_speed,
+        "decompression speed (bytes/sec)" : decompression_speed,
+        **verification_columns,
+        **memory_columns}
+    if chunk_stats:
+        row["chunk stats"] = chunk_verification_stats(stats, compressed_sizes)
+    if stable_options is not None:
+        row.update(measure_stable_speed(src_sampled_array, compressor, filters, scheduler = scheduler, **stable_options))
+    if latency_options is not None:
+        row.update(measure_chunk_latency(src_sampled_array, compressor, filters, **latency_options))
+    if store_options is not None:
+        row["store io"] = [measure_store_io(src_sampled_array, compressor, filters, **options) for options in store_options]
+    return row
+
+def benchmark_condition_streaming(src_sampled_array, compressor, filters, window, label = "", latency_options = None, store_options = None, memory = False, chunk_stats = False):
+    """
+    Benchmark a condition like `benchmark_condition`, holding at most `window` chunks in memory.
+
+    The sample, usually memory-mapped (see `load_sample`), is copied `window` chunks at a time into
+    reused input buffers. The chunks of a window go through the same zarr path as in `benchmark_condition`:
+    they are stored into an in-memory zarr array with `da.store` on the threaded scheduler, then read back
+    one by one into a reused output buffer with `get_basic_selection` and verified while they are in cache.
+    The compressed chunks of a window are dropped once it is verified, so only the compressed sizes, the
+    timings and the error statistics are kept, and the columns are comparable with those of
+    `benchmark_condition`. Reading the sample is not timed.
+
+    Parameters:
+    - src_sampled_array: dask array of the sample. Its chunks are the encoded chunks.
+    - compressor, filters: numcodecs codecs of the condition.
+    - window: number of chunks held in memory.
+    - label: name of the condition used in messages.
+    - latency_options, store_options: as in `benchmark_condition`. The stores are read back chunk by chunk.
+    - memory: add the `track_memory` columns of the whole streaming pass ('stream' phase).
+    - chunk_stats: as in `benchmark_condition`.
+    Returns the row of the benchmark table as a dict.
+    """
+    if window < 1:
+        raise ValueError(f"The streaming window must hold at least one chunk: {window}")
+    memory_columns = {}
+    chunk_shape = tuple(src_sampled_array.chunksize)
+    block_indices = list(np.ndindex(src_sampled_array.numblocks))
+    block_slices = da.core.slices_from_chunks(src_sampled_array.chunks)
+    z = zarr.create(
+        shape = src_sampled_array.shape,
+        chunks = chunk_shape,
+        dtype = src_sampled_array.dtype,
+        compressor = compressor,
+        filters = filters,
+        store = zarr.MemoryStore()
+    )
+    # the metadata of the zarr array is counted in the stored size, as in benchmark_condition
+    metadata_size = z.nbytes_stored
+    nvcomp = compressor is not None and 'nvcomp' in compressor.codec_id
+    elapsed_compression_time = elapsed_decompression_time = 0
+    src_size = 0
+    compressed_sizes = []
+    stats = new_verification_stats()
+    with track_memory(memory_columns, "stream", memory):
+        in_buffers = np.empty((min(window, len(block_indices)),) + chunk_shape, dtype = src_sampled_array.dtype)
+        out_buffer = np.empty(chunk_shape, dtype = src_sampled_array.dtype)
+        for window_start in range(0, len(block_indices), window):
+            window_indices = block_indices[window_start:window_start + window]
+            window_slices = block_slices[window_start:window_start + window]
+            src_blocks = []
+            for in_buffer, slices in zip(in_buffers, window_slices):
+                src_block = in_buffer[tuple(slice(0, s.stop - s.start) for s in slices)]
+                np.copyto(src_block, src_sampled_array[slices].compute(scheduler = "synchronous"))
+                src_blocks.append(src_block)
+            sources = [da.from_array(src_block, chunks = src_block.shape) for src_block in src_blocks]
+            start_time = default_timer()
+            da.store(sources, [z] * len(sources), regions = window_slices, lock = False, compute = True, return_stored = False, scheduler = "threads")
+            elapsed_compression_time += default_timer() - start_time
+            for block_idx, slices, src_block in zip(window_indices, window_slices, src_blocks):
+                src_size += src_block.nbytes
+                chunk_key = z._chunk_key(block_idx)
+                compressed_sizes.append(len(z.store.get(chunk_key, b"")))
+                dec_block = out_buffer[tuple(slice(0, n) for n in src_block.shape)]
+                start_time = default_timer()
+                if nvcomp:
+                    dec_block[...] = _read_block(z, slices, nvcomp)
+                else:
+                    z.get_basic_selection(slices, out = dec_block)
+                elapsed_decompression_time += default_timer() - start_time
+                accumulate_verification(stats, src_block, dec_block)
+                z.store.pop(chunk_key, None)
+            del sources, src_blocks
+    del z
+    ratio = src_size / (sum(compressed_sizes) + metadata_size)
+    compression_speed = np.nan if elapsed_compression_time == 0 else src_size / elapsed_compression_time
+    decompression_speed = np.nan if elapsed_decompression_time == 0 else src_size / elapsed_decompression_time
+    verification = verification_columns(stats)
+    if not verification["max abs error"] <= 1e-4:
+        print("\nDecompressed data does not match the original data.")
+        print(label)
+    row = {
+        "compression ratio" : ratio,
+        "compression speed (bytes/sec)" : compression_speed,
+        "decompression speed (bytes/sec)" : decompression_speed,
+        **verification,
+        **memory_columns}
+    if chunk_stats:
+        row["chunk stats"] = chunk_verification_stats(stats, compressed_sizes)
+    if latency_options is not None:
+        row.update(measure_chunk_latency(src_sampled_array, compressor, filters, **latency_options))
+    if store_options is not None:
+        row["store io"] = [measure_store_io(src_sampled_array, compressor, filters, chunk_by_chunk = True, **options) for options in store_options]
+    return row
+
+def parse_cpu_list(cpu_list):
+    """Parse a CPU list in the format of taskset and cpuset, e.g. '0-3,8', into a tuple of CPU numbers."""
+    cpus = set()
+    for part in cpu_list.split(","):
+        first, _, last = part.strip().partition("-")
+        if not first.isdigit() or not (last or first).isdigit() or int(last or first) < int(first):
+            raise ValueError(f"Invalid CPU list: {cpu_list}")
+        cpus.update(range(int(first), int(last or first) + 1))
+    return tuple(sorted(cpus))
+
+def split_cpu_sets(num_workers, cpus = None):
+    """Split `cpus` (Default: the CPUs available to this process) into `num_workers` disjoint sets."""
+    if cpus is not None:
+        cpus = sorted(cpus)
+    elif hasattr(os, "sched_getaffinity"):
+        cpus = sorted(os.sched_getaffinity(0))
+    else:
+        cpus = list(range(os.cpu_count()))
+    if num_workers > len(cpus):
+        raise ValueError(f"Cannot pin {num_workers} workers to {len(cpus)} CPUs.")
+    return [tuple(int(cpu) for cpu in cpu_set) for cpu_set in np.array_split(cpus, num_workers)]
+
+def limit_threads(cpu_set):
+    """Pin the current process to `cpu_set` and size the codec and dask thread pools to it."""
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpu_set)
+    from numcodecs import blosc
+    blosc.set_nthreads(len(cpu_set))
+    dask.config.set(num_workers = len(cpu_set))
+
+def read_cpu_frequency(cpus = None):
+    """
+    Return the frequency scaling governors and the current frequencies (MHz) of `cpus` (Default: the CPUs
+    available to this process).
+
+    They are read from the cpufreq interface of Linux, with the frequencies of /proc/cpuinfo as a fallback
+    (e.g. in virtual machines, which have no governor). Unknown values are left out.
+    """
+    if cpus is None:
+        cpus = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else range(os.cpu_count())
+    governors, frequencies = set(), []
+    for cpu in cpus:
+        cpufreq = f"/sys/devices/system/cpu/cpu{cpu}/cpufreq"
+        try:
+            with open(os.path.join(cpufreq, "scaling_governor")) as f:
+                governors.add(f.read().strip())
+            with open(os.path.join(cpufreq, "scaling_cur_freq")) as f:
+                frequencies.append(int(f.read()) / 1000)
+        except OSError:
+            pass
+    if not frequencies and os.path.exists("/proc/cpuinfo"):
+        cpu = None
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key.strip() == "processor":
+                    cpu = int(value)
+                elif key.strip() == "cpu MHz" and cpu in cpus:
+                    frequencies.append(float(value))
+    return governors, frequencies
+
+def prefault(arr, write = False):
+    """
+    Touch every memory page of `arr`, so that timed passes do not pay the first-touch page faults.
+
+    Read-only arrays (e.g. memory-mapped samples) are read one element per page; with `write`, the
+    array is zero-filled, which also maps the pages of a freshly allocated output buffer.
+    """
+    if write:
+        arr.fill(0)
+        return
+    flat = arr.reshape(-1) # copies non-contiguous arrays, which reads all their pages
+    flat[::max(1, mmap.PAGESIZE // max(1, flat.itemsize))].sum()
+
+def reject_outliers(samples, threshold = 3.5):
+    """
+    Return the mask of the samples kept by the modified z-score test of Iglewicz and Hoaglin.
+
+    Samples farther than `threshold` scaled median absolute deviations from the median are rejected.
+    All samples are kept if more than half of them are equal, as the deviation is then zero.
+    """
+    samples = np.asarray(samples, dtype = float)
+    deviations = np.abs(samples - np.median(samples))
+    mad = np.median(deviations)
+    if mad == 0:
+        return np.ones(samples.shape, dtype = bool)
+    return 0.6745 * deviations / mad <= threshold
+
+def relative_confidence_interval(samples, confidence = 0.95):
+    """Return the half-width of the Student t confidence interval of the mean of `samples`, relative to the mean."""
+    samples = np.asarray(samples, dtype = float)
+    if samples.size < 2:
+        return np.inf
+    half_width = student_t.ppf((1 + confidence) / 2, samples.size - 1) * samples.std(ddof = 1) / np.sqrt(samples.size)
+    return half_width / samples.mean()
+
+def measure_stable_speed(src_sampled_array, compressor, filters, warmup = 2, min_repeats = 5, max_repeats = 30, ci_target = 0.02, confidence = 0.95, outlier_threshold = 3.5, scheduler = "threads"):
+    """
+    Measure the compression and decompression speeds of a condition with repeated passes, until
+    their confidence interval is tight enough.
+
+    The sample pages are pre-faulted, and the chunks are decoded into one pre-faulted output buffer,
+    as zarr decodes full chunks in place. After `warmup` untimed passes, encoding/decoding passes are
+    repeated until the `confidence` interval of both mean pass times, without the passes rejected by
+    `reject_outliers`, is within `ci_target` of the mean (at least `min_repeats` and at most
+    `max_repeats` passes). The CPU frequency is read after every pass.
+    Pin the process first (e.g. with `limit_threads`), so that the codec and dask threads do not migrate.
+
+    Returns the speeds of the mean kept pass times, the relative half-widths of their confidence
+    intervals (%), the number of passes and outliers, the CPU governors and the mean and lowest CPU
+    frequencies as a dict of table columns.
+    """
+    if not 1 < min_repeats <= max_repeats:
+        raise ValueError(f"The repeats must satisfy 1 < min_repeats <= max_repeats: {min_repeats}, {max_repeats}")
+    nvcomp = compressor is not None and 'nvcomp' in compressor.codec_id
+    cpus = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else None
+    z = zarr.create(
+        shape = src_sampled_array.shape,
+        chunks = src_sampled_array.chunksize,
+        dtype = src_sampled_array.dtype,
+        compressor = compressor,
+        filters = filters,
+        store = zarr.MemoryStore()
+    )
+    block_slices = da.core.slices_from_chunks(src_sampled_array.chunks)
+    for block_idx in np.ndindex(src_sampled_array.numblocks):
+        prefault(np.asarray(src_sampled_array.blocks[block_idx].compute(scheduler = "synchronous")))
+    out_buffer = np.empty(src_sampled_array.chunksize, dtype = src_sampled_array.dtype)
+    prefault(out_buffer, write = True)
+    def timed_pass():
+        start_time = default_timer()
+        da.store(src_sampled_array, z, lock = False, compute = True, return_stored = False, scheduler = scheduler)
+        compression_time = default_timer() - start_time
+        decompression_time = 0
+        for slices in block_slices:
+            dec_block = out_buffer[tuple(slice(0, s.stop - s.start) for s in slices)]
+            start_time = default_timer()
+            if nvcomp:
+                dec_block[...] = _read_block(z, slices, nvcomp)
+            else:
+                z.get_basic_selection(slices, out = dec_block)
+            decompression_time += default_timer() - start_time
+        return compression_time, decompression_time
+    for _ in range(warmup):
+        timed_pass()
+    times, frequencies, governors = [], [], set()
+    while len(times) < max_repeats:
+        times.append(timed_pass())
+        pass_governors, pass_frequencies = read_cpu_frequency(cpus)
+        governors |= pass_governors
+        frequencies.extend(pass_frequencies)
+        if len(times) >= min_repeats:
+            kept = [np.asarray(phase_times)[reject_outliers(phase_times, outlier_threshold)] for phase_times in zip(*times)]
+            if all(relative_confidence_interval(phase_times, confidence) <= ci_target for phase_times in kept):
+                break
+    src_size = z.nbytes
+    columns = {}
+    for phase, phase_times in zip(("compression", "decompression"), kept):
+        mean_time = phase_times.mean()
+        columns[f"{phase} speed (bytes/sec)"] = src_size / mean_time if mean_time > 0 else np.nan
+        columns[f"{phase} speed ci (%)"] = 100 * relative_confidence_interval(phase_times, confidence)
+        columns[f"{phase} outliers"] = len(times) - len(phase_times)
+    columns["repeats"] = len(times)
+    columns["cpu governor"] = ",".join(sorted(governors)) if governors else None
+    columns["cpu freq (MHz)"] = np.mean(frequencies) if frequencies else np.nan
+    columns["cpu min freq (MHz)"] = np.min(frequencies) if frequencies else np.nan
+    return columns
+
+# state of a worker process, set by `_init_worker`
+_worker_state = {}
+
+def _init_worker(shm_name, shape, dtype, chunksize, cpu_set_queue, src_path = None):
+    limit_threads(cpu_set_queue.get())
+    if src_path is not None:
+        _worker_state["src_sampled_array"] = load_sample(src_path)
+        return
+    shm = shared_memory.SharedMemory(name = shm_name)
+    src_arr = np.ndarray(shape, dtype = dtype, buffer = shm.buf)
+    src_arr.flags.writeable = False
+    _worker_state["shm"] = shm
+    _worker_state["src_sampled_array"] = da.from_array(src_arr, chunks = chunksize)
+
+def _run_worker_condition(idx, compression_name, filter_names, debug_path, latency_options, store_options, memory, chunk_shape, stream_window, chunk_stats, stable_options):
+    compressor = configure_compression(compression_name)
+    filters = configure_filters(filter_names)
+    label = f"{compression_name}_{'-'.join(filter_names) if filter_names else 'none'}"
+    src_sampled_array = _worker_state["src_sampled_array"]
+    if chunk_shape is not None:
+        src_sampled_array = retile_sample(src_sampled_array, chunk_shape)
+    if stream_window is not None:
+        return idx, benchmark_condition_streaming(src_sampled_array, compressor, filters, stream_window, label = label, latency_options = latency_options, store_options = store_options, memory = memory, chunk_stats = chunk_stats)
+    return idx, benchmark_condition(src_sampled_array, compressor, filters, debug_path = debug_path, label = label, latency_options = latency_options, store_options = store_options, memory = memory, chunk_stats = chunk_stats, stable_options = stable_options)
+
+def run_conditions_parallel(src_sampled_array, conditions, num_workers, debug_path = None, latency_options = None, progress = None, store_options = None, memory = False, chunk_shapes = None, stream_window = None, src_path = None, on_row = None, chunk_stats = False, stable_options = None, cpus = None):
+    """
+    Benchmark the conditions with a pool of processes pinned to disjoint CPU sets.
+
+    The sample is copied once into shared memory and mapped read-only by every worker,
+    or, in streaming mode, memory-mapped from its file by every worker.
+
+    Parameters:
+    - src_sampled_array: dask array of the sample.
+    - conditions: list of (compression spec, list of filter specs).
+    - num_workers: number of worker processes.
+    - debug_path, latency_options, memory, chunk_stats, stable_options: see `benchmark_condition`.
+    - cpus: CPUs split between the workers. (Default: the CPUs available to this process)
+    - store_options: None, or the `store_options` of `benchmark_condition`, shared by all conditions.
+    - chunk_shapes: None, or one chunk shape per condition, see `retile_sample`.
+    - stream_window: if given, run `benchmark_condition_streaming` with this window on the sample
+      at `src_path` (see `load_sample`) instead of `benchmark_condition`.
+    - progress: optional callback called after each finished condition.
+    - on_row: optional callback called with the index and the row of each finished condition.
+    Returns the rows of the benchmark table in the order of `conditions`.
+    """
+    dtype = np.dtype(src_sampled_array.dtype)
+    streaming = stream_window is not None
+    if streaming and src_path is None:
+        raise ValueError("The streaming mode needs the path of the sample.")
+    shm = None if streaming else shared_memory.SharedMemory(create = True, size = max(1, src_sampled_array.size * dtype.itemsize))
+    try:
+        if not streaming:
+            shared_arr = np.ndarray(src_sampled_array.shape, dtype = dtype, buffer = shm.buf)
+            da.store(src_sampled_array, shared_arr, lock = False)
+        context = multiprocessing.get_context("spawn")
+        cpu_set_queue = context.Queue()
+        for cpu_set in split_cpu_sets(num_workers, cpus):
+            cpu_set_queue.put(cpu_set)
+        if streaming:
+            initargs = (None, None, None, None, cpu_set_queue, src_path)
+        else:
+            initargs = (shm.name, shared_arr.shape, dtype.str, src_sampled_array.chunksize, cpu_set_queue)
+        rows = [None] * len(conditions)
+        with ProcessPoolExecutor(
+            max_workers = num_workers,
+            mp_context = context,
+            initializer = _init_worker,
+            initargs = initargs
+        ) as executor:
+            futures = [
+                executor.submit(
+                    _run_worker_condition, idx, compression_name, filter_names, debug_path, latency_options,
+                    store_options, memory,
+                    None if chunk_shapes is None else chunk_shapes[idx], stream_window, chunk_stats, stable_options)
+                for idx, (compression_name, filter_names) in enumerate(conditions)
+            ]
+            for future in as_completed(futures):
+                idx, row = future.result()
+                rows[idx] = row
+                if on_row is not None:
+                    on_row(idx, row)
+                if progress is not None:
+                    progress()
+        if not streaming:
+            del shared_arr
+    finally:
+        if shm is not None:
+            shm.close()
+            shm.unlink()
+    return rows
+
+# state of a decoding worker process, set by `_init_decode_worker`
+_decode_worker_state = {}
+
+def _init_decode_worker(encoded_chunks, compression_name, filter_names, shape, dtype):
+    _decode_worker_state["encoded_chunks"] = encoded_chunks
+    _decode_worker_state["codecs"] = (configure_compression(compression_name), configure_filters(filter_names))
+    _decode_worker_state["chunk"] = (shape, dtype)
+
+def _init_decode_process(*initargs):
+    # numcodecs runs Blosc multi-threaded on the main thread of a process, which is where
+    # process workers decode; thread workers are single-threaded, so match them
+    from numcodecs import blosc
+    blosc.use_threads = False
+    _init_decode_worker(*initargs)
+
+def _wait_barrier(barrier):
+    barrier.wait()
+
+def _decode_range(start, stop):
+    compressor, filters = _decode_worker_state["codecs"]
+    shape, dtype = _decode_worker_state["chunk"]
+    for cdata in _decode_worker_state["encoded_chunks"][start:stop]:
+        decode_chunk(cdata, compressor, filters, shape, dtype)
+    return stop - start
+
+def worker_count_sweep(max_workers):
+    """Return 1, 2, 4, ... up to `max_workers`, which is always included."""
+    counts = [1]
+    while counts[-1] * 2 < max_workers:
+        counts.append(counts[-1] * 2)
+    if counts[-1] != max_workers:
+        counts.append(max_workers)
+    return counts
+
+def measure_decompression_scaling(encoded_chunks, compression_name, filter_names, shape, dtype, worker_counts, executor_kind = "thread", batches_per_worker = 4):
+    """
+    Decode all chunks with thread or process pools of each size in `worker_counts`.
+
+    Workers only decode; the decoded chunks are discarded, so that the curve shows how
+    far each codec scales, e.g. whether it releases the GIL. Process workers receive
+    the encoded chunks once, before timing. Blosc runs single-threaded in both kinds of
+    workers, so that the process curve does not oversubscribe the CPUs.
+    Returns the decoding wall time (sec) per worker count.
+    """
+    elapsed_times = {}
+    context = multiprocessing.get_context("spawn")
+    for num_workers in worker_counts:
+        initargs = (encoded_chunks, compression_name, filter_names, shape, dtype)
+        if executor_kind == "thread":
+            _init_decode_worker(*initargs)
+            executor = ThreadPoolExecutor(max_workers = num_workers)
+            manager = None
+            barrier = threading.Barrier(num_workers)
+        else:
+            executor = ProcessPoolExecutor(
+                max_workers = num_workers,
+                mp_context = context,
+                initializer = _init_decode_process,
+                initargs = initargs)
+            manager = context.Manager()
+            barrier = manager.Barrier(num_workers)
+        with executor:
+            # start and initialize every worker before timing
+            list(executor.map(_wait_barrier, [barrier] * num_workers))
+            bounds = np.linspace(0, len(encoded_chunks), num_workers * batches_per_worker + 1).astype(int)
+            start_time = time.perf_counter()
+            list(executor.map(_decode_range, bounds[:-1], bounds[1:]))
+            elapsed_times[num_workers] = time.perf_counter() - start_time
+        if manager is not None:
+            manager.shutdown()
+    return elapsed_times
+
+def pareto_ranks(objectives):
+    """
+    Return the non-dominated sorting rank of every row of `objectives` (larger is better in every column).
+
+    Rank 0 is the Pareto front, rank 1 the front once rank 0 is removed, and so on.
+    """
+    objectives = np.asarray(objectives, dtype = float)
+    ranks = np.full(len(objectives), -1)
+    rank = 0
+    while np.any(ranks < 0):
+        remaining = np.flatnonzero(ranks < 0)
+        for i in remaining:
+            others = objectives[remaining]
+            dominated = np.any(np.all(others >= objectives[i], axis = 1) & np.any(others > objectives[i], axis = 1))
+            if not dominated:
+                ranks[i] = rank
+        # ties are assigned in the same pass, so that every pass makes progress
+        rank += 1
+    return ranks
+
+def crowding_distance(objectives):
+    """
+    Return the crowding distance of every row of `objectives` within the set, as in NSGA-II.
+
+    The extreme rows of each column get an infinite distance, the others the sum over the columns of the
+    gap between their two neighbours divided by the range of the column. Larger is less crowded.
+    """
+    objectives = np.asarray(objectives, dtype = float)
+    distances = np.zeros(len(objectives))
+    if len(objectives) == 0:
+        return distances
+    for column in objectives.T:
+        order = np.argsort(column, kind = "stable")
+        distances[order[[0, -1]]] = np.inf
+        span = column[order[-1]] - column[order[0]]
+        # a column with unmeasured (infinite) values or a single value only marks its extremes
+        if len(column) > 2 and np.isfinite(span) and span > 0:
+            distances[order[1:-1]] += (column[order[2:]] - column[order[:-2]]) / span
+    return distances
+
+def successive_halving(src_sampled_array, conditions, initial_chunks = 4, max_chunks = None, eta = 3, repeat = 1, seed = 0, progress = None):
+    """
+    Search the conditions for the compression ratio/throughput Pareto front with successive halving.
+
+    Every condition is first measured with `benchmark_codec_pipeline` on `initial_chunks` random chunks.
+    After each round, the conditions are sorted by Pareto rank of (ratio, compression speed,
+    decompression speed), ties within a rank broken by decreasing `crowding_distance`, and the best 1/`eta`
+    survive, so that a large front is thinned to its most spread conditions. The survivors
+    are measured again on `eta` times more chunks, until `max_chunks` (default: all chunks) are used or
+    a single condition is left. The chunks of a round include those of the previous rounds, so each chunk
+    is loaded once. In the last round, 'survived' marks the Pareto front.
+
+    Parameters:
+    - src_sampled_array: dask array of the sample. It is loaded chunk by chunk.
+    - conditions: list of (compression spec, list of filter specs).
+    - progress: optional callback called after each measured condition.
+    Returns one row per measured (round, condition), with a 'survived' column.
+    """
+    rng = np.random.default_rng(seed)
+    block_indices = list(np.ndindex(src_sampled_array.numblocks))
+    order = rng.permutation(len(block_indices))
+    loaded_chunks = []
+    candidates = list(range(len(conditions)))
+    max_chunks = len(block_indices) if max_chunks is None else min(max_chunks, len(block_indices))
+    num_chunks = min(initial_chunks, max_chunks)
+    rows = []
+    round_idx = 0
+    while True:
+        while len(loaded_chunks) < num_chunks:
+            block_idx = block_indices[order[len(loaded_chunks)]]
+            loaded_chunks.append(np.ascontiguousarray(src_sampled_array.blocks[block_idx].compute()))
+        round_rows = []
+        for idx in candidates:
+            compression_name, filter_names = conditions[idx]
+            try:
+                compressor = configure_compression(compression_name)
+                filters = configure_filters(filter_names)
+                src_size, compressed_size, encoding_time, decoding_time = benchmark_codec_pipeline(
+                    loaded_chunks, compressor, filters, repeat = repeat)
+            except Exception as e:
+                print(f"\nSkipping {compression_name} {filter_names}: {e}")
+                continue
+            finally:
+                if progress is not None:
+                    progress()
+            round_rows.append({
+                "round" : round_idx,
+                "chunks" : num_chunks,
+                "condition" : idx,
+                "compression ratio" : src_size / compressed_size,
+                "compression speed (bytes/sec)" : src_size / encoding_time if encoding_time > 0 else np.nan,
+                "decompression speed (bytes/sec)" : src_size / decoding_time if decoding_time > 0 else np.nan})
+        if not round_rows:
+            break
+        objectives = [[row["compression ratio"], row["compression speed (bytes/sec)"], row["decompression speed (bytes/sec)"]] for row in round_rows]
+        # an unmeasured speed ranks last, rather than dominating every measured one
+        objectives = np.nan_to_num(objectives, nan = -np.inf)
+        ranks = pareto_ranks(objectives)
+        crowding = np.zeros(len(round_rows))
+        for rank in np.unique(ranks):
+            crowding[ranks == rank] = crowding_distance(objectives[ranks == rank])
+        num_survivors = int(np.ceil(len(round_rows) / eta))
+        survivors = set(np.lexsort((-crowding, ranks))[:num_survivors])
+        last_round = num_chunks == max_chunks or len(round_rows) == 1
+        for i, row in enumerate(round_rows):
+            row["pareto rank"] = int(ranks[i])
+            row["survived"] = i in survivors if not last_round else bool(ranks[i] == 0)
+        rows.extend(round_rows)
+        if last_round:
+            break
+        candidates = [row["condition"] for i, row in enumerate(round_rows) if i in survivors]
+        num_chunks = min(num_chunks * eta, max_chunks)
+        round_idx += 1
+    return rows
@@ -0,0 +1,82 @@
+"""
+usage: benchmark_import_time.py [-h] [--repeat REPEAT] [scripts ...]
+
+Measure the startup time of the scripts and report which codec libraries they load.
+
+positional arguments:
+    scripts     Scripts to run with '--help'. (Default: the converters and benchmark scripts)
+
+optional arguments:
+    -h, --help  show this help message and exit
+    --repeat    Number of runs per command; the fastest one is reported. (Default: 5)
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+from timeit import default_timer
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CODEC_LIBRARIES = ("nvidia", "imagecodecs", "zfpy", "pcodec", "numcodecs")
+DEFAULT_SCRIPTS = (
+    "00_data_preprocessing/convert_tcf2ngff.py",
+    "00_data_preprocessing/convert_mat73_to_ngff.py",
+    "01_compression_benchmark/benchmark_sampled_compression.py",
+)
+
+def parse_importtime(stderr):
+    """Return the total import time and the cumulative time of every loaded package (us) from `-X importtime`."""
+    total_time = 0
+    packages = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue # header line
+        # top-level imports are the least indented ones
+        if not name.startswith("  "):
+            total_time += int(cumulative)
+        if "." not in name:
+            packages[name.strip()] = int(cumulative)
+    return total_time, packages
+
+def time_command(command, repeat):
+    best_time = float("inf")
+    for _ in range(repeat):
+        start_time = default_timer()
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime"] + command,
+            cwd=ROOT_DIR,
+            capture_output=True,
+            text=True
+        )
+        end_time = default_timer()
+        best_time = min(best_time, end_time - start_time)
+    if result.returncode != 0:
+        print(f"Warning: {' '.join(command)} exited with {result.returncode}")
+    return (best_time,) + parse_importtime(result.stderr)
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure the startup time of the scripts and report which codec libraries they load."
+    )
+    parser.add_argument("scripts", type=str, nargs="*", default=DEFAULT_SCRIPTS, help="Scripts to run with '--help'.")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of runs per command.")
+    args = parser.parse_args()
+    commands = [
+        ["-c", "import utils"],
+        ["-c", "import utils; utils.configure_compression('zstd-3')"],
+        ["-c", "import utils; utils.configure_compression('blosc-lz4-5'); utils.configure_filters(['BitRound-14', 'Shuffle'])"],
+    ] + [[script, "--help"] for script in args.scripts]
+    for command in commands:
+        elapsed_time, import_time, packages = time_command(command, args.repeat)
+        loaded_codecs = [f"{name} ({packages[name] / 1e3:.0f} ms)" for name in CODEC_LIBRARIES if name in packages]
+        print(" ".join(command))
+        print(f"  wall time      : {elapsed_time * 1e3:.0f} ms")
+        print(f"  import time    : {import_time / 1e3:.0f} ms")
+        print(f"  codec libraries: {', '.join(loaded_codecs) if loaded_codecs else 'none'}")
+
+if __name__ == "__main__":
+    main()
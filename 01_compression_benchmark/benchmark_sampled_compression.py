@@ -1,6 +1,9 @@
 
 """
-usage: benchmark_sampling_lossless.py [-h] src dst compressor [filters ...]
+usage: benchmark_sampling_lossless.py [-h] [--latency-repeat N] [--latency-warmup N] [--latency-threads N] [--db DB]
+                                     [--dataset DATASET] [--cpus CPUS] [--stable] [--stable-warmup N]
+                                     [--stable-min-repeats N] [--stable-max-repeats N] [--stable-ci CI]
+                                     [--stable-outlier THRESHOLD] src dst compressor [filters ...]
 
 Benchmark lossless compression strategies after sampling chunks of experimental Zarr data.
 
@@ -11,13 +14,26 @@ positional arguments:
   filters     List of filters to apply before compression. Examples: 'FixedScaleOffset', 'Delta', 'SpatialDelta'.
 
 optional arguments:
-  -h, --help  show this help message and exit
+  -h, --help         show this help message and exit
+  --latency-repeat   Time every chunk this many times and report p50/p90/p99/max latency and CPU/wall time. (Default: 0, disabled)
+  --latency-warmup   Untimed warm-up runs per chunk. (Default: 1)
+  --latency-threads  Threads encoding/decoding chunks concurrently. (Default: 1)
+  --db               Results database (sqlite) the result is appended to.
+  --dataset          Dataset name of the run in the database. (Default: name of src)
+  --cpus             CPUs the benchmark is pinned to, e.g. '0-3,8'. (Default: all available CPUs)
+  --stable           Low-noise speeds: pre-fault the buffers, warm up and repeat the passes until the confidence
+                     interval of the speeds is tight enough, rejecting outliers, and record the CPU governor and frequency.
+  --stable-warmup    Untimed warm-up passes. (Default: 2)
+  --stable-min-repeats  Minimum timed passes. (Default: 5)
+  --stable-max-repeats  Maximum timed passes. (Default: 30)
+  --stable-ci        Target half-width of the 95% confidence interval of the speeds, relative to them. (Default: 0.02)
+  --stable-outlier   Passes farther than this many scaled median absolute deviations from the median are rejected. (Default: 3.5)
 """
 
 import argparse
-from timeit import default_timer
 import os
 import numpy as np
+import pandas as pd
 import dask.array as da
 from dask.diagnostics import Profiler
 import zarr
@@ -25,6 +41,8 @@ import sys
 from os import path
 sys.path.append(path.dirname(path.dirname(path.abspath(__file__))))
 from utils import *
+from benchmark_engine import measure_chunk_latency, decode_and_verify, load_sample, measure_stable_speed, parse_cpu_list, limit_threads
+from results_db import append_run
 
 def main(args=None, verbose=True):
     if args is None:
@@ -49,7 +67,22 @@ def main(args=None, verbose=True):
                 "'Delta', 'SpatialDelta'."
             ),
         )
+        parser.add_argument("--latency-repeat", type=int, default=0, help="Time every chunk this many times. (Default: 0, disabled)")
+        parser.add_argument("--latency-warmup", type=int, default=1, help="Untimed warm-up runs per chunk. (Default: 1)")
+        parser.add_argument("--latency-threads", type=int, default=1, help="Threads encoding/decoding chunks concurrently. (Default: 1)")
+        parser.add_argument("--db", type=str, default=None, help="Results database (sqlite) the result is appended to. (Default: None)")
+        parser.add_argument("--dataset", type=str, default=None, help="Dataset name of the run in the database. (Default: name of src)")
+        parser.add_argument("--cpus", type=str, default=None, help="CPUs the benchmark is pinned to, e.g. '0-3,8'. (Default: all available CPUs)")
+        parser.add_argument("--stable", action='store_true', help="Repeat the passes until the confidence interval of the speeds is tight enough.")
+        parser.add_argument("--stable-warmup", type=int, default=2, help="Untimed warm-up passes. (Default: 2)")
+        parser.add_argument("--stable-min-repeats", type=int, default=5, help="Minimum timed passes. (Default: 5)")
+        parser.add_argument("--stable-max-repeats", type=int, default=30, help="Maximum timed passes. (Default: 30)")
+        parser.add_argument("--stable-ci", type=float, default=0.02, help="Target relative half-width of the 95%% confidence interval of the speeds. (Default: 0.02)")
+        parser.add_argument("--stable-outlier", type=float, default=3.5, help="Outlier threshold in scaled median absolute deviations. (Default: 3.5)")
         args = parser.parse_args()
+    if getattr(args, "cpus", None) is not None:
+        # pin before the sample is read, so that the dask and codec thread pools are created on these CPUs
+        limit_threads(parse_cpu_list(args.cpus))
     # Validate source path
     src_path = args.src
     if not os.path.exists(src_path):
@@ -62,7 +95,7 @@ def main(args=None, verbose=True):
     compression = configure_compression(args.compressor)
     filters = configure_filters(args.filters)
     # read npy data
-    src_sampled_array = da.from_npy_stack(src_path)
+    src_sampled_array = load_sample(src_path)
     # Prepare benchmarking
     z = zarr.create(
         shape = src_sampled_array.shape,
@@ -86,32 +119,40 @@ def main(args=None, verbose=True):
         compression_speed = np.nan
     else:
         compression_speed = src_size / elapsed_compression_time
-    # Check the decompression speed
+    # Check the decompression speed, and the decompressed data chunk by chunk in the same pass
     # decompression does not use dask
-    if compression is not None and 'nvcomp' in compression.codec_id:
-        np_arr = np.zeros(z.shape, dtype = z.dtype)
-        start_time = default_timer()
-        np_arr[:,:,:,:,slice(0,-1)] = np.array(z[:,:,:,:,slice(0,-1)], dtype = z.dtype)
-        np_arr[:,:,:,:,-1] = np.array(z[:,:,:,:,-1], dtype = z.dtype)
-        end_time = default_timer()
-    else:
-        start_time = default_timer()
-        np_arr = np.array(z, dtype = z.dtype)
-        end_time = default_timer()
-    elapsed_decompression_time = end_time - start_time
-    
+    elapsed_decompression_time, verification_columns = decode_and_verify(z, src_sampled_array)
     if elapsed_decompression_time == 0:
         decompression_speed = np.nan
     else:
         decompression_speed = src_size / elapsed_decompression_time
-    # Check the decompressed data
-    if not da.allclose(src_sampled_array, np_arr, atol=1e-4):
+    # Replace the single-pass speeds with the low-noise ones
+    stable_columns = {}
+    if getattr(args, "stable", False):
+        stable_columns = measure_stable_speed(
+            src_sampled_array, compression, filters, warmup = args.stable_warmup, min_repeats = args.stable_min_repeats,
+            max_repeats = args.stable_max_repeats, ci_target = args.stable_ci, outlier_threshold = args.stable_outlier)
+        compression_speed = stable_columns.pop("compression speed (bytes/sec)")
+        decompression_speed = stable_columns.pop("decompression speed (bytes/sec)")
+    matched = verification_columns["max abs error"] <= 1e-4
+    if not matched:
         print("Warning: Decompressed data does not match the original data!!")
+    # Check the latency of single chunks
+    latency_columns = {}
+    if getattr(args, "latency_repeat", 0) > 0:
+        latency_columns = measure_chunk_latency(
+            src_sampled_array, compression, filters,
+            repeat = args.latency_repeat, warmup = args.latency_warmup, num_threads = args.latency_threads)
     if verbose:
         print(f"Compression ratio: {ratio:.2f}")
         print(f"Compression speed: {compression_speed:.3f} bytes/sec")
         print(f"Decompression speed: {decompression_speed:.3f} bytes/sec")
-        print("Decompressed data matches the original data.")
+        for column, value in verification_columns.items():
+            print(f"{column}: {value}")
+        for column, value in stable_columns.items():
+            print(f"{column}: {value}")
+        for column, value in latency_columns.items():
+            print(f"{column}: {value:.6f}")
     # Write the benchmark results to a file
     # Create a filename with context about compression and filters
     compression_info = args.compressor.replace("-", "_")
@@ -122,10 +163,30 @@ def main(args=None, verbose=True):
             f.write(f"Compression ratio: {ratio:.3f}\n")
             f.write(f"Compression speed: {compression_speed:.3f} bytes/sec\n")
             f.write(f"Decompression speed: {decompression_speed:.3f} bytes/sec\n")
-            f.write("Decompressed data matches the original data.\n")
+            for column, value in verification_columns.items():
+                f.write(f"{column}: {value}\n")
+            for column, value in stable_columns.items():
+                f.write(f"{column}: {value}\n")
+            for column, value in latency_columns.items():
+                f.write(f"{column}: {value:.6f}\n")
             f.write("="*10 + "\n")
             f.write(str(z.info))
-    return {"compression ratio": ratio, "compression speed": compression_speed, "decompression speed": decompression_speed}
+    result = {"compression ratio": ratio, "compression speed": compression_speed, "decompression speed": decompression_speed, **verification_columns, **stable_columns, **latency_columns}
+    if getattr(args, "db", None) is not None:
+        # same columns as the bulk benchmark tables
+        df = pd.DataFrame([{
+            "compression option" : args.compressor,
+            "filter option" : "-".join(args.filters) if args.filters else "none",
+            "compression ratio" : ratio,
+            "compression speed (bytes/sec)" : compression_speed,
+            "decompression speed (bytes/sec)" : decompression_speed,
+            **verification_columns,
+            **stable_columns,
+            **latency_columns}])
+        append_run(
+            args.db, df, "single", os.path.basename(os.path.normpath(src_path)) if args.dataset is None else args.dataset,
+            sample = os.path.abspath(src_path), arguments = vars(args), configs = [(compression, filters)])
+    return result
 
 if __name__ == "__main__":
     main()
@@ -1,16 +1,44 @@
 
 
 """
-usage: benchmark_sampling_lossless.py [-h] src dst
+usage: benchmark_sampling_lossless.py [-h] [--debug] [--workers WORKERS] [--cpus-per-worker CPUS_PER_WORKER]
+                                     [--latency-repeat N] [--latency-warmup N] [--latency-threads N]
+                                     [--store-dir STORE_DIR] [--cold-read] [--memory] [--stream WINDOW]
+                                     [--cache-dir CACHE_DIR] [--no-cache] [--db DB] [--dataset DATASET] [--cpus CPUS]
+                                     [--stable] [--stable-warmup N] [--stable-min-repeats N] [--stable-max-repeats N]
+                                     [--stable-ci CI] [--stable-outlier THRESHOLD] bench_recipe src dst
 
 Benchmark lossless compression strategies after sampling chunks of experimental Zarr data.
 
 positional arguments:
-  src         Path to the target npy file.
-  dst         Directory to save the the benchmark results.
+  bench_recipe  Path to the benchmark recipe. Its optional [[chunks]] tables re-tile the sampled blocks into each chunk shape.
+  src           Path to the target npy file.
+  dst           Directory to save the the benchmark results.
 
 optional arguments:
-  -h, --help  show this help message and exit
+  -h, --help         show this help message and exit
+  --debug            Save the decompressed data which do not match the original data.
+  --workers          Number of worker processes pinned to disjoint CPU sets (0: sized to the machine).
+  --cpus-per-worker  CPUs per worker when '--workers 0'.
+  --latency-repeat   Time every chunk this many times and add p50/p90/p99/max latency and CPU/wall time columns.
+  --latency-warmup   Untimed warm-up runs per chunk.
+  --latency-threads  Threads encoding/decoding chunks concurrently.
+  --store-dir        Directory of the on-disk stores listed in the recipe's [[stores]] tables. (Default: dst)
+  --cold-read        Evict the written store files from the page cache before reading them back.
+  --memory           Add the peak RSS (NaN outside Linux) and traced allocations of the encode and decode phases.
+  --stream           Stream the memory-mapped sample through a window of this many chunks instead of loading it in RAM.
+  --cache-dir        Directory of the result cache. (Default: dst/cache)
+  --no-cache         Measure every condition, without reading or writing the result cache.
+  --db               Results database (sqlite) the table, its per-chunk statistics and its environment are appended to.
+  --dataset          Dataset name of the run in the database. (Default: name of src)
+  --cpus             CPUs the benchmark is pinned to, e.g. '0-3,8'; the workers split them. (Default: all available CPUs)
+  --stable           Low-noise speeds: pre-fault the buffers, warm up and repeat every condition until the confidence
+                     interval of its speeds is tight enough, rejecting outliers, and record the CPU governor and frequency.
+  --stable-warmup    Untimed warm-up passes per condition. (Default: 2)
+  --stable-min-repeats  Minimum timed passes per condition. (Default: 5)
+  --stable-max-repeats  Maximum timed passes per condition. (Default: 30)
+  --stable-ci        Target half-width of the 95% confidence interval of the speeds, relative to them. (Default: 0.02)
+  --stable-outlier   Passes farther than this many scaled median absolute deviations from the median are rejected. (Default: 3.5)
 """
 
 import argparse
@@ -21,29 +49,12 @@ import sys
 from os import path
 sys.path.append(path.dirname(path.dirname(path.abspath(__file__))))
 from utils import *
-import zarr
 import dask.array as da
-from dask.diagnostics import Profiler
-from timeit import default_timer
+from benchmark_engine import read_benchmark_recipe, read_benchmark_stores, read_benchmark_chunk_shapes, retile_sample, benchmark_condition, benchmark_condition_streaming, run_conditions_parallel, split_cpu_sets, load_sample, parse_cpu_list, limit_threads
+from result_cache import sample_hash, condition_key, library_versions, host_fingerprint, load_row, store_row
+from results_db import append_run
 import os
 from glob import glob
-import tomllib
-def read_benchmark_recipe(recipe_file):
-    with open(recipe_file, 'rb') as f:
-        data = tomllib.load(f)
-    
-    compression_recipes = []
-    for comp in data['compressors']:
-        name = comp['name']
-        levels = comp['level']
-        for level in levels:
-            compression_recipes.append(f'{name}-{level}')
-    
-    filters_recipes = []
-    for filt in data['filters']:
-        filters_recipes.append(filt['name'])
-    
-    return compression_recipes, filters_recipes
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
@@ -53,96 +64,218 @@ if __name__ == "__main__":
     parser.add_argument("src", type=str, help="Path to the source npy-dask dataset.")
     parser.add_argument("dst", type=str, help="Path to the save benchmark result.")
     parser.add_argument("--debug",action='store_true', help="Activate the debug mode.")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help=(
+            "Number of worker processes, each pinned to a disjoint CPU set. "
+            "0 uses one worker per '--cpus-per-worker' CPUs. (Default: 1, sequential in this process)"
+        ),
+    )
+    parser.add_argument("--cpus-per-worker", type=int, default=4, help="CPUs per worker when '--workers 0'. (Default: 4)")
+    parser.add_argument(
+        "--latency-repeat",
+        type=int,
+        default=0,
+        help="Time the encoding/decoding of every chunk this many times and add latency columns. (Default: 0, disabled)",
+    )
+    parser.add_argument("--latency-warmup", type=int, default=1, help="Untimed warm-up runs per chunk. (Default: 1)")
+    parser.add_argument("--latency-threads", type=int, default=1, help="Threads encoding/decoding chunks concurrently. (Default: 1)")
+    parser.add_argument(
+        "--store-dir",
+        type=str,
+        default=None,
+        help="Directory of the on-disk stores listed in the recipe's [[stores]] tables. (Default: dst)",
+    )
+    parser.add_argument("--cold-read", action='store_true', help="Evict the written store files from the page cache before reading them back.")
+    parser.add_argument(
+        "--memory",
+        action='store_true',
+        help="Add the peak RSS (NaN outside Linux) and traced Python/NumPy allocations of the encode and decode phases.",
+    )
+    parser.add_argument(
+        "--stream",
+        type=int,
+        default=0,
+        metavar="WINDOW",
+        help=(
+            "Keep the sample memory-mapped and encode/decode it through a window of WINDOW chunks with reused buffers, "
+            "so that samples larger than the memory can be benchmarked. (Default: 0, the sample is loaded in RAM)"
+        ),
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=str,
+        default=None,
+        help=(
+            "Directory of the result cache. Every condition is saved there as soon as it is measured, keyed by the sample contents, "
+            "the codec configurations, the options, the library versions and the host, and reruns reuse it. (Default: dst/cache)"
+        ),
+    )
+    parser.add_argument("--no-cache", action='store_true', help="Measure every condition, without reading or writing the result cache.")
+    parser.add_argument("--db", type=str, default=None, help="Results database (sqlite) the run is appended to. (Default: None)")
+    parser.add_argument("--dataset", type=str, default=None, help="Dataset name of the run in the database. (Default: name of src)")
+    parser.add_argument("--cpus", type=str, default=None, help="CPUs the benchmark is pinned to, e.g. '0-3,8'. (Default: all available CPUs)")
+    parser.add_argument(
+        "--stable",
+        action='store_true',
+        help=(
+            "Low-noise speeds: pre-fault the buffers, warm up and repeat every condition until the confidence interval of its speeds "
+            "is tight enough, rejecting outliers, and record the CPU governor and frequency."
+        ),
+    )
+    parser.add_argument("--stable-warmup", type=int, default=2, help="Untimed warm-up passes per condition. (Default: 2)")
+    parser.add_argument("--stable-min-repeats", type=int, default=5, help="Minimum timed passes per condition. (Default: 5)")
+    parser.add_argument("--stable-max-repeats", type=int, default=30, help="Maximum timed passes per condition. (Default: 30)")
+    parser.add_argument("--stable-ci", type=float, default=0.02, help="Target relative half-width of the 95%% confidence interval of the speeds. (Default: 0.02)")
+    parser.add_argument("--stable-outlier", type=float, default=3.5, help="Outlier threshold in scaled median absolute deviations. (Default: 3.5)")
     args = parser.parse_args()
     compression_recipes, filters_recipes = read_benchmark_recipe(args.bench_recipe)
+    store_recipes = read_benchmark_stores(args.bench_recipe)
+    chunk_recipes = read_benchmark_chunk_shapes(args.bench_recipe)
     dst_path = args.dst
     os.makedirs(dst_path, exist_ok=True)
     # Validate source path
     src_path = args.src
     if not os.path.exists(src_path):
         raise FileNotFoundError(f"Error: Source path '{src_path}' does not exist.")
+    cpus = None if args.cpus is None else parse_cpu_list(args.cpus)
+    num_workers = args.workers
+    if num_workers == 0:
+        num_workers = max(1, len(split_cpu_sets(1, cpus)[0]) // args.cpus_per_worker)
+    if cpus is not None and num_workers == 1:
+        # pin before the sample is loaded, so that the dask and codec thread pools are created on these CPUs
+        limit_threads(cpus)
     # load data
-    # The data is preloaded to the memory to avoid the overhead
-    src_sampled_array_tmp = da.from_npy_stack(src_path)
+    # The data is preloaded to the memory to avoid the overhead, unless it is streamed
+    if args.stream < 0:
+        raise ValueError(f"The streaming window must be a positive number of chunks: {args.stream}")
+    stream_window = args.stream if args.stream > 0 else None
+    stable_options = None
+    if args.stable:
+        if stream_window is not None:
+            raise ValueError("The low-noise mode repeats the in-memory passes: it cannot be combined with --stream.")
+        stable_options = dict(
+            warmup = args.stable_warmup, min_repeats = args.stable_min_repeats, max_repeats = args.stable_max_repeats,
+            ci_target = args.stable_ci, outlier_threshold = args.stable_outlier)
+    src_sampled_array_tmp = load_sample(src_path)
     chunksize = src_sampled_array_tmp.chunksize
-    src_sampled_array = da.from_array(src_sampled_array_tmp.compute(), chunks=chunksize)
     # Prepare required parameters
-    zarr_condition = [(configure_compression("none"), configure_filters([]))]
+    conditions = [("none", [])]
     compression_option = ["none"]
     filter_option = ["none"]
     for compression_name in compression_recipes:
-        compressor = configure_compression(compression_name)
         for filter_name_list in filters_recipes:
             filter_name = "-".join(filter_name_list) if filter_name_list else "none"
-            filters = configure_filters(filter_name_list)
-            zarr_condition.append((compressor, filters))
+            conditions.append((compression_name, filter_name_list))
             compression_option.append(compression_name)
             filter_option.append(filter_name)
-    num_rows = len(zarr_condition)
-    compression_ratio_stack = np.zeros((num_rows,))
-    compression_speed_stack = np.zeros((num_rows,))
-    decompression_speed_stack = np.zeros((num_rows,))
-    np_arr = np.zeros(
-        shape = src_sampled_array.shape,
-        dtype = src_sampled_array.dtype
-    )
+    # Every condition is measured once in memory, then written to and read from each store of the recipe
+    store_options = None
+    if store_recipes is not None:
+        store_dir = dst_path if args.store_dir is None else args.store_dir
+        os.makedirs(store_dir, exist_ok=True)
+        store_options = [
+            dict(store_name = store_name, work_dir = store_dir, cold_read = args.cold_read)
+            for store_name in store_recipes]
+    # Every condition is repeated for each chunk shape of the recipe, re-tiled from the sampled blocks
+    chunk_shapes = None
+    chunk_option = {}
+    if chunk_recipes is not None:
+        chunk_recipes = [retile_sample(src_sampled_array_tmp, chunk_shape).chunksize for chunk_shape in chunk_recipes]
+        num_conditions = len(conditions)
+        conditions = conditions * len(chunk_recipes)
+        compression_option = compression_option * len(chunk_recipes)
+        filter_option = filter_option * len(chunk_recipes)
+        chunk_shapes = [chunk_shape for chunk_shape in chunk_recipes for _ in range(num_conditions)]
+        chunk_option = {"chunk shape" : [str(chunk_shape) for chunk_shape in chunk_shapes]}
+    debug_path = dst_path if args.debug else None
+    latency_options = None
+    if args.latency_repeat > 0:
+        latency_options = dict(repeat = args.latency_repeat, warmup = args.latency_warmup, num_threads = args.latency_threads)
+    # Look up the conditions measured by earlier runs
+    rows = [None] * len(conditions)
+    cache_keys = [None] * len(conditions)
+    cache_dir = None if args.no_cache else (os.path.join(dst_path, "cache") if args.cache_dir is None else args.cache_dir)
+    if cache_dir is not None:
+        sample_digest = sample_hash(src_path, cache_dir)
+        versions, host = library_versions(), host_fingerprint()
+        cpus_per_condition = len(split_cpu_sets(num_workers, cpus)[0])
+        for idx, (compression_name, filter_name_list) in enumerate(conditions):
+            cache_keys[idx] = condition_key(
+                sample_digest, configure_compression(compression_name), configure_filters(filter_name_list),
+                dict(
+                    chunk_shape = chunksize if chunk_shapes is None else chunk_shapes[idx],
+                    store = None if store_options is None else [{k : options[k] for k in ("store_name", "cold_read")} for options in store_options],
+                    latency = latency_options,
+                    memory = args.memory,
+                    stream_window = stream_window,
+                    stable = stable_options,
+                    cpus = cpus_per_condition),
+                versions, host)
+            rows[idx] = load_row(cache_dir, cache_keys[idx][0])
+    pending = [idx for idx, row in enumerate(rows) if row is None]
+    if len(pending) < len(conditions):
+        print(f"{len(conditions) - len(pending)} of {len(conditions)} conditions are cached in {cache_dir}")
+    def finish_condition(idx, row):
+        # persist every condition as soon as it is measured
+        rows[idx] = row
+        if cache_dir is not None:
+            store_row(cache_dir, *cache_keys[idx], row)
     # Benchmark
-    for idx ,(compressor, filters) in tqdm(enumerate(zarr_condition), unit = f" / {len(zarr_condition)}"):
-        z = zarr.create(
-            shape = src_sampled_array.shape,
-            chunks = chunksize,
-            dtype = src_sampled_array.dtype,
-            compressor = compressor,
-            filters = filters,
-            store = zarr.MemoryStore()
-        )
-        start_time = default_timer()
-        da.store(src_sampled_array, z, lock=False, compute=True, return_stored=False, scheduler="threads")
-        end_time = default_timer()
-        elapsed_compression_time = end_time - start_time
-        src_size = z.nbytes
-        compressed_size = z.nbytes_stored
-        ratio = src_size / compressed_size
-        if elapsed_compression_time == 0:
-            compression_speed = np.nan
+    if pending and num_workers == 1:
+        if stream_window is None:
+            src_sampled_array = da.from_array(src_sampled_array_tmp.compute(), chunks=chunksize)
         else:
-            compression_speed = src_size / elapsed_compression_time
-        # Check the decompression speed
-        # decompression does not use dask
-        if compressor is not None and 'nvcomp' in compressor.codec_id:
-            np_arr = np.zeros(z.shape, dtype = z.dtype)
-            start_time = default_timer()
-            np_arr[:,:,:,:,slice(0,-1)] = np.array(z[:,:,:,:,slice(0,-1)], dtype = z.dtype)
-            np_arr[:,:,:,:,-1] = np.array(z[:,:,:,:,-1], dtype = z.dtype)
-            end_time = default_timer()
-        else:
-            start_time = default_timer()
-            np_arr = np.array(z, dtype = z.dtype)
-            end_time = default_timer()
-        elapsed_decompression_time = end_time - start_time
-        
-        if elapsed_decompression_time == 0:
-            decompression_speed = np.nan
-        else:
-            decompression_speed = src_size / elapsed_decompression_time
-        # Check the decompressed data
-        if not da.allclose(src_sampled_array, np_arr, atol=1e-4):
-            print("\nDecompressed data does not match the original data.")
-            print(compression_option[idx], filter_option[idx])
-            if args.debug:
-                orig_fname = os.path.join(dst_path, f"original_data.npy")
-                if not os.path.exists(orig_fname):
-                    np.save(orig_fname, src_sampled_array.compute())
-                np.save(os.path.join(dst_path, f"decompressed_data_{compression_option[idx]}_{filter_option[idx]}.npy"),np_arr)
-        compression_ratio_stack[idx] = ratio
-        compression_speed_stack[idx] = compression_speed
-        decompression_speed_stack[idx] = decompression_speed
-        del z
+            src_sampled_array = src_sampled_array_tmp
+        for idx in tqdm(pending, unit = f" / {len(pending)}"):
+            compression_name, filter_name_list = conditions[idx]
+            compressor = configure_compression(compression_name)
+            filters = configure_filters(filter_name_list)
+            label = f"{compression_option[idx]}_{filter_option[idx]}"
+            if chunk_shapes is not None:
+                label += f"_{'x'.join(map(str, chunk_shapes[idx]))}"
+            condition_array = src_sampled_array if chunk_shapes is None else retile_sample(src_sampled_array, chunk_shapes[idx])
+            if stream_window is None:
+                row = benchmark_condition(
+                    condition_array, compressor, filters, debug_path = debug_path, label = label, latency_options = latency_options,
+                    store_options = store_options, memory = args.memory, chunk_stats = True, stable_options = stable_options)
+            else:
+                row = benchmark_condition_streaming(
+                    condition_array, compressor, filters, stream_window, label = label, latency_options = latency_options,
+                    store_options = store_options, memory = args.memory, chunk_stats = True)
+            finish_condition(idx, row)
+    elif pending:
+        with tqdm(total = len(pending), unit = " conditions") as pbar:
+            run_conditions_parallel(
+                src_sampled_array_tmp, [conditions[idx] for idx in pending], num_workers, debug_path = debug_path, latency_options = latency_options,
+                progress = pbar.update, store_options = store_options,
+                memory = args.memory, chunk_shapes = None if chunk_shapes is None else [chunk_shapes[idx] for idx in pending],
+                stream_window = stream_window, src_path = src_path, on_row = lambda j, row: finish_condition(pending[j], row),
+                chunk_stats = True, stable_options = stable_options, cpus = cpus)
+    chunk_stats = [row.pop("chunk stats") for row in rows]
+    store_option = {}
+    if store_options is not None:
+        # one table row per condition and store, sharing the in-memory columns of the condition
+        store_rows = [row.pop("store io") for row in rows]
+        indices = [idx for idx in range(len(rows)) for _ in store_recipes]
+        rows = [{**rows[idx], **store_columns} for idx, condition_store_rows in enumerate(store_rows) for store_columns in condition_store_rows]
+        conditions, compression_option, filter_option, chunk_stats = (
+            [values[idx] for idx in indices] for values in (conditions, compression_option, filter_option, chunk_stats))
+        chunk_option = {column : [values[idx] for idx in indices] for column, values in chunk_option.items()}
+        store_option = {"store option" : list(store_recipes) * len(store_rows)}
     df = pd.DataFrame({
         "compression option" : compression_option,
         "filter option" : filter_option,
-        "compression ratio" : compression_ratio_stack,
-        "compression speed (bytes/sec)" : compression_speed_stack,
-        "decompression speed (bytes/sec)" : decompression_speed_stack})
+        **store_option,
+        **chunk_option,
+        **{column : [row[column] for row in rows] for column in rows[0]}})
     csv_id = len(glob(os.path.join(dst_path,"compression_benchmark*"))) + 1
     df.to_csv(os.path.join(dst_path,f"compression_benchmark_{csv_id}.csv"),index=False)
+    if args.db is not None:
+        append_run(
+            args.db, df, "bulk", os.path.basename(os.path.normpath(src_path)) if args.dataset is None else args.dataset,
+            recipe = os.path.basename(args.bench_recipe), sample = os.path.abspath(src_path), arguments = vars(args),
+            configs = [(configure_compression(name), configure_filters(filter_names)) for name, filter_names in conditions],
+            chunk_stats = chunk_stats)
@@ -0,0 +1,190 @@
+"""
+usage: compare_benchmark_results.py [-h] [--db DB] [--threshold THRESHOLD] [--ratio-threshold RATIO_THRESHOLD]
+                                    [--alpha ALPHA] [--top TOP] [--output OUTPUT] baseline candidate
+
+Compare two sets of bulk benchmark results of the same sample and codec matrix, and fail on regressions.
+
+A result set is a compression_benchmark csv file, the directory holding them or a glob pattern, or, with --db,
+a comma-separated list of run ids of the results database. The tables of a set are repeated runs of the same
+recipe; measure them with --no-cache, as cached rows are copies of the first run.
+
+For every configuration (compression option, filter option and, if present, store option and chunk shape),
+the compression ratio and the compression and decompression speeds of the two sets are compared. The speeds
+are compared with Welch's t-test, on the spread of the repeated runs or, for a single run measured with
+--stable, on the spread implied by its confidence interval; the speeds of single runs without --stable are
+not tested. The spread within a --stable run misses the changes between runs (e.g. of the other loads of a
+shared node), so prefer repeated runs where the machine is not dedicated. The p-values are adjusted for the number of tests with the Benjamini-Hochberg procedure. The
+ratio does not change between runs of the same sample, so any change beyond --ratio-threshold is significant.
+
+A metric regresses when it drops by more than its threshold and the change is significant. Configurations
+missing from the candidate regress too. The report lists the regressions first, the largest drop first,
+and the exit status is 1 if there is any regression.
+
+positional arguments:
+  baseline      Result set of the reference run(s), e.g. the results before a library upgrade.
+  candidate     Result set of the run(s) to check.
+
+optional arguments:
+  -h, --help         show this help message and exit
+  --db               Results database; baseline and candidate are comma-separated run ids of its bulk runs.
+  --threshold        Relative speed drop counted as a regression. (Default: 0.05)
+  --ratio-threshold  Relative compression ratio drop counted as a regression. (Default: 0.001)
+  --alpha            Significance level of the adjusted p-values. (Default: 0.05)
+  --top              Number of report rows printed. (Default: 20, 0 for all)
+  --output           Optional csv file to save the full report.
+"""
+
+import argparse
+import json
+import os
+import sys
+from glob import glob
+import numpy as np
+import pandas as pd
+from scipy.stats import false_discovery_control, t as student_t, ttest_ind_from_stats
+from results_db import query_results, query_runs
+
+# columns identifying a configuration; the store and chunk columns only exist for some recipes
+KEY_COLUMNS = ("compression option", "filter option", "store option", "chunk shape")
+RATIO = "compression ratio"
+SPEEDS = {
+    "compression speed (bytes/sec)" : "compression",
+    "decompression speed (bytes/sec)" : "decompression",
+}
+# confidence of the 'speed ci (%)' columns written by the --stable mode
+STABLE_CONFIDENCE = 0.95
+# report order of the statuses
+STATUSES = ("regression", "missing", "untested", "unchanged", "improvement", "new")
+
+def read_result_set(result_set, db_path = None):
+    """Return the tables of a result set: csv files, a directory or a glob pattern of them, or run ids of the database."""
+    if db_path is not None:
+        run_ids = [int(run_id) for run_id in result_set.split(",")]
+        runs = query_runs(db_path, kind = "bulk")
+        runs = runs[runs["run_id"].isin(run_ids)]
+        if len(runs) != len(run_ids):
+            raise ValueError(f"Bulk runs {sorted(set(run_ids) - set(runs['run_id']))} are not in {db_path}.")
+        df = query_results(db_path, kind = "bulk", run_id = run_ids)
+        return [table.dropna(axis = 1, how = "all") for _, table in df.groupby("run_id")], runs
+    if os.path.isdir(result_set):
+        files = sorted(glob(os.path.join(result_set, "compression_benchmark*.csv")))
+    else:
+        files = sorted(glob(result_set))
+    if not files:
+        raise FileNotFoundError(f"No benchmark results in '{result_set}'.")
+    return [pd.read_csv(fname) for fname in files], None
+
+def summarize(tables):
+    """
+    Return the mean, the standard deviation and the number of samples of every metric of every configuration.
+
+    The spread of the speeds is the one of the repeated runs, or the one implied by the confidence interval of a
+    single run measured with --stable. It is NaN when unknown, including when repeated runs are identical copies.
+    """
+    keys = [column for column in KEY_COLUMNS if column in tables[0].columns]
+    for table in tables:
+        if table.duplicated(keys).any():
+            raise ValueError(f"The configurations of a table are not unique by {keys}.")
+    df = pd.concat(tables, ignore_index = True)
+    if df[keys].isna().any(axis = None):
+        raise ValueError(f"The tables do not share the configuration columns {keys}.")
+    summary = {}
+    for metric in (RATIO, *SPEEDS):
+        groups = df.groupby(keys, sort = False)[metric]
+        mean, std, n = groups.mean(), groups.std(ddof = 1), groups.count()
+        if metric in SPEEDS:
+            std[std == 0] = np.nan
+            phase = SPEEDS[metric]
+            if len(tables) == 1 and f"{phase} speed ci (%)" in df.columns:
+                stable = df.set_index(keys)
+                n = stable["repeats"] - stable[f"{phase} outliers"]
+                # half-width = t * std / sqrt(n)
+                std = mean * stable[f"{phase} speed ci (%)"] / 100 * np.sqrt(n) / student_t.ppf((1 + STABLE_CONFIDENCE) / 2, n - 1)
+        summary[(metric, "mean")], summary[(metric, "std")], summary[(metric, "n")] = mean, std, n
+    return pd.DataFrame(summary)
+
+def compare(baseline, candidate, threshold = 0.05, ratio_threshold = 0.001, alpha = 0.05):
+    """
+    Compare the `summarize` tables of two result sets, and return the ranked report as a DataFrame.
+
+    Every row is one metric of one configuration, with its baseline and candidate means, its relative change,
+    its p-value and Benjamini-Hochberg adjusted q-value (speeds only) and its status.
+    """
+    if list(baseline.index.names) != list(candidate.index.names):
+        raise ValueError(f"The result sets have different configuration columns: {baseline.index.names}, {candidate.index.names}")
+    report = []
+    for key in baseline.index.union(candidate.index, sort = False):
+        if key not in candidate.index or key not in baseline.index:
+            report.append(dict(zip(baseline.index.names, key), metric = "all", status = "missing" if key not in candidate.index else "new"))
+            continue
+        base, cand = baseline.loc[key], candidate.loc[key]
+        for metric in (RATIO, *SPEEDS):
+            row = dict(zip(baseline.index.names, key), metric = metric)
+            row.update(baseline = base[(metric, "mean")], candidate = cand[(metric, "mean")])
+            row["change (%)"] = 100 * (row["candidate"] / row["baseline"] - 1)
+            if metric in SPEEDS:
+                stats = (base[(metric, "mean")], base[(metric, "std")], base[(metric, "n")], cand[(metric, "mean")], cand[(metric, "std")], cand[(metric, "n")])
+                if not np.isnan(stats).any() and min(stats[2], stats[5]) >= 2:
+                    row["p-value"] = ttest_ind_from_stats(*stats, equal_var = False).pvalue
+            report.append(row)
+    report = pd.DataFrame(report).reindex(columns = [*baseline.index.names, "metric", "baseline", "candidate", "change (%)", "p-value", "q-value", "status"])
+    report["status"] = report["status"].astype(object)
+    tested = report["p-value"].notna()
+    if tested.any():
+        report.loc[tested, "q-value"] = false_discovery_control(report.loc[tested, "p-value"])
+    is_ratio = report["metric"] == RATIO
+    limit = 100 * np.where(is_ratio, ratio_threshold, threshold)
+    significant = np.where(is_ratio, True, report["q-value"] < alpha)
+    compared = report["status"].isna()
+    report.loc[compared, "status"] = "unchanged"
+    report.loc[compared & ~is_ratio & ~tested & (report["change (%)"].abs() > limit), "status"] = "untested"
+    report.loc[compared & significant & (report["change (%)"] < -limit), "status"] = "regression"
+    report.loc[compared & significant & (report["change (%)"] > limit), "status"] = "improvement"
+    report["rank"] = report["status"].map(STATUSES.index)
+    report = report.sort_values(["rank", "change (%)"], kind = "stable").drop(columns = "rank")
+    return report.reset_index(drop = True)
+
+def print_version_changes(baseline_runs, candidate_runs):
+    """Print the library versions which differ between the database runs of the two sets."""
+    def versions(runs):
+        return {library : {json.loads(run_versions)[library] for run_versions in runs["versions"]} for library in json.loads(runs["versions"].iloc[0])}
+    baseline_versions, candidate_versions = versions(baseline_runs), versions(candidate_runs)
+    for library in baseline_versions:
+        if baseline_versions[library] != candidate_versions.get(library):
+            print(f"{library}: {', '.join(map(str, baseline_versions[library]))} -> {', '.join(map(str, candidate_versions.get(library, [])))}")
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare two sets of bulk benchmark results of the same sample and codec matrix, and fail on regressions."
+    )
+    parser.add_argument("baseline", type=str, help="Result set of the reference run(s): csv file, directory or glob pattern, or run ids with --db.")
+    parser.add_argument("candidate", type=str, help="Result set of the run(s) to check.")
+    parser.add_argument("--db", type=str, default=None, help="Results database; baseline and candidate are comma-separated run ids. (Default: None)")
+    parser.add_argument("--threshold", type=float, default=0.05, help="Relative speed drop counted as a regression. (Default: 0.05)")
+    parser.add_argument("--ratio-threshold", type=float, default=0.001, help="Relative compression ratio drop counted as a regression. (Default: 0.001)")
+    parser.add_argument("--alpha", type=float, default=0.05, help="Significance level of the adjusted p-values. (Default: 0.05)")
+    parser.add_argument("--top", type=int, default=20, help="Number of report rows printed. (Default: 20, 0 for all)")
+    parser.add_argument("--output", type=str, default=None, help="Optional csv file to save the full report.")
+    args = parser.parse_args()
+    baseline_tables, baseline_runs = read_result_set(args.baseline, args.db)
+    candidate_tables, candidate_runs = read_result_set(args.candidate, args.db)
+    if args.db is not None:
+        samples = set(baseline_runs["sample"]) | set(candidate_runs["sample"])
+        if len(samples) > 1:
+            raise ValueError(f"The runs benchmark different samples: {sorted(samples)}")
+        print_version_changes(baseline_runs, candidate_runs)
+    report = compare(
+        summarize(baseline_tables), summarize(candidate_tables),
+        threshold = args.threshold, ratio_threshold = args.ratio_threshold, alpha = args.alpha)
+    if args.output is not None:
+        report.to_csv(args.output, index = False)
+    counts = report["status"].value_counts()
+    print(f"{len(baseline_tables)} baseline and {len(candidate_tables)} candidate run(s): "
+          + ", ".join(f"{counts[status]} {status}" for status in STATUSES if status in counts))
+    with pd.option_context("display.max_columns", None, "display.width", 200):
+        print(report if args.top == 0 else report.head(args.top))
+    if counts.get("regression", 0) + counts.get("missing", 0) > 0:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
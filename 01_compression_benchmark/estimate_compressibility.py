@@ -0,0 +1,267 @@
+"""
+usage: estimate_compressibility.py fit [-h] [--chunks CHUNKS] [--seed SEED] model (--pair SAMPLE RESULTS)...
+       estimate_compressibility.py predict [-h] [--chunks CHUNKS] [--seed SEED] model src [dst]
+
+Estimate the compression ratio of every codec from cheap statistics of a few chunks.
+
+The statistics are the byte and bit-plane entropies, the byte-plane entropy of the first-order
+residuals along x, the share of zero mantissa bits after BitRound and the share of zeros. `fit`
+computes them on random chunks of benchmark samples, compresses the same chunks with every condition
+of their bulk benchmark results, and fits, for every codec family (compressor without its level),
+filter list and, if the results have them, chunk shape and store option, a ridge regression of the
+log ratio of every chunk. `predict` computes them on random chunks of a new dataset and returns the
+estimated ratio of every benchmarked condition, the ratio of the total size of the chunks.
+
+subcommands:
+  fit      Fit the predictors from benchmark samples and their bulk benchmark results.
+           model     Path of the model file (json) to write.
+           --pair    Benchmark sample and its result, a compression_benchmark csv file or the directory holding them. Repeatable.
+  predict  Estimate the ratios of a new dataset.
+           model     Path of the model file written by 'fit'.
+           src       Benchmark sample, Zarr array or OME-Zarr image.
+           dst       Optional csv file to save the estimates.
+
+optional arguments:
+  -h, --help  show this help message and exit
+  --chunks    Number of random chunks the statistics are computed on. (Default: 16)
+  --seed      Seed of the chunk selection. (Default: 0)
+"""
+
+import argparse
+import ast
+import json
+import os
+from glob import glob
+import numpy as np
+import pandas as pd
+import dask.array as da
+import zarr
+from numcodecs import BitRound
+from numcodecs.compat import ensure_contiguous_ndarray
+from benchmark_engine import load_sample, encode_chunk, retile_sample, SAMPLE_MANIFEST
+from utils import configure_compression, configure_filters
+from utils.codec_registry import split_filter_option
+
+FEATURES = (
+    "byte entropy",
+    "byte-plane entropy",
+    "bit-plane entropy",
+    "residual byte-plane entropy",
+    "zero mantissa share",
+    "zero share",
+)
+BITROUND_KEEPBITS = 14
+RIDGE_ALPHA = 1e-2
+# result columns whose values are fitted by separate models
+LAYOUT_COLUMNS = ("chunk shape", "store option")
+
+def load_dataset(src_path):
+    """Open a benchmark sample, a Zarr array or the full-resolution array of an OME-Zarr image as a dask array."""
+    if os.path.exists(os.path.join(src_path, SAMPLE_MANIFEST)) or os.path.exists(os.path.join(src_path, "info")):
+        return load_sample(src_path)
+    z = zarr.open(src_path, mode = "r")
+    if isinstance(z, zarr.hierarchy.Group):
+        z = z[z.attrs["multiscales"][0]["datasets"][0]["path"]] if "multiscales" in z.attrs else z["0"]
+    return da.from_zarr(z)
+
+def entropy(counts, axis = -1):
+    """Shannon entropy in bits of histograms along `axis`."""
+    total = counts.sum(axis = axis, keepdims = True)
+    p = counts / np.maximum(total, 1)
+    with np.errstate(divide = "ignore", invalid = "ignore"):
+        return -np.sum(np.where(p > 0, p * np.log2(p), 0), axis = axis)
+
+def byte_plane_entropy(bits):
+    """Mean entropy (bits/byte) of the byte positions of the unsigned integer array `bits`."""
+    planes = bits.reshape(-1, 1).view("u1") # value, byte position
+    counts = np.stack([np.bincount(plane, minlength = 256) for plane in planes.T])
+    return float(entropy(counts).mean())
+
+def chunk_features(chunk):
+    """Return the statistics of `FEATURES` for one chunk."""
+    values = np.ascontiguousarray(chunk)
+    itemsize = values.dtype.itemsize
+    bits = values.view(f"<u{itemsize}")
+    byte_counts = np.bincount(bits.view("u1").reshape(-1), minlength = 256)
+    bit_ones = np.unpackbits(bits.reshape(-1, 1).view("u1"), axis = 1).mean(axis = 0)
+    bit_counts = np.stack([1 - bit_ones, bit_ones], axis = -1)
+    residual = bits[..., 1:] - bits[..., :-1] # wraps around like Delta on the bit pattern
+    if values.dtype == np.float32:
+        rounded = BitRound(keepbits = BITROUND_KEEPBITS).encode(values).view("<u4")
+        mantissa = (rounded & np.uint32((1 << 23) - 1)).reshape(-1, 1).view("u1")
+        zero_mantissa_share = 1 - float(np.unpackbits(mantissa, axis = 1).sum()) / (mantissa.shape[0] * 23)
+    else:
+        zero_mantissa_share = 1.0 # no mantissa to round
+    return np.array([
+        float(entropy(byte_counts)),
+        byte_plane_entropy(bits),
+        float(entropy(bit_counts).mean()),
+        byte_plane_entropy(np.ascontiguousarray(residual)),
+        zero_mantissa_share,
+        float(np.count_nonzero(values == 0)) / values.size,
+    ])
+
+def select_chunks(src_array, num_chunks = 16, seed = 0):
+    """Return `num_chunks` random chunks of a dask array as contiguous numpy arrays."""
+    block_indices = list(np.ndindex(src_array.numblocks))
+    rng = np.random.default_rng(seed)
+    selected = rng.permutation(len(block_indices))[:num_chunks]
+    return [np.ascontiguousarray(src_array.blocks[block_indices[i]].compute()) for i in selected]
+
+def split_level(compression_option):
+    """Split a compressor spec into its family and its numeric level, e.g. 'blosc-zstd-5' -> ('blosc-zstd', 5)."""
+    family, _, level = compression_option.rpartition("-")
+    try:
+        return family, float(level)
+    except ValueError:
+        return compression_option, 0.0
+
+def read_results(results_path):
+    """Read a compression_benchmark csv file, or all of them in a directory."""
+    if os.path.isdir(results_path):
+        files = sorted(glob(os.path.join(results_path, "compression_benchmark*.csv")))
+    else:
+        files = [results_path]
+    if not files:
+        raise FileNotFoundError(f"No benchmark results in '{results_path}'.")
+    return pd.concat([pd.read_csv(fname) for fname in files], ignore_index = True)
+
+def fit_ridge(x, y, alpha = RIDGE_ALPHA):
+    """Fit y ~ x by ridge regression on standardized columns, and return the model as a dict."""
+    mean = x.mean(axis = 0)
+    scale = x.std(axis = 0)
+    scale[scale == 0] = 1
+    x_std = (x - mean) / scale
+    intercept = y.mean()
+    coef = np.linalg.solve(x_std.T @ x_std + alpha * np.eye(x.shape[1]), x_std.T @ (y - intercept))
+    residual = y - (x_std @ coef + intercept)
+    return dict(
+        mean = mean.tolist(), scale = scale.tolist(), coef = coef.tolist(), intercept = float(intercept),
+        rmse = float(np.sqrt(np.mean(residual ** 2))), samples = len(y))
+
+def predict_ridge(model, x):
+    x_std = (np.asarray(x) - np.array(model["mean"])) / np.array(model["scale"])
+    return x_std @ np.array(model["coef"]) + model["intercept"]
+
+def fit(pairs, num_chunks, seed):
+    """
+    Fit one predictor of the log chunk ratio per (codec family, filter option, chunk shape, store option)
+    from (sample, results) pairs.
+
+    Every condition of the results compresses the same `num_chunks` random chunks of the sample, re-tiled
+    into the chunk shape of the condition, and every chunk is one training row.
+    """
+    rows = []
+    for sample_path, results_path in pairs:
+        src_array = load_dataset(sample_path)
+        results = read_results(results_path)
+        layout = [column for column in LAYOUT_COLUMNS if column in results.columns]
+        chunk_sets = {} # chunk shape -> (chunks, their features)
+        chunk_ratios = {} # (compression option, filter option, chunk shape) -> ratio of every chunk
+        for _, result in results[["compression option", "filter option", *layout]].drop_duplicates().iterrows():
+            chunk_shape = result.get("chunk shape")
+            if chunk_shape not in chunk_sets:
+                chunk_array = src_array if chunk_shape is None else retile_sample(src_array, ast.literal_eval(chunk_shape))
+                chunks = select_chunks(chunk_array, num_chunks, seed)
+                chunk_sets[chunk_shape] = chunks, [chunk_features(chunk) for chunk in chunks]
+            chunks, features = chunk_sets[chunk_shape]
+            condition = (result["compression option"], result["filter option"], chunk_shape)
+            if condition not in chunk_ratios:
+                compressor = configure_compression(result["compression option"])
+                filters = configure_filters(split_filter_option(result["filter option"]))
+                chunk_ratios[condition] = [chunk.nbytes / ensure_contiguous_ndarray(encode_chunk(chunk, compressor, filters)).nbytes for chunk in chunks]
+            family, level = split_level(result["compression option"])
+            for chunk_features_row, ratio in zip(features, chunk_ratios[condition]):
+                rows.append((family, result["filter option"], chunk_shape, result.get("store option"), level, result["compression option"], chunk_features_row, ratio))
+    columns = ["family", "filter", "chunk shape", "store option", "level", "option", "features", "ratio"]
+    models = {}
+    for (family, filter_option, chunk_shape, store_option), group in pd.DataFrame(rows, columns = columns).groupby(
+            ["family", "filter", "chunk shape", "store option"], dropna = False):
+        chunk_shape = None if pd.isna(chunk_shape) else chunk_shape
+        store_option = None if pd.isna(store_option) else store_option
+        x = np.array([np.append(features, level) for features, level in zip(group["features"], group["level"])])
+        name = "|".join(part for part in (family, filter_option, chunk_shape, store_option) if part is not None)
+        models[name] = dict(
+            family = family,
+            filter_option = filter_option,
+            chunk_shape = chunk_shape,
+            store_option = store_option,
+            options = {str(level) : option for level, option in zip(group["level"], group["option"])},
+            **fit_ridge(x, np.log(group["ratio"].to_numpy(dtype = float))))
+    return dict(features = list(FEATURES) + ["level"], num_chunks = num_chunks, models = models)
+
+def predict(model_data, src_array, num_chunks, seed):
+    """
+    Return the estimated ratio of every condition of the model for a dask array.
+
+    The chunks are re-chunked into the chunk shape of the models which have one. The ratio of a condition
+    is the total size of the selected chunks over the sum of their estimated compressed sizes.
+    """
+    chunk_sets = {} # chunk shape -> (size, features) of the selected chunks
+    rows = []
+    for model in model_data["models"].values():
+        chunk_shape = model.get("chunk_shape")
+        if chunk_shape not in chunk_sets:
+            chunk_array = src_array if chunk_shape is None else src_array.rechunk(ast.literal_eval(chunk_shape)[-src_array.ndim:])
+            chunks = select_chunks(chunk_array, num_chunks, seed)
+            chunk_sets[chunk_shape] = np.array([chunk.nbytes for chunk in chunks]), np.array([chunk_features(chunk) for chunk in chunks])
+        sizes, features = chunk_sets[chunk_shape]
+        for level, option in sorted(model["options"].items(), key = lambda item: float(item[0])):
+            log_ratios = predict_ridge(model, np.column_stack([features, np.full(len(features), float(level))]))
+            row = {
+                "compression option" : option,
+                "filter option" : model["filter_option"]}
+            for column in LAYOUT_COLUMNS:
+                if model.get(column.replace(" ", "_")) is not None:
+                    row[column] = model[column.replace(" ", "_")]
+            rows.append({
+                **row,
+                "estimated compression ratio" : float(sizes.sum() / np.sum(sizes / np.exp(log_ratios))),
+                "fit rmse (log ratio)" : model["rmse"],
+                "training samples" : model["samples"]})
+    return pd.DataFrame(rows).sort_values("estimated compression ratio", ascending = False)
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Estimate the compression ratio of every codec from cheap statistics of a few chunks."
+    )
+    subparsers = parser.add_subparsers(dest = "command", required = True)
+    fit_parser = subparsers.add_parser("fit", help = "Fit the predictors from benchmark samples and their bulk benchmark results.")
+    fit_parser.add_argument("model", type=str, help="Path of the model file (json) to write.")
+    fit_parser.add_argument(
+        "--pair",
+        nargs=2,
+        action="append",
+        required=True,
+        metavar=("SAMPLE", "RESULTS"),
+        help="Benchmark sample and its result, a compression_benchmark csv file or the directory holding them.",
+    )
+    predict_parser = subparsers.add_parser("predict", help = "Estimate the ratios of a new dataset.")
+    predict_parser.add_argument("model", type=str, help="Path of the model file written by 'fit'.")
+    predict_parser.add_argument("src", type=str, help="Benchmark sample, Zarr array or OME-Zarr image.")
+    predict_parser.add_argument("dst", type=str, nargs="?", default=None, help="Optional csv file to save the estimates.")
+    for subparser in (fit_parser, predict_parser):
+        subparser.add_argument("--chunks", type=int, default=16, help="Number of random chunks the statistics are computed on. (Default: 16)")
+        subparser.add_argument("--seed", type=int, default=0, help="Seed of the chunk selection. (Default: 0)")
+    args = parser.parse_args()
+    if args.command == "fit":
+        for sample_path, results_path in args.pair:
+            for checked_path in (sample_path, results_path):
+                if not os.path.exists(checked_path):
+                    raise FileNotFoundError(f"Error: Path '{checked_path}' does not exist.")
+        model_data = fit(args.pair, args.chunks, args.seed)
+        with open(args.model, "w") as f:
+            json.dump(model_data, f, indent = 2)
+        print(f"{len(model_data['models'])} predictors saved to {args.model}")
+    else:
+        if not os.path.exists(args.src):
+            raise FileNotFoundError(f"Error: Source path '{args.src}' does not exist.")
+        with open(args.model) as f:
+            model_data = json.load(f)
+        df = predict(model_data, load_dataset(args.src), args.chunks, args.seed)
+        print(df.to_string(index = False))
+        if args.dst is not None:
+            df.to_csv(args.dst, index = False)
+
+if __name__ == "__main__":
+    main()
@@ -1,38 +1,96 @@
 """
-usage: generate_benchmark_sample.py [-h] src dst numbers
+usage: generate_benchmark_sample.py [-h] [--channel CHANNEL] [--recipe RECIPE] [--seed SEED] [--threads THREADS]
+                                    [--strata STRATA] [--per-stratum PER_STRATUM] [--medium-ri MEDIUM_RI]
+                                    [--threshold THRESHOLD] [--metric-level METRIC_LEVEL]
+                                    src dst numbers chunk_shape edge_padding
 
-Sample chunks of experimental Zarr data and save them in npy format.
+Sample chunks of experimental Zarr data and save them in a memory-mapped npy file.
+
+The sampled chunks are read concurrently into `dst/sample.npy`, stacked along the first axis.
+`dst/manifest.json` records the chunk shape and, for every sampled chunk, its stratum, its
+foreground fraction and its source coordinates. Open the sample with `benchmark_engine.load_sample`.
+
+With --strata, the chunks are grouped by their foreground fraction, the share of voxels whose
+value exceeds the medium RI by more than a threshold, and every group is sampled separately.
+The fraction is computed on a low-resolution level of the image, so that stratifying does not
+read the full-resolution data.
 
 positional arguments:
     src         Path to the source Zarr dataset.
-    dst         Path to the dst npy file.
-    numbers     Number of chunks to sample.
-    chunk_shape Chunk shape.
+    dst         Directory to save the sample.
+    numbers     Number of chunks to sample. With --strata, they are split evenly across the strata.
+    chunk_shape Chunk shape. Use '(1,9,...)' on the 9-channel tensor datasets, so that ChannelSymmetry sees whole tensors.
     edge_padding    Number pixels not to be selected
     --channel     Selected channel (Default: None)
+    --recipe      Benchmark recipe whose [[chunks]] shapes the sampled blocks must tile. The blocks become
+                  super-blocks, the per-axis least common multiple of these shapes and chunk_shape.
+    --seed        Seed of the chunk selection. (Default: 12345)
+    --threads     Threads reading the chunks. (Default: 8)
+    --strata      Foreground fraction edges of the strata, e.g. '0.05,0.5' for [0,0.05), [0.05,0.5) and [0.5,1].
+    --per-stratum Number of chunks per stratum, e.g. '256,512,256'. Overrides `numbers`.
+    --medium-ri   Value of the medium. (Default: median of the metric level)
+    --threshold   Foreground voxels exceed the medium RI by more than this. (Default: 0.005)
+    --metric-level  Resolution level the foreground fraction is computed on. (Default: -1, the lowest resolution)
 
 optional arguments:
     -h, --help  show this help message and exit
 """
 
 import argparse
+import json
 import os
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-import dask.array as da
 from ome_zarr.io import parse_url
 from ome_zarr.reader import Reader
-from numcodecs import *
+import sys
+from os import path
+sys.path.append(path.dirname(path.abspath(__file__)))
+from benchmark_engine import read_benchmark_chunk_shapes, superblock_shape, SAMPLE_FILE, SAMPLE_MANIFEST
+
+def foreground_fractions(metric_data, full_shape, chunk_shape, chunk_dim, src_offset, medium_ri, threshold):
+    """
+    Return the foreground fraction of every chunk of the chunk grid, in C order.
+
+    `metric_data` is a low-resolution version of the image of shape `full_shape`; the chunk regions,
+    given in the full-resolution coordinates shifted by `src_offset`, are scaled to its grid.
+    """
+    foreground = np.asarray(metric_data) > medium_ri + threshold
+    scales = [m / f for m, f in zip(foreground.shape, full_shape)]
+    fractions = np.empty(int(np.prod(chunk_dim)))
+    for linear_idx, chunk_idx in enumerate(np.ndindex(*chunk_dim)):
+        region = []
+        for i, scale, size, offset in zip(chunk_idx, scales, chunk_shape, src_offset):
+            start = int(np.floor((offset + i * size) * scale))
+            stop = max(int(np.ceil((offset + (i + 1) * size) * scale)), start + 1)
+            region.append(slice(start, stop))
+        fractions[linear_idx] = foreground[tuple(region)].mean()
+    return fractions
+
+def select_chunks(rng, candidates, number, stratum_name):
+    """Pick `number` chunks of `candidates` at random, or all of them if there are fewer."""
+    if number > len(candidates):
+        print(f"Stratum {stratum_name} holds {len(candidates)} chunks only, fewer than {number}: all are selected.")
+    return candidates[rng.permutation(len(candidates))[:number]]
 
 def main():
     parser = argparse.ArgumentParser(
-        description="Sample chunks of experimental Zarr data and save them in npy format."
+        description="Sample chunks of experimental Zarr data and save them in a memory-mapped npy file."
     )
     parser.add_argument("src", type=str, help="Path to the source Zarr dataset.")
-    parser.add_argument("dst", type=str, help="Path to the dst npy file.")
+    parser.add_argument("dst", type=str, help="Directory to save the sample.")
     parser.add_argument("numbers", type=int, help="Number of chunks to sample.")
     parser.add_argument("chunk_shape", help="Chunk shape.")
     parser.add_argument("edge_padding", default = "(0,0,0,0,0)", help="Number pixels not to be selected")
     parser.add_argument("--channel", type=int, help="Selected channel.")
+    parser.add_argument("--recipe", type=str, default=None, help="Benchmark recipe whose [[chunks]] shapes the sampled blocks must tile.")
+    parser.add_argument("--seed", type=int, default=12345, help="Seed of the chunk selection. (Default: 12345)")
+    parser.add_argument("--threads", type=int, default=8, help="Threads reading the chunks. (Default: 8)")
+    parser.add_argument("--strata", type=str, default=None, help="Foreground fraction edges of the strata, e.g. '0.05,0.5'.")
+    parser.add_argument("--per-stratum", type=str, default=None, help="Number of chunks per stratum, e.g. '256,512,256'.")
+    parser.add_argument("--medium-ri", type=float, default=None, help="Value of the medium. (Default: median of the metric level)")
+    parser.add_argument("--threshold", type=float, default=0.005, help="Foreground voxels exceed the medium RI by more than this. (Default: 0.005)")
+    parser.add_argument("--metric-level", type=int, default=-1, help="Resolution level the foreground fraction is computed on. (Default: -1)")
     args = parser.parse_args()
     # Validate source path
     src_path = args.src
@@ -42,14 +100,20 @@ def main():
     reader = Reader(parse_url(src_path, mode = "r"))
     node = list(reader())[0]
     src_data = node.data[0]
+    full_shape = src_data.shape
     padding_pixel = eval(args.edge_padding)
     src_slices = tuple(slice(pad_index, -pad_index if pad_index != 0 else None) for pad_index in padding_pixel)
     src_data = src_data[src_slices] # prevent potential errors merged at stitching
+    pad_offset = list(padding_pixel)
+    src_offset = list(padding_pixel) # origin of src_data in the source image
     if args.channel is not None:
         src_data = src_data[:,args.channel:args.channel+1,:,:,:]
+        src_offset[1] += args.channel
     # Define chunk: check whether 'channel' axes exists
-    # First, get the `args.numbers` number of chunks' indices randomly.
     input_chunk_shape = eval(args.chunk_shape)
+    if args.recipe is not None:
+        input_chunk_shape = superblock_shape([input_chunk_shape] + (read_benchmark_chunk_shapes(args.recipe) or []))
+        print(f"super-block shape : {input_chunk_shape}")
     chunk_shape = input_chunk_shape[-node.data[0].ndim:]
     chunk_dim = [src_data.shape[i] // chunk_shape[i] for i in range(node.data[0].ndim)]
     print(f"src data size : {src_data.shape}")
@@ -57,20 +121,79 @@ def main():
     if num_of_chunk <= 0:
         raise ValueError("The number of chunks to sample must be a positive integer.")
     total_chunks = np.prod(chunk_dim)
-    if num_of_chunk > total_chunks:
-        raise ValueError(f"The number of chunks to sample ({num_of_chunk}) exceeds the total number of chunks ({total_chunks}).")
-    rng = np.random.default_rng(12345)
-    linear_chunk_indices = rng.permutation(np.prod(chunk_dim))[:num_of_chunk]
-    chunk_indices = np.unravel_index(linear_chunk_indices, chunk_dim)
-    # Second, generate the src_array containing the sampled chunks.
-    src_chunk_list = []
-    for chunk_idx in zip(*chunk_indices):
+    rng = np.random.default_rng(args.seed)
+    # First, get the indices of the sampled chunks, per stratum.
+    if args.strata is None:
+        if num_of_chunk > total_chunks:
+            raise ValueError(f"The number of chunks to sample ({num_of_chunk}) exceeds the total number of chunks ({total_chunks}).")
+        fractions = None
+        strata = [(None, rng.permutation(total_chunks)[:num_of_chunk])]
+    else:
+        edges = [float(edge) for edge in args.strata.split(",")]
+        if edges != sorted(edges) or not all(0 < edge < 1 for edge in edges):
+            raise ValueError(f"Stratum edges must increase within (0, 1): {args.strata}")
+        if args.per_stratum is not None:
+            per_stratum = [int(number) for number in args.per_stratum.split(",")]
+            if len(per_stratum) != len(edges) + 1:
+                raise ValueError(f"{len(edges) + 1} strata need {len(edges) + 1} sample sizes, got {args.per_stratum}.")
+        else:
+            per_stratum = [len(part) for part in np.array_split(np.arange(num_of_chunk), len(edges) + 1)]
+        metric_data = node.data[args.metric_level]
+        if args.channel is not None:
+            metric_data = metric_data[:,args.channel:args.channel+1]
+        metric_data = np.asarray(metric_data)
+        metric_shape = list(full_shape)
+        if args.channel is not None:
+            metric_shape[1] = 1
+        medium_ri = float(np.median(metric_data)) if args.medium_ri is None else args.medium_ri
+        print(f"medium RI : {medium_ri}, foreground above {medium_ri + args.threshold}")
+        fractions = foreground_fractions(metric_data, metric_shape, chunk_shape, chunk_dim, pad_offset, medium_ri, args.threshold)
+        stratum_ids = np.digitize(fractions, edges)
+        bounds = [0.0] + edges + [1.0]
+        strata = []
+        for stratum_id, number in enumerate(per_stratum):
+            stratum_name = f"[{bounds[stratum_id]}, {bounds[stratum_id + 1]}{']' if stratum_id == len(edges) else ')'}"
+            candidates = np.flatnonzero(stratum_ids == stratum_id)
+            strata.append((stratum_name, select_chunks(rng, candidates, number, stratum_name)))
+            print(f"stratum {stratum_name} : {len(strata[-1][1])} of {len(candidates)} chunks")
+    # Second, read the sampled chunks concurrently into the preallocated sample file.
+    sampled = [(stratum_name, linear_idx) for stratum_name, linear_indices in strata for linear_idx in linear_indices]
+    if not sampled:
+        raise ValueError("No chunk was sampled.")
+    os.makedirs(args.dst, exist_ok = True)
+    sample_shape = (len(sampled) * chunk_shape[0],) + tuple(chunk_shape[1:])
+    sample = np.lib.format.open_memmap(os.path.join(args.dst, SAMPLE_FILE), mode = "w+", dtype = src_data.dtype, shape = sample_shape)
+    manifest_chunks = []
+    for sample_idx, (stratum_name, linear_idx) in enumerate(sampled):
+        chunk_idx = np.unravel_index(linear_idx, chunk_dim)
+        start = [int(i * size) for i, size in zip(chunk_idx, chunk_shape)]
+        manifest_chunks.append({
+            "sample index" : sample_idx,
+            "stratum" : stratum_name,
+            "foreground fraction" : None if fractions is None else float(fractions[linear_idx]),
+            "source start" : [s + offset for s, offset in zip(start, src_offset)],
+            "source stop" : [s + size + offset for s, size, offset in zip(start, chunk_shape, src_offset)]})
+    def read_chunk(sample_idx):
+        chunk_idx = np.unravel_index(sampled[sample_idx][1], chunk_dim)
         src_chunk = src_data[tuple(slice(chunk_idx[j]*chunk_shape[j], (chunk_idx[j]+1)*chunk_shape[j]) for j in range(node.data[0].ndim))]
-        src_chunk_list.append(src_chunk)
-    src_sampled_array = da.concatenate(src_chunk_list, axis=0)
-    src_sampled_array = src_sampled_array.rechunk(chunk_shape)
-    # Save the sampled chunks to npy file
-    da.to_npy_stack(args.dst, src_sampled_array, axis = 0)
+        sample[sample_idx*chunk_shape[0]:(sample_idx+1)*chunk_shape[0]] = src_chunk.compute(scheduler = "synchronous")
+    with ThreadPoolExecutor(max_workers = args.threads) as executor:
+        list(executor.map(read_chunk, range(len(sampled))))
+    sample.flush()
+    del sample
+    with open(os.path.join(args.dst, SAMPLE_MANIFEST), "w") as f:
+        json.dump({
+            "file" : SAMPLE_FILE,
+            "source" : os.path.abspath(src_path),
+            "chunk_shape" : [int(size) for size in chunk_shape],
+            "edge_padding" : list(padding_pixel),
+            "channel" : args.channel,
+            "seed" : args.seed,
+            "strata" : args.strata,
+            "medium_ri" : None if fractions is None else medium_ri,
+            "threshold" : None if fractions is None else args.threshold,
+            "metric_level" : None if fractions is None else args.metric_level,
+            "chunks" : manifest_chunks}, f, indent = 2)
     print(f"Sampled chunks saved to {args.dst}")
 
 if __name__ == "__main__":
@@ -0,0 +1,138 @@
+"""
+Content-addressed cache of benchmark table rows.
+
+A row is stored under the hash of everything it depends on: the contents of the sample,
+the canonical configuration (`get_config()`) of the compressor and the filters, the
+measurement options, the versions of the codec libraries and a fingerprint of the host.
+Rows are written one file per condition as soon as they are measured, so that an
+interrupted run keeps its finished conditions, and a rerun or an extended recipe only
+measures the conditions which are not cached yet.
+"""
+
+import hashlib
+import json
+import os
+import platform
+from importlib import metadata
+import numpy as np
+
+CACHE_VERSION = 2 # 2: rows hold their chunk stats
+# distributions whose version changes the measured rows
+LIBRARIES = ("numcodecs", "zarr", "numpy", "dask", "imagecodecs", "imagecodecs-numcodecs", "pcodec", "zfpy", "nvidia-nvcomp-cu11")
+SAMPLE_HASHES = "sample_hashes.json"
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    return str(value)
+
+def _canonical(value):
+    return json.dumps(value, sort_keys = True, default = _json_default)
+
+def library_versions():
+    """Return the installed version of every distribution of `LIBRARIES`, None if it is missing."""
+    versions = {}
+    for library in LIBRARIES:
+        try:
+            versions[library] = metadata.version(library)
+        except metadata.PackageNotFoundError:
+            versions[library] = None
+    return versions
+
+def host_fingerprint():
+    """Return the host properties which change the measured speeds."""
+    cpu_model = platform.processor()
+    if os.path.exists("/proc/cpuinfo"):
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                if line.startswith("model name"):
+                    cpu_model = line.split(":", 1)[1].strip()
+                    break
+    return dict(
+        node = platform.node(),
+        system = platform.system(),
+        machine = platform.machine(),
+        cpu_model = cpu_model,
+        cpu_count = os.cpu_count(),
+        python = platform.python_version())
+
+def _sample_files(src_path):
+    # data files of a sample; the manifest is left out as it records where the sample was taken from
+    return sorted(
+        os.path.join(dirpath, fname)
+        for dirpath, _, fnames in os.walk(src_path)
+        for fname in fnames
+        if fname != "manifest.json")
+
+def sample_hash(src_path, cache_dir = None):
+    """
+    Return the hash of the contents of a benchmark sample directory.
+
+    Hashing reads the whole sample, so the hash is remembered in `cache_dir` under the size and
+    modification time of the sample files, and only recomputed when they change.
+    """
+    files = _sample_files(src_path)
+    stat_key = hashlib.sha256(_canonical([
+        (os.path.relpath(fname, src_path), os.path.getsize(fname), os.stat(fname).st_mtime_ns) for fname in files
+    ]).encode()).hexdigest()
+    hashes = {}
+    hashes_fname = None if cache_dir is None else os.path.join(cache_dir, SAMPLE_HASHES)
+    if hashes_fname is not None and os.path.exists(hashes_fname):
+        with open(hashes_fname) as f:
+            hashes = json.load(f)
+        if stat_key in hashes:
+            return hashes[stat_key]
+    digest = hashlib.blake2b(digest_size = 32)
+    for fname in files:
+        digest.update(os.path.relpath(fname, src_path).encode())
+        with open(fname, "rb") as f:
+            for block in iter(lambda: f.read(1 << 24), b""):
+                digest.update(block)
+    content_hash = digest.hexdigest()
+    if hashes_fname is not None:
+        os.makedirs(cache_dir, exist_ok = True)
+        hashes[stat_key] = content_hash
+        _write_json(hashes_fname, hashes)
+    return content_hash
+
+def condition_key(sample_digest, compressor, filters, options, versions = None, host = None):
+    """
+    Return the cache key of a condition.
+
+    Parameters:
+    - sample_digest: `sample_hash` of the sample.
+    - compressor, filters: numcodecs codecs of the condition.
+    - options: dict of every other setting which changes the row (chunk shape, store, latency options, ...).
+    - versions, host: `library_versions` and `host_fingerprint`, computed if not given.
+    """
+    description = dict(
+        cache_version = CACHE_VERSION,
+        sample = sample_digest,
+        compressor = None if compressor is None else compressor.get_config(),
+        filters = [f.get_config() for f in filters or []],
+        options = options,
+        versions = library_versions() if versions is None else versions,
+        host = host_fingerprint() if host is None else host)
+    return hashlib.sha256(_canonical(description).encode()).hexdigest(), description
+
+def _write_json(fname, data):
+    # write atomically, so that an interrupted run never leaves a truncated file
+    tmp_fname = f"{fname}.{os.getpid()}.tmp"
+    with open(tmp_fname, "w") as f:
+        json.dump(data, f, default = _json_default)
+    os.replace(tmp_fname, fname)
+
+def load_row(cache_dir, key):
+    """Return the cached row of `key`, or None."""
+    fname = os.path.join(cache_dir, f"{key}.json")
+    if not os.path.exists(fname):
+        return None
+    with open(fname) as f:
+        return json.load(f)["row"]
+
+def store_row(cache_dir, key, description, row):
+    """Persist the row of `key` with the description it was hashed from."""
+    os.makedirs(cache_dir, exist_ok = True)
+    _write_json(os.path.join(cache_dir, f"{key}.json"), dict(description = description, row = row))
@@ -0,0 +1,175 @@
+"""
+Append-only database of benchmark results.
+
+Every benchmark writer appends its table to one sqlite file as a run: the `runs` table
+holds the script, the dataset, the recipe, the arguments, the library versions and the
+host of each run, the `results` table holds the rows of the tables with the codec
+configurations (`get_config()`) of their conditions, and the `chunk_stats` table holds
+the per-chunk statistics of the bulk benchmark. The columns of `results` are the columns
+of the written tables, added as new tables bring new columns, so the table generators
+and the notebooks select the rows of a dataset or recipe with indexed SQL predicates
+instead of reading every csv file.
+"""
+
+import json
+import os
+import sqlite3
+from datetime import datetime, timezone
+import numpy as np
+import pandas as pd
+from result_cache import library_versions, host_fingerprint
+
+# bookkeeping columns of `results`, which are not benchmark table columns
+RESULT_KEYS = ("run_id", "row_index", "kind", "dataset", "recipe", "compressor config", "filters config")
+
+def _sql_value(value):
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, (list, tuple, dict)):
+        return json.dumps(value)
+    if isinstance(value, bool):
+        return int(value)
+    return value
+
+def _quote(column):
+    return '"' + column.replace('"', '""') + '"'
+
+def connect(db_path):
+    """Open the database at `db_path`, creating its tables if needed."""
+    if os.path.dirname(db_path):
+        os.makedirs(os.path.dirname(db_path), exist_ok = True)
+    con = sqlite3.connect(db_path, timeout = 60)
+    con.executescript("""
+        CREATE TABLE IF NOT EXISTS runs (
+            run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            created TEXT, kind TEXT, dataset TEXT, recipe TEXT, sample TEXT,
+            arguments TEXT, versions TEXT, host TEXT);
+        CREATE TABLE IF NOT EXISTS results (
+            run_id INTEGER REFERENCES runs(run_id), row_index INTEGER,
+            kind TEXT, dataset TEXT, recipe TEXT, "compressor config" TEXT, "filters config" TEXT);
+        CREATE INDEX IF NOT EXISTS results_selection ON results (kind, dataset, recipe);
+        CREATE INDEX IF NOT EXISTS results_run ON results (run_id);
+        CREATE TABLE IF NOT EXISTS chunk_stats (
+            run_id INTEGER REFERENCES runs(run_id), row_index INTEGER, chunk_index INTEGER,
+            "compressed size (bytes)" INTEGER, "max abs error" REAL, rmse REAL, "psnr (dB)" REAL, "bit exact" INTEGER);
+        CREATE INDEX IF NOT EXISTS chunk_stats_row ON chunk_stats (run_id, row_index);
+    """)
+    return con
+
+def _connect_existing(db_path):
+    if not os.path.exists(db_path):
+        raise FileNotFoundError(f"Results database not found: {db_path}")
+    return connect(db_path)
+
+def _add_columns(con, table, columns):
+    existing = {row[1] for row in con.execute(f"PRAGMA table_info({table})")}
+    for column in columns:
+        if column not in existing:
+            con.execute(f"ALTER TABLE {table} ADD COLUMN {_quote(column)}")
+
+def append_run(db_path, df, kind, dataset, recipe = None, sample = None, arguments = None, configs = None, chunk_stats = None):
+    """
+    Append a benchmark table to the database as a new run, and return its run id.
+
+    Parameters:
+    - db_path: path of the sqlite file.
+    - df: benchmark table; its columns are added to `results` if needed.
+    - kind: name of the writing benchmark, e.g. 'bulk'.
+    - dataset, recipe: labels the rows are selected by, e.g. the sample name and the recipe file name.
+    - sample: path of the benchmarked sample.
+    - arguments: command line arguments of the run (e.g. `vars(args)`).
+    - configs: None, or one (compressor, filters) pair of numcodecs codecs per row.
+    - chunk_stats: None, or one list of per-chunk statistics dicts per row.
+    """
+    con = connect(db_path)
+    try:
+        with con:
+            run_id = con.execute(
+                "INSERT INTO runs (created, kind, dataset, recipe, sample, arguments, versions, host) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (datetime.now(timezone.utc).isoformat(), kind, dataset, recipe, sample,
+                 json.dumps(arguments, default = str), json.dumps(library_versions()), json.dumps(host_fingerprint()))
+            ).lastrowid
+            _add_columns(con, "results", df.columns)
+            columns = list(RESULT_KEYS) + list(df.columns)
+            rows = []
+            for row_index, values in enumerate(df.itertuples(index = False, name = None)):
+                compressor, filters = (None, []) if configs is None else configs[row_index]
+                rows.append([
+                    run_id, row_index, kind, dataset, recipe,
+                    json.dumps(None if compressor is None else compressor.get_config(), default = str),
+                    json.dumps([f.get_config() for f in filters or []], default = str)
+                ] + [_sql_value(value) for value in values])
+            con.executemany(
+                f"INSERT INTO results ({', '.join(map(_quote, columns))}) VALUES ({', '.join('?' * len(columns))})", rows)
+            if chunk_stats is not None:
+                con.executemany(
+                    'INSERT INTO chunk_stats VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    [(run_id, row_index, chunk_index, *(_sql_value(stats[column]) for column in (
+                        "compressed size (bytes)", "max abs error", "rmse", "psnr (dB)", "bit exact")))
+                     for row_index, row_stats in enumerate(chunk_stats) for chunk_index, stats in enumerate(row_stats)])
+    finally:
+        con.close()
+    return run_id
+
+def _where(filters):
+    # filters: column -> value, list of values, or glob pattern (str with '*', '?' or '[')
+    clauses, params = [], []
+    for column, value in filters.items():
+        if value is None:
+            continue
+        if isinstance(value, (list, tuple)):
+            clauses.append(f"{_quote(column)} IN ({', '.join('?' * len(value))})")
+            params.extend(value)
+        elif isinstance(value, str) and any(c in value for c in "*?["):
+            clauses.append(f"{_quote(column)} GLOB ?")
+            params.append(value)
+        else:
+            clauses.append(f"{_quote(column)} = ?")
+            params.append(value)
+    return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+def query_results(db_path, kind = "bulk", dataset = None, recipe = None, columns = None, table_only = False, **filters):
+    """
+    Return the rows of the database matching the given predicates as a DataFrame.
+
+    `kind`, `dataset`, `recipe` and the keyword `filters` (column name, with spaces replaced by
+    underscores, e.g. `compression_option = 'zstd-3'` or `run_id = [3, 4]`) select rows by a value, a list of values or a
+    glob pattern. `columns` restricts the returned columns. With `table_only`, the bookkeeping
+    columns and the columns empty for every selected row are dropped, which gives the columns of
+    the csv tables.
+    """
+    con = _connect_existing(db_path)
+    try:
+        existing = [row[1] for row in con.execute("PRAGMA table_info(results)")]
+        predicates = dict(kind = kind, dataset = dataset, recipe = recipe)
+        for name, value in filters.items():
+            column = name if name in existing else name.replace("_", " ")
+            if column not in existing:
+                raise ValueError(f"Unknown results column: {column}")
+            predicates[column] = value
+        where, params = _where(predicates)
+        selected = "*" if columns is None else ", ".join(map(_quote, columns))
+        df = pd.read_sql_query(f"SELECT {selected} FROM results{where} ORDER BY run_id, row_index", con, params = params)
+    finally:
+        con.close()
+    if table_only:
+        df = df.drop(columns = [column for column in RESULT_KEYS if column in df.columns]).dropna(axis = 1, how = "all")
+    return df
+
+def query_chunk_stats(db_path, run_id = None, row_index = None):
+    """Return the per-chunk statistics of the given run(s) and row(s) as a DataFrame."""
+    con = _connect_existing(db_path)
+    try:
+        where, params = _where(dict(run_id = run_id, row_index = row_index))
+        return pd.read_sql_query(f"SELECT * FROM chunk_stats{where} ORDER BY run_id, row_index, chunk_index", con, params = params)
+    finally:
+        con.close()
+
+def query_runs(db_path, kind = None, dataset = None, recipe = None):
+    """Return the runs of the database, with their environment, as a DataFrame."""
+    con = _connect_existing(db_path)
+    try:
+        where, params = _where(dict(kind = kind, dataset = dataset, recipe = recipe))
+        return pd.read_sql_query(f"SELECT * FROM runs{where} ORDER BY run_id", con, params = params)
+    finally:
+        con.close()
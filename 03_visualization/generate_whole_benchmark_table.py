@@ -3,15 +3,19 @@
 Generate a comprehensive benchmark table by merging multiple dataset CSV files.
 
 This script reads benchmark data from multiple CSV files (specified in a TOML config),
+or queries it from the results database when the config has a 'database' key,
 adds dataset labels, and combines them into a single comprehensive table.
 Output is saved as both CSV and Excel formats.
 """
 
 import argparse
 import os
+import sys
 from pathlib import Path
 import pandas as pd
 import tomllib
+sys.path.append(str(Path(__file__).resolve().parent.parent / "01_compression_benchmark"))
+from results_db import query_results
 
 def load_config(config_path):
     """Load configuration from TOML file."""
@@ -23,13 +27,15 @@ def load_config(config_path):
         config = tomllib.load(f)
 
     # Validate configuration
-    if 'table_name' not in config or 'data_path' not in config:
-        raise ValueError("Configuration must contain 'table_name' and 'data_path' keys")
+    # 'data_path' lists CSV files; with 'database', 'dataset' lists the dataset names (or glob patterns) to query
+    source_key = 'dataset' if 'database' in config else 'data_path'
+    if 'table_name' not in config or source_key not in config:
+        raise ValueError(f"Configuration must contain 'table_name' and '{source_key}' keys")
 
-    if len(config['table_name']) != len(config['data_path']):
+    if len(config['table_name']) != len(config[source_key]):
         raise ValueError(
             f"Mismatch between table_name ({len(config['table_name'])}) "
-            f"and data_path ({len(config['data_path'])}) lengths"
+            f"and {source_key} ({len(config[source_key])}) lengths"
         )
 
     return config
@@ -57,6 +63,27 @@ def load_and_label_csv(csv_path, dataset_name):
 
     return df
 
+def query_and_label_dataset(db_path, dataset_pattern, dataset_name, recipe = None):
+    """
+    Query the bulk benchmark rows of a dataset from the results database and add a 'Dataset' column.
+
+    Args:
+        db_path: Path to the results database
+        dataset_pattern: Dataset name (or glob pattern) in the database
+        dataset_name: Name of the dataset to add as a column
+        recipe: Optional recipe file name (or glob pattern) the rows are restricted to
+
+    Returns:
+        pandas.DataFrame with an additional 'Dataset' column
+    """
+    df = query_results(db_path, kind = "bulk", dataset = dataset_pattern, recipe = recipe, table_only = True)
+    if df.empty:
+        raise ValueError(f"No benchmark results for dataset '{dataset_pattern}' in {db_path}")
+
+    df.insert(0, 'Dataset', dataset_name)
+
+    return df
+
 def rescale_bandwdith_byte2Mbyte(df):
     df['compression speed (MiB/s)'] = df['compression speed (bytes/sec)']/2**20
     df['decompression speed (MiB/s)'] = df['decompression speed (bytes/sec)']/2**20
@@ -86,7 +113,7 @@ def groupby_options(df):
         'compressor',
         'compression level',
         'filter option'
-    ]).mean()
+    ]).mean(numeric_only=True) # text columns, e.g. 'cpu governor', are not averaged
 
     return df
 
@@ -95,16 +122,22 @@ def merge_benchmark_tables(config):
     Merge multiple benchmark CSV files into a comprehensive table.
 
     Args:
-        config: Dictionary containing 'table_name' and 'data_path' lists
+        config: Dictionary containing 'table_name' and 'data_path' lists,
+            or 'table_name' and 'dataset' lists with a 'database' path (and an optional 'recipe')
 
     Returns:
         pandas.DataFrame containing all merged data
     """
     dataframes = []
 
-    for dataset_name, csv_path in zip(config['table_name'], config['data_path']):
-        df = load_and_label_csv(csv_path, dataset_name)
-        dataframes.append(df)
+    if 'database' in config:
+        for dataset_name, dataset_pattern in zip(config['table_name'], config['dataset']):
+            df = query_and_label_dataset(config['database'], dataset_pattern, dataset_name, config.get('recipe'))
+            dataframes.append(df)
+    else:
+        for dataset_name, csv_path in zip(config['table_name'], config['data_path']):
+            df = load_and_label_csv(csv_path, dataset_name)
+            dataframes.append(df)
 
     # Concatenate all dataframes
     merged_df = pd.concat(dataframes, ignore_index=True)
@@ -2,6 +2,10 @@ import argparse
 import glob
 import pandas as pd
 import os
+import sys
+from os import path
+sys.path.append(path.join(path.dirname(path.dirname(path.abspath(__file__))), "01_compression_benchmark"))
+from results_db import RESULT_KEYS, query_results
 
 def rename_squeeze_filter_to_none(df):
     """
@@ -42,20 +46,50 @@ def merge_csv_files(input_glob, output_path):
     merged_df.to_csv(output_path, index=False)
     print(f"Merged CSV saved to {output_path}")
 
+def merge_database_runs(db_path, dataset_glob, output_path, recipe = None):
+    """
+    Write the bulk benchmark rows of the datasets matching `dataset_glob` in the results database
+    as one CSV file. As with the CSV files, the 'none' baseline row is only kept from the first run.
+    """
+    merged_df = query_results(db_path, kind = "bulk", dataset = dataset_glob, recipe = recipe)
+    if merged_df.empty:
+        print(f"No benchmark results found for dataset: {dataset_glob}")
+        return
+    merged_df = merged_df[(merged_df["row_index"] != 0) | (merged_df["run_id"] == merged_df["run_id"].iloc[0])]
+    merged_df = merged_df.drop(columns = [column for column in RESULT_KEYS if column in merged_df.columns]).dropna(axis = 1, how = "all")
+    merged_df = rename_squeeze_filter_to_none(merged_df)
+
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    merged_df.to_csv(output_path, index=False)
+    print(f"Merged CSV saved to {output_path}")
+
 def main():
     parser = argparse.ArgumentParser(
         description="Merge multiple CSV files with the same columns into one CSV file."
     )
     parser.add_argument(
         "input_glob",
-        help="Glob pattern for input CSV files (e.g., './data/*.csv')"
+        help="Glob pattern for input CSV files (e.g., './data/*.csv'), or of dataset names with --db (e.g., 'embryo-8G*')"
     )
     parser.add_argument(
         "output_path",
         help="Path to save the merged CSV file"
     )
+    parser.add_argument(
+        "--db",
+        default=None,
+        help="Results database (sqlite) to query instead of reading CSV files"
+    )
+    parser.add_argument(
+        "--recipe",
+        default=None,
+        help="Recipe file name (or glob pattern) the database rows are restricted to"
+    )
     args = parser.parse_args()
-    merge_csv_files(args.input_glob, args.output_path)
+    if args.db is not None:
+        merge_database_runs(args.db, args.input_glob, args.output_path, args.recipe)
+    else:
+        merge_csv_files(args.input_glob, args.output_path)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,11 +1,34 @@
 from utils.spatial_filter import SpatialDelta
 from utils.argument_configuration import configure_compression, configure_filters
-from utils.nvidia_compressor import NvcompLZ4, NvcompGDeflate
 from utils.squeeze_filter import Squeeze
+from utils.channel_symmetry import ChannelSymmetry
+from utils.lorenzo_filter import Lorenzo3D
+from utils.quantize_filter import ErrorBoundQuantize
+from utils.float_split_filter import FloatSplit
+from utils.adaptive_compressor import AdaptiveCompressor
 
 # codec registration
 from numcodecs.registry import register_codec
-register_codec(NvcompLZ4)
-register_codec(NvcompGDeflate)
 register_codec(SpatialDelta)
-register_codec(Squeeze)
\ No newline at end of file
+register_codec(Squeeze)
+register_codec(ChannelSymmetry)
+register_codec(Lorenzo3D)
+register_codec(ErrorBoundQuantize)
+register_codec(FloatSplit)
+register_codec(AdaptiveCompressor)
+
+# GPU codecs are registered as entry points, so nvCOMP is only imported
+# when such a codec is configured or read from a zarr array.
+from importlib.metadata import EntryPoint
+from numcodecs.registry import entries
+LAZY_CODECS = {
+    "NvcompLZ4": ("nvcomp_lz4", "utils.nvidia_compressor:NvcompLZ4"),
+    "NvcompGDeflate": ("nvcomp_gdeflate", "utils.nvidia_compressor:NvcompGDeflate"),
+}
+for codec_id, value in LAZY_CODECS.values():
+    entries.setdefault(codec_id, EntryPoint(name=codec_id, value=value, group="numcodecs.codecs"))
+
+def __getattr__(name):
+    if name in LAZY_CODECS:
+        return EntryPoint(name=name, value=LAZY_CODECS[name][1], group="numcodecs.codecs").load()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
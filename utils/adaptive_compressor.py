@@ -0,0 +1,124 @@
+import time
+import numpy as np
+
+
+from numcodecs.abc import Codec
+from numcodecs.compat import ensure_contiguous_ndarray, ndarray_copy
+from numcodecs.registry import get_codec
+
+class AdaptiveCompressor(Codec):
+    """Codec to compress each chunk with the best of a few candidate compressors.
+
+    Every chunk is trial-compressed with the candidates, in order, and the
+    smallest result is kept. Candidates are listed from the fastest to the
+    slowest: a later candidate is only picked if it is at least `min_gain`
+    smaller than the current choice, and candidates encoding slower than
+    `min_speed` are dropped.
+
+    Parameters
+    ----------
+    candidates : list of dict or None
+        Configurations of the candidate compressors. None stores the chunk
+        uncompressed. At most 255 candidates.
+    min_speed : float
+        Minimum encoding speed (bytes/sec) of a candidate. The first
+        candidate is always accepted. 0 disables the speed budget.
+    min_gain : float
+        Relative size reduction needed to prefer a later candidate.
+    sample_fraction : float
+        Fraction of the chunk used for the trial compression. With 1, the
+        trial result of the chosen candidate is kept as it is; below 1,
+        evenly spaced parts of the chunk are tried and the whole chunk is
+        compressed with the chosen candidate afterwards.
+
+    Notes
+    -----
+    Each encoded chunk starts with a 1-byte header holding the index of the
+    chosen candidate, so decoding calls that candidate only.
+
+    Examples
+    --------
+    >>> import numpy as np
+    >>> codec = AdaptiveCompressor(candidates=[None, dict(id='zstd', level=3)])
+    >>> y = codec.encode(np.zeros(1000, dtype='f4'))
+    >>> int(y[0])
+    1
+    >>> len(codec.decode(y))
+    4000
+    """
+
+    codec_id = 'adaptive'
+
+    def __init__(self, candidates=(None, dict(id='lz4', acceleration=1), dict(id='zstd', level=3)),
+                 min_speed=0, min_gain=0.05, sample_fraction=1.0):
+        if not 0 < len(candidates) < 256:
+            raise ValueError('between 1 and 255 candidates are supported')
+        if not 0 < sample_fraction <= 1:
+            raise ValueError('sample_fraction must be in (0, 1]')
+        self.candidates = [None if config is None else dict(config) for config in candidates]
+        self.min_speed = min_speed
+        self.min_gain = min_gain
+        self.sample_fraction = sample_fraction
+        self._codecs = [None if config is None else get_codec(dict(config)) for config in self.candidates]
+
+    def _sample(self, data, num_parts=8):
+        # evenly spaced contiguous parts, so that both background and cells are seen
+        if self.sample_fraction >= 1:
+            return data
+        part_size = max(1, int(data.size * self.sample_fraction) // num_parts)
+        starts = np.linspace(0, data.size - part_size, num_parts).astype(int)
+        return np.concatenate([data[start:start + part_size] for start in starts])
+
+    def _choose(self, data):
+        # returns the index of the chosen candidate and its trial result
+        best_idx, best_size, best_cdata = None, np.inf, None
+        for idx, codec in enumerate(self._codecs):
+            start_time = time.perf_counter()
+            cdata = data if codec is None else codec.encode(data)
+            elapsed_time = time.perf_counter() - start_time
+            if best_idx is not None and self.min_speed > 0 and elapsed_time > 0 and data.nbytes / elapsed_time < self.min_speed:
+                continue
+            size = ensure_contiguous_ndarray(cdata).nbytes
+            if best_idx is None or size < best_size * (1 - self.min_gain):
+                best_idx, best_size, best_cdata = idx, size, cdata
+        return best_idx, best_cdata
+
+    def encode(self, buf):
+        # normalise input
+        data = ensure_contiguous_ndarray(buf).view('u1').reshape(-1)
+        sample = self._sample(data)
+
+        # pick a candidate
+        idx, cdata = self._choose(sample)
+        if sample is not data:
+            codec = self._codecs[idx]
+            cdata = data if codec is None else codec.encode(data)
+
+        # setup encoded output
+        cdata = ensure_contiguous_ndarray(cdata).view('u1').reshape(-1)
+        enc = np.empty(1 + cdata.size, dtype='u1')
+        enc[0] = idx
+        enc[1:] = cdata
+
+        return enc
+
+    def decode(self, buf, out=None):
+        # normalise input
+        enc = ensure_contiguous_ndarray(buf).view('u1').reshape(-1)
+        idx = int(enc[0])
+        if idx >= len(self._codecs):
+            raise ValueError(f'unknown candidate index {idx}')
+
+        codec = self._codecs[idx]
+        if codec is None:
+            return ndarray_copy(enc[1:], out)
+        return codec.decode(enc[1:], out)
+
+    def get_config(self):
+        return dict(id=self.codec_id, candidates=self.candidates, min_speed=self.min_speed,
+                    min_gain=self.min_gain, sample_fraction=self.sample_fraction)
+
+    def __repr__(self):
+        r = (f'{type(self).__name__}(candidates={self.candidates!r}, min_speed={self.min_speed}, '
+             f'min_gain={self.min_gain}, sample_fraction={self.sample_fraction})')
+        return r
@@ -0,0 +1,245 @@
+"""Lazy registry of the codec spec strings used by the scripts and benchmark recipes.
+
+A spec string is the codec name followed by its '-' separated arguments,
+e.g. 'zstd-3', 'blosc-lz4-5-1', 'BitRound-14' or 'Quantize-abs-1e-4'.
+Each name maps to a factory which imports the codec backend on first use,
+so that scripts only load the libraries of the codecs they ask for.
+"""
+
+import ast
+from functools import lru_cache
+
+COMPRESSORS = {}
+FILTERS = {}
+
+def register_compressor(name):
+    """Register a compressor factory taking the argument string of a spec."""
+    def decorator(factory):
+        COMPRESSORS[name] = factory
+        return factory
+    return decorator
+
+def register_filter(name):
+    """Register a filter factory taking the argument string of a spec."""
+    def decorator(factory):
+        FILTERS[name] = factory
+        return factory
+    return decorator
+
+def split_spec(spec):
+    """Split a spec string into the codec name and its argument string."""
+    name, _, arg = spec.partition("-")
+    return name, arg
+
+def split_filter_option(filter_option):
+    """
+    Split the 'filter option' of a benchmark table back into its filter specs,
+    e.g. 'BitRound-14-Shuffle' -> ['BitRound-14', 'Shuffle'] and 'none' -> [].
+
+    A new spec starts at every token which is a registered filter name, as the
+    arguments of a spec are never filter names.
+    """
+    if filter_option == "none":
+        return []
+    specs = []
+    for token in filter_option.split("-"):
+        if token in FILTERS or not specs:
+            specs.append(token)
+        else:
+            specs[-1] += "-" + token
+    return specs
+
+@lru_cache(maxsize=None)
+def get_compressor(spec):
+    """Return the (memoized) compressor for a spec string, or None for 'none'."""
+    if spec == "none":
+        return None  # No compression
+    name, arg = split_spec(spec)
+    if name not in COMPRESSORS:
+        raise ValueError(f"Unsupported compressor: {name}")
+    return COMPRESSORS[name](arg)
+
+@lru_cache(maxsize=None)
+def get_filters(specs):
+    """Return the (memoized) filter pipeline for a tuple of spec strings."""
+    filters = []
+    for spec in specs:
+        name, arg = split_spec(spec)
+        if name not in FILTERS:
+            raise ValueError(f"Unknown filter: {spec}")
+        filters.append(FILTERS[name](arg))
+    return tuple(filters)
+
+# compressors
+@register_compressor("blosc")
+def _blosc(arg):
+    #  e.g., ‘zstd’, ‘blosclz’, ‘lz4’, ‘lz4hc’, ‘zlib’ or ‘snappy’.
+    from numcodecs import Blosc
+    blosc_info = arg.split("-")
+    codec = blosc_info[0]
+    clevel = int(blosc_info[1])
+    shuffle = 0 if len(blosc_info) == 2 else int(blosc_info[2])
+    return Blosc(cname=codec, clevel=clevel, shuffle=shuffle)
+
+@register_compressor("gzip")
+def _gzip(arg):
+    from numcodecs import GZip
+    return GZip(level=int(arg))
+
+@register_compressor("bzip2")
+def _bzip2(arg):
+    from numcodecs import BZ2
+    return BZ2(level=int(arg))
+
+@register_compressor("lzma")
+def _lzma(arg):
+    from numcodecs import LZMA
+    return LZMA(preset=int(arg))
+
+@register_compressor("lz4")
+def _lz4(arg):
+    from numcodecs import LZ4
+    return LZ4(acceleration=int(arg))
+
+@register_compressor("zlib")
+def _zlib(arg):
+    # deflate compression
+    from numcodecs import Zlib
+    return Zlib(level=int(arg))
+
+@register_compressor("zstd")
+def _zstd(arg):
+    from numcodecs import Zstd
+    return Zstd(level=int(arg))
+
+@register_compressor("PCodec")
+def _pcodec(arg):
+    from numcodecs.pcodec import PCodec
+    return PCodec(level=int(arg))
+
+@register_compressor("Brotli")
+def _brotli(arg):
+    from imagecodecs.numcodecs import Brotli
+    return Brotli(level=int(arg))
+
+@register_compressor("Snappy")
+def _snappy(arg):
+    from imagecodecs.numcodecs import Snappy
+    return Snappy()
+
+@register_compressor("LOSSLESS_ZFP")
+def _lossless_zfp(arg):
+    # If none of these arguments is specified, then reversible mode is used.
+    # See https://zfp.readthedocs.io/en/release1.0.1/python.html#zfpy.compress_numpy
+    from numcodecs.zfpy import ZFPY
+    return ZFPY()
+
+@register_compressor("LOSSY_ZFP")
+def _lossy_zfp(arg):
+    import zfpy
+    from numcodecs.zfpy import ZFPY
+    return ZFPY(mode=zfpy.mode_fixed_precision, precision=2**-14)
+
+def _adaptive_candidates(arg):
+    # e.g., 'none+lz4-1+zstd-3@200': candidates from the fastest to the slowest, optional speed budget in MB/s
+    candidate_specs, _, min_speed = (arg or "none+lz4-1+zstd-3").partition("@")
+    candidates = []
+    for candidate_spec in candidate_specs.split("+"):
+        compressor = get_compressor(candidate_spec)
+        candidates.append(None if compressor is None else compressor.get_config())
+    return candidates, float(min_speed) * 1e6 if min_speed else 0
+
+@register_compressor("Adaptive")
+def _adaptive(arg):
+    # trial compression of whole chunks
+    from utils.adaptive_compressor import AdaptiveCompressor
+    candidates, min_speed = _adaptive_candidates(arg)
+    return AdaptiveCompressor(candidates=candidates, min_speed=min_speed)
+
+@register_compressor("AdaptiveSample")
+def _adaptive_sample(arg):
+    # trial compression of 1/8 of every chunk
+    from utils.adaptive_compressor import AdaptiveCompressor
+    candidates, min_speed = _adaptive_candidates(arg)
+    return AdaptiveCompressor(candidates=candidates, min_speed=min_speed, sample_fraction=0.125)
+
+@register_compressor("FloatSplit")
+def _float_split_compressor(arg):
+    # e.g., 'FloatSplit-lz4-1': FloatSplit streams compressed one by one with 'lz4-1'
+    from utils.float_split_filter import FloatSplit
+    compressor = get_compressor(arg or "lz4-1")
+    return FloatSplit(high_bits=7, compressor=None if compressor is None else compressor.get_config())
+
+# hardware accelerated codecs
+@register_compressor("Zlibng")
+def _zlibng(arg):
+    # Vectorized Zlib implementation
+    from imagecodecs.numcodecs import Zlibng
+    return Zlibng(level=int(arg))
+
+@register_compressor("NvcompLZ4")
+def _nvcomp_lz4(arg):
+    from utils.nvidia_compressor import NvcompLZ4
+    return NvcompLZ4()
+
+@register_compressor("NvcompGDeflate")
+def _nvcomp_gdeflate(arg):
+    from utils.nvidia_compressor import NvcompGDeflate
+    return NvcompGDeflate(level=int(arg))
+
+# filters
+@register_filter("FixedScaleOffset")
+def _fixed_scale_offset(arg):
+    from numcodecs import FixedScaleOffset
+    return FixedScaleOffset(offset=0, scale=1e4, dtype="f4", astype="i2") # (-3.2768, 3.2768)
+
+@register_filter("Delta")
+def _delta(arg):
+    from numcodecs import Delta
+    return Delta(dtype="i2")
+
+@register_filter("Squeeze")
+def _squeeze(arg):
+    from utils.squeeze_filter import Squeeze
+    return Squeeze()
+
+@register_filter("ChannelSymmetry")
+def _channel_symmetry(arg):
+    # only chunks spanning the 9 tensor channels are reduced, the others pass through
+    from utils.channel_symmetry import ChannelSymmetry
+    return ChannelSymmetry(axis=1, dtype="f4")
+
+@register_filter("Lorenzo3D")
+def _lorenzo3d(arg):
+    from utils.lorenzo_filter import Lorenzo3D
+    return Lorenzo3D(dtype="f4")
+
+@register_filter("Quantize")
+def _quantize(arg):
+    # e.g., 'Quantize-abs-1e-4' or 'Quantize-rel-1e-3' (relative to the chunk range, fill value 0 left out)
+    from utils.quantize_filter import ErrorBoundQuantize
+    mode, _, error_bound = arg.partition("-")
+    return ErrorBoundQuantize(mode=mode, error_bound=float(error_bound), dtype="f4")
+
+@register_filter("FloatSplit")
+def _float_split(arg):
+    from utils.float_split_filter import FloatSplit
+    return FloatSplit(high_bits=int(arg) if arg else 7)
+
+@register_filter("SpatialDelta")
+def _spatial_delta(arg):
+    # e.g., 'SpatialDelta-(0,1)'
+    from utils.spatial_filter import SpatialDelta
+    axes = ast.literal_eval(arg) if arg else (0,)
+    return SpatialDelta(axes=axes, dtype="i2")
+
+@register_filter("Shuffle")
+def _shuffle(arg):
+    from numcodecs import Shuffle
+    return Shuffle(elementsize=int(arg) if arg else 4)
+
+@register_filter("BitRound")
+def _bitround(arg):
+    from numcodecs import BitRound
+    keepbits = int(arg) if arg else (1 + 8 + 14) # float 32 w/ 4 digit accuracy
+    return BitRound(keepbits=keepbits)
@@ -0,0 +1,213 @@
+import numpy as np
+
+
+from numcodecs.abc import Codec
+from numcodecs.compat import ensure_ndarray, ensure_contiguous_ndarray
+from numcodecs.registry import get_codec
+
+HEADER_DTYPE = np.dtype([('sign', 'u1'), ('shift', 'u1'), ('low_width', 'u1')])
+PLANE_LENGTHS_DTYPE = np.dtype('<u8')
+RAW_PLANE = 1 << 63 # flag of the length of a plane stored uncompressed
+MIXED_SIGN = 2
+MANTISSA_BITS = 23
+
+def _narrowest_uint(num_bits):
+    for quantized_dtype in (np.dtype('u1'), np.dtype('<u2'), np.dtype('<u4')):
+        if num_bits <= 8 * quantized_dtype.itemsize:
+            return quantized_dtype
+
+def _byte_planes(stream):
+    # byte planes of an unsigned integer stream, least significant first
+    if stream.dtype.itemsize == 1:
+        return [stream]
+    stream_bytes = np.ascontiguousarray(stream).view('u1').reshape(-1, stream.dtype.itemsize)
+    return [stream_bytes[:, i] for i in range(stream.dtype.itemsize)]
+
+def _merge_planes(planes, stream_dtype):
+    if len(planes) == 1:
+        return planes[0]
+    stream_bytes = np.empty((planes[0].size, len(planes)), dtype='u1')
+    for i, plane in enumerate(planes):
+        stream_bytes[:, i] = plane
+    return stream_bytes.view(stream_dtype).reshape(-1)
+
+class FloatSplit(Codec):
+    """Codec to split float32 data into sign/exponent and mantissa planes.
+
+    Each chunk is split into three streams: the exponent (with the sign,
+    unless it is constant over the chunk), the `high_bits` most significant
+    mantissa bits, and the remaining low mantissa bits. The trailing
+    mantissa bits that are zero over the whole chunk, e.g. after `BitRound`,
+    are dropped and the low stream uses the narrowest unsigned integer type
+    that holds the rest. Every stream is stored as byte planes, least
+    significant byte first.
+
+    Parameters
+    ----------
+    high_bits : int
+        Number of mantissa bits in the high mantissa stream (1 to 8).
+    compressor : dict, optional
+        Configuration of the compressor applied to each plane on its own,
+        e.g. ``dict(id='lz4', acceleration=1)``. The codec is then used as
+        the compressor of an array. None concatenates the raw planes, for
+        a following compressor.
+
+    Notes
+    -----
+    Each encoded chunk starts with a 3-byte header holding the sign mode,
+    the number of dropped bits and the width of the low stream. Without
+    `compressor`, the planes follow each other, so a following compressor
+    sees them as one stream, much like after a byte shuffle. With it, the
+    header is followed by the compressed length of each plane (`<u8`) and
+    the compressed planes, so that every plane gets its own match window
+    and entropy model. A plane the compressor does not shrink, e.g. noisy
+    low mantissa bits, is stored as it is (flagged by the top bit of its
+    length) and decoded by a copy.
+
+    Examples
+    --------
+    >>> import numpy as np
+    >>> x = np.array([1.33, 1.34, 1.35], dtype='f4')
+    >>> codec = FloatSplit(high_bits=7)
+    >>> y = codec.encode(x)
+    >>> y[:9]
+    array([  0,   0,   2, 127, 127, 127,  42,  43,  44], dtype=uint8)
+    >>> codec.decode(y)
+    array([1.33, 1.34, 1.35], dtype=float32)
+
+    With a compressor, each plane is compressed separately:
+
+    >>> codec = FloatSplit(high_bits=7, compressor=dict(id='zstd', level=3))
+    >>> x = np.linspace(1.33, 1.40, 4096, dtype='f4')
+    >>> bool(np.array_equal(codec.decode(codec.encode(x)), x))
+    True
+    """
+
+    codec_id = 'float_split'
+
+    def __init__(self, high_bits=7, compressor=None):
+        if not 1 <= high_bits <= 8:
+            raise ValueError('high_bits must be between 1 and 8')
+        self.high_bits = high_bits
+        self.low_bits = MANTISSA_BITS - high_bits
+        self.compressor = None if compressor is None else dict(compressor)
+        self._compressor = None if compressor is None else get_codec(dict(compressor))
+
+    def encode(self, buf):
+        # normalise input
+        bits = np.ascontiguousarray(ensure_ndarray(buf).view('<f4')).view('<u4').reshape(-1)
+
+        # split sign, exponent and mantissa
+        sign = bits >> 31
+        exponent = (bits >> MANTISSA_BITS) & 0xFF
+        high = (bits >> self.low_bits) & ((1 << self.high_bits) - 1)
+        low = bits & ((1 << self.low_bits) - 1)
+        if bits.size == 0 or np.all(sign == sign[0]):
+            sign_mode = int(sign[0]) if bits.size else 0
+            exponent_dtype = np.dtype('u1')
+        else:
+            sign_mode = MIXED_SIGN
+            exponent |= sign << 8
+            exponent_dtype = np.dtype('<u2')
+
+        # drop the trailing mantissa bits which are zero everywhere
+        low_mask = int(np.bitwise_or.reduce(low)) if bits.size else 0
+        shift = (low_mask & -low_mask).bit_length() - 1 if low_mask else self.low_bits
+        low >>= shift
+        low_dtype = _narrowest_uint(self.low_bits - shift) if shift < self.low_bits else None
+        low_width = 0 if low_dtype is None else low_dtype.itemsize
+
+        planes = []
+        for stream, stream_dtype in ((exponent, exponent_dtype), (high, np.dtype('u1')), (low, low_dtype)):
+            if stream_dtype is not None:
+                planes.extend(_byte_planes(stream.astype(stream_dtype)))
+        header = (sign_mode, shift, low_width)
+        if self._compressor is not None:
+            return self._encode_planes(header, planes)
+
+        # setup encoded output
+        enc = np.empty(HEADER_DTYPE.itemsize + bits.size * len(planes), dtype='u1')
+        enc[:HEADER_DTYPE.itemsize].view(HEADER_DTYPE)[0] = header
+        planes_out = enc[HEADER_DTYPE.itemsize:].reshape(len(planes), bits.size)
+        for plane, plane_out in zip(planes, planes_out):
+            plane_out[:] = plane
+
+        return enc
+
+    def _encode_planes(self, header, planes):
+        # compress every plane on its own, after the header and the compressed lengths
+        cplanes, lengths = [], []
+        for plane in planes:
+            plane = np.ascontiguousarray(plane)
+            cplane = ensure_contiguous_ndarray(self._compressor.encode(plane)).view('u1')
+            if cplane.size >= plane.nbytes:
+                cplanes.append(plane)
+                lengths.append(plane.nbytes | RAW_PLANE)
+            else:
+                cplanes.append(cplane)
+                lengths.append(cplane.size)
+        start = HEADER_DTYPE.itemsize + len(planes) * PLANE_LENGTHS_DTYPE.itemsize
+        enc = np.empty(start + sum(cplane.size for cplane in cplanes), dtype='u1')
+        enc[:HEADER_DTYPE.itemsize].view(HEADER_DTYPE)[0] = header
+        enc[HEADER_DTYPE.itemsize:start].view(PLANE_LENGTHS_DTYPE)[:] = lengths
+        for cplane in cplanes:
+            enc[start:start + cplane.size] = cplane
+            start += cplane.size
+        return enc
+
+    def _decode_planes(self, enc, num_planes):
+        # decompress the planes written by `_encode_planes`
+        start = HEADER_DTYPE.itemsize + num_planes * PLANE_LENGTHS_DTYPE.itemsize
+        planes = []
+        for length in enc[HEADER_DTYPE.itemsize:start].view(PLANE_LENGTHS_DTYPE).tolist():
+            if length & RAW_PLANE:
+                length ^= RAW_PLANE
+                planes.append(enc[start:start + length])
+            else:
+                planes.append(ensure_ndarray(self._compressor.decode(enc[start:start + length])).view('u1'))
+            start += length
+        return planes
+
+    def decode(self, buf, out=None):
+        # normalise input
+        enc = ensure_contiguous_ndarray(buf).view('u1')
+        sign_mode, shift, low_width = enc[:HEADER_DTYPE.itemsize].view(HEADER_DTYPE)[0].item()
+        exponent_dtype = np.dtype('<u2') if sign_mode == MIXED_SIGN else np.dtype('u1')
+        num_planes = exponent_dtype.itemsize + 1 + low_width
+
+        # split the planes
+        if self._compressor is not None:
+            planes = self._decode_planes(enc, num_planes)
+            size = planes[0].size
+        else:
+            size = (enc.size - HEADER_DTYPE.itemsize) // num_planes
+            planes = list(enc[HEADER_DTYPE.itemsize:HEADER_DTYPE.itemsize + num_planes * size].reshape(num_planes, size))
+        exponent = _merge_planes(planes[:exponent_dtype.itemsize], exponent_dtype)
+        high = planes[exponent_dtype.itemsize]
+
+        # setup decoded output
+        if out is None:
+            dec = np.empty(size, dtype='<u4')
+        else:
+            dec = ensure_contiguous_ndarray(out).view('<u4').reshape(-1)
+
+        # merge the streams
+        np.left_shift(exponent, MANTISSA_BITS, out=dec, dtype='<u4')
+        if sign_mode == 1:
+            dec |= np.uint32(1 << 31)
+        dec |= high.astype('<u4') << self.low_bits
+        if low_width:
+            low = _merge_planes(planes[exponent_dtype.itemsize + 1:], _narrowest_uint(8 * low_width))
+            dec |= low.astype('<u4') << shift
+
+        return dec.view('<f4') if out is None else out
+
+    def get_config(self):
+        return dict(id=self.codec_id, high_bits=self.high_bits, compressor=self.compressor)
+
+    def __repr__(self):
+        r = f'{type(self).__name__}(high_bits={self.high_bits}'
+        if self.compressor is not None:
+            r += f', compressor={self.compressor!r}'
+        r += ')'
+        return r
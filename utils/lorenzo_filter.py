@@ -0,0 +1,171 @@
+import threading
+import numpy as np
+
+
+from numcodecs.abc import Codec
+from numcodecs.compat import ensure_ndarray, ensure_contiguous_ndarray
+
+HEADER_DTYPE = np.dtype('<u4')
+HEADER_NBYTES = 3 * HEADER_DTYPE.itemsize
+# (shift along z, y, x) of the Lorenzo stencil, except the voxel itself
+LORENZO_STENCIL = (
+    (1, 0, 0), (0, 1, 0), (0, 0, 1),
+    (1, 1, 0), (1, 0, 1), (0, 1, 1),
+    (1, 1, 1),
+)
+# working buffer of each thread, reused between chunks
+_scratch = threading.local()
+
+def _scratch_buffer(nbytes):
+    if getattr(_scratch, 'buffer', None) is None or _scratch.buffer.size < nbytes:
+        _scratch.buffer = np.empty(nbytes, dtype='u1')
+    return _scratch.buffer[:nbytes]
+
+class Lorenzo3D(Codec):
+    """Codec to encode data as the residual of the 3D Lorenzo predictor.
+
+    Each voxel is predicted from its 7 preceding neighbours in the (z, y, x)
+    unit cube, i.e. the last three axes of the chunk, and the residual is
+    the wrap-around difference between the voxel and its prediction. Float
+    data are first mapped to unsigned integers of the same width which keep
+    the order of the values (the sign bit is flipped for positive values,
+    all bits for negative ones), so that the prediction works on nearby
+    values and the codec stays exactly lossless without any quantization.
+    For every dtype, the residuals are then zigzag-mapped, so that small
+    negative residuals become small integers, and byte-shuffled, so that
+    their high bytes, which are zero on smooth data, are stored together.
+
+    Parameters
+    ----------
+    dtype : dtype
+        Data type to use for decoded data.
+
+    Notes
+    -----
+    Encode and decode are vectorized over the whole chunk and work in place:
+    the encoder applies the 7 stencil terms on the output buffer, and the
+    decoder unshuffles into the caller's `out` buffer and inverts the
+    stencil with one in-place accumulation per axis. The order-preserving
+    map, the zigzag and their inverses are chains of in-place bitwise
+    operations. They use one chunk-sized working buffer per thread, which
+    is reused between chunks. Each encoded chunk starts with a 12-byte
+    header holding the (z, y, x) chunk shape.
+
+    Examples
+    --------
+    >>> import numpy as np
+    >>> x = np.arange(8, dtype='i2').reshape(2, 2, 2)
+    >>> codec = Lorenzo3D(dtype='i2')
+    >>> y = codec.encode(x)
+    >>> y[12:]
+    array([0, 2, 4, 0, 8, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0], dtype=uint8)
+    >>> codec.decode(y).reshape(2, 2, 2)
+    array([[[0, 1],
+            [2, 3]],
+    <BLANKLINE>
+           [[4, 5],
+            [6, 7]]], dtype=int16)
+
+    On a smooth float field, the residuals compress better than the
+    shuffled or delta-coded values:
+
+    >>> from numcodecs import Delta, Shuffle, Zstd
+    >>> z, y, x = np.meshgrid(*[np.linspace(0, 1, 64)] * 3, indexing='ij')
+    >>> field = (1.337 + 0.05 * np.sin(3 * x + 2 * y) * np.cos(4 * z)).astype('f4')
+    >>> size = lambda codec: len(Zstd(3).encode(field if codec is None else codec.encode(field)))
+    >>> size(Lorenzo3D(dtype='f4')) < min(size(Shuffle(4)), size(Delta('f4')), size(None))
+    True
+    >>> codec = Lorenzo3D(dtype='f4')
+    >>> np.array_equal(codec.decode(codec.encode(field)).reshape(field.shape), field)
+    True
+    """
+
+    codec_id = 'lorenzo3d'
+
+    def __init__(self, dtype='f4'):
+        self.dtype = np.dtype(dtype)
+        if self.dtype.kind not in 'fiu':
+            raise ValueError('only numeric arrays are supported')
+        self.bits_dtype = np.dtype(f'u{self.dtype.itemsize}')
+        self.signed_dtype = np.dtype(f'i{self.dtype.itemsize}')
+        self.top_bit = 8 * self.dtype.itemsize - 1
+        self.sign_bit = self.bits_dtype.type(1 << self.top_bit)
+
+    def encode(self, buf):
+        # normalise input
+        arr = ensure_ndarray(buf).view(self.dtype)
+        volume_shape = (1,) * (3 - arr.ndim) + arr.shape[-3:]
+        src = np.ascontiguousarray(arr).view(self.bits_dtype).reshape((-1,) + volume_shape)
+        scratch = _scratch_buffer(src.nbytes).view(self.bits_dtype).reshape(src.shape)
+        if self.dtype.kind == 'f':
+            # order-preserving map of the float bit patterns to unsigned integers:
+            # xor with all ones for negative values, with the sign bit for the others
+            np.right_shift(src.view(self.signed_dtype), self.top_bit, out=scratch.view(self.signed_dtype))
+            np.bitwise_or(scratch, self.sign_bit, out=scratch)
+            np.bitwise_xor(scratch, src, out=scratch)
+            src = scratch
+
+        # setup encoded output
+        enc = np.empty(HEADER_NBYTES + src.nbytes, dtype='u1')
+        enc[:HEADER_NBYTES].view(HEADER_DTYPE)[:] = volume_shape
+        res = enc[HEADER_NBYTES:].view(self.bits_dtype).reshape(src.shape)
+        res[...] = src
+
+        # subtract the prediction term by term
+        for shift in LORENZO_STENCIL:
+            dst_slice = (Ellipsis,) + tuple(slice(s, None) for s in shift)
+            src_slice = (Ellipsis,) + tuple(slice(None, -s if s else None) for s in shift)
+            op = np.subtract if sum(shift) % 2 == 1 else np.add
+            op(res[dst_slice], src[src_slice], out=res[dst_slice])
+
+        # zigzag the residuals: (r << 1) ^ (r >> top bit)
+        np.right_shift(res.view(self.signed_dtype), self.top_bit, out=scratch.view(self.signed_dtype))
+        np.left_shift(res, 1, out=res)
+        np.bitwise_xor(res, scratch, out=res)
+
+        # shuffle their bytes into the output
+        scratch[...] = res
+        enc[HEADER_NBYTES:].reshape(self.dtype.itemsize, -1)[...] = scratch.reshape(-1).view('u1').reshape(-1, self.dtype.itemsize).T
+
+        return enc
+
+    def decode(self, buf, out=None):
+        # normalise input
+        enc = ensure_contiguous_ndarray(buf).view('u1')
+        volume_shape = tuple(int(v) for v in enc[:HEADER_NBYTES].view(HEADER_DTYPE))
+        res = enc[HEADER_NBYTES:]
+
+        # setup decoded output
+        shape = (-1,) + volume_shape
+        if out is None:
+            dec = np.empty(res.size // self.dtype.itemsize, dtype=self.bits_dtype).reshape(shape)
+        else:
+            dec = ensure_contiguous_ndarray(out).view(self.bits_dtype).reshape(shape)
+        scratch = _scratch_buffer(dec.nbytes).view(self.bits_dtype).reshape(dec.shape)
+
+        # unshuffle the bytes and undo the zigzag: (r >> 1) ^ -(r & 1)
+        dec.reshape(-1).view('u1').reshape(-1, self.dtype.itemsize)[...] = res.reshape(self.dtype.itemsize, -1).T
+        np.bitwise_and(dec, 1, out=scratch)
+        np.negative(scratch, out=scratch)
+        np.right_shift(dec, 1, out=dec)
+        np.bitwise_xor(dec, scratch, out=dec)
+
+        # undo the residual along each axis
+        for axis in (-3, -2, -1):
+            np.add.accumulate(dec, axis=axis, out=dec)
+        if self.dtype.kind == 'f':
+            # back from the order-preserving integers to the float bit patterns:
+            # xor with the sign bit where it is set, with all ones elsewhere
+            np.right_shift(dec.view(self.signed_dtype), self.top_bit, out=scratch.view(self.signed_dtype))
+            np.invert(scratch, out=scratch)
+            np.bitwise_or(scratch, self.sign_bit, out=scratch)
+            np.bitwise_xor(dec, scratch, out=dec)
+
+        return dec.view(self.dtype) if out is None else out
+
+    def get_config(self):
+        return dict(id=self.codec_id, dtype=self.dtype.str)
+
+    def __repr__(self):
+        r = f'{type(self).__name__}(dtype={self.dtype.str!r})'
+        return r
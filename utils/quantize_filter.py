@@ -0,0 +1,150 @@
+import numpy as np
+
+
+from numcodecs.abc import Codec
+from numcodecs.compat import ensure_ndarray, ensure_contiguous_ndarray
+
+HEADER_DTYPE = np.dtype([('width', 'u1'), ('offset', '<f8'), ('step', '<f8')])
+QUANTIZED_DTYPES = (np.dtype('u1'), np.dtype('<u2'), np.dtype('<u4'))
+
+class ErrorBoundQuantize(Codec):
+    """Codec to quantize floating-point data within an absolute or relative error bound.
+
+    Each chunk is offset by its minimum and divided into uniform bins of
+    width `2 * error_bound`, so that every decoded value lies within
+    `error_bound` of the original one. The bin indices are stored in the
+    narrowest unsigned integer type (`u1`, `u2` or `u4`) that fits the
+    chunk's range.
+
+    Parameters
+    ----------
+    mode : {'abs', 'rel'}
+        'abs' uses `error_bound` as it is. 'rel' multiplies it by
+        `value_range`, or, if it is not given, by the value range
+        (max - min) of the chunk values other than `fill_value`.
+    error_bound : float
+        Maximum absolute error of the decoded values.
+    dtype : dtype
+        Data type to use for decoded data.
+    value_range : float, optional
+        Value range of the whole array, which 'rel' makes the bound
+        relative to, the same for every chunk.
+    fill_value : float, optional
+        Value left out of the chunk range in 'rel' mode. zarr pads the edge
+        chunks with the fill value of the array (0 by default), which would
+        otherwise inflate their range, and so their error bound. None uses
+        every value.
+
+    Notes
+    -----
+    Each encoded chunk starts with a 17-byte header holding the integer
+    width, the offset and the bin width. The bound already accounts for the
+    rounding of the decoded values to `dtype`.
+
+    Examples
+    --------
+    >>> import numpy as np
+    >>> x = np.linspace(1.33, 1.34, 5, dtype='f4')
+    >>> codec = ErrorBoundQuantize(mode='abs', error_bound=1e-3, dtype='f4')
+    >>> y = codec.encode(x)
+    >>> y[17:]
+    array([0, 1, 3, 4, 5], dtype=uint8)
+    >>> bool(np.all(np.abs(codec.decode(y) - x) <= 1e-3))
+    True
+
+    The padding of the edge chunks does not loosen the 'rel' bound:
+
+    >>> import zarr
+    >>> from numcodecs.registry import register_codec
+    >>> register_codec(ErrorBoundQuantize)
+    >>> x = np.linspace(1.33, 1.40, 1000, dtype='f4')
+    >>> codec = ErrorBoundQuantize(mode='rel', error_bound=1e-4, dtype='f4')
+    >>> z = zarr.array(x, chunks=300, filters=[codec], compressor=None)
+    >>> bool(np.abs(z[:] - x).max() <= 1e-4 * 0.07)
+    True
+    """
+
+    codec_id = 'error_bound_quantize'
+
+    def __init__(self, mode, error_bound, dtype='f4', value_range=None, fill_value=0.0):
+        if mode not in ('abs', 'rel'):
+            raise ValueError(f"mode must be 'abs' or 'rel', got {mode!r}")
+        if error_bound <= 0:
+            raise ValueError('error_bound must be positive')
+        self.mode = mode
+        self.error_bound = error_bound
+        self.dtype = np.dtype(dtype)
+        if self.dtype.kind != 'f':
+            raise ValueError('only floating-point arrays are supported')
+        if value_range is not None and value_range < 0:
+            raise ValueError('value_range must not be negative')
+        self.value_range = value_range
+        self.fill_value = fill_value
+
+    def encode(self, buf):
+        # normalise input
+        arr = ensure_ndarray(buf).view(self.dtype)
+        offset = float(arr.min()) if arr.size else 0.0
+        value_range = float(arr.max()) - offset if arr.size else 0.0
+        if not np.isfinite(value_range):
+            raise ValueError('non-finite values are not supported')
+
+        # leave room for the rounding of decoded values to dtype
+        if self.mode == 'abs':
+            error_bound = self.error_bound
+        elif self.value_range is not None:
+            error_bound = self.error_bound * self.value_range
+        else:
+            valid = arr if self.fill_value is None else arr[arr != self.fill_value]
+            error_bound = self.error_bound * (float(valid.max()) - float(valid.min()) if valid.size else 0.0)
+        if error_bound == 0:
+            # constant chunk, or a constant edge chunk and its padding: both values are bin edges
+            step = value_range if value_range > 0 else 1.0
+        else:
+            error_bound -= float(np.spacing(self.dtype.type(max(abs(offset), abs(offset + value_range)))))
+            if error_bound <= 0:
+                raise ValueError(f'error bound {self.error_bound} is below the precision of {self.dtype}')
+            step = 2 * error_bound
+
+        # pick the narrowest integer width
+        num_bins = int(np.rint(value_range / step))
+        for width, quantized_dtype in enumerate(QUANTIZED_DTYPES):
+            if num_bins <= np.iinfo(quantized_dtype).max:
+                break
+        else:
+            raise ValueError(f'error bound {self.error_bound} needs more than 32 bits per value')
+
+        # setup encoded output
+        enc = np.empty(HEADER_DTYPE.itemsize + arr.size * quantized_dtype.itemsize, dtype='u1')
+        enc[:HEADER_DTYPE.itemsize].view(HEADER_DTYPE)[0] = (width, offset, step)
+        quantized = np.subtract(arr, offset, dtype='f8')
+        quantized /= step
+        np.rint(quantized, out=quantized)
+        enc[HEADER_DTYPE.itemsize:].view(quantized_dtype)[:] = quantized.reshape(-1)
+
+        return enc
+
+    def decode(self, buf, out=None):
+        # normalise input
+        enc = ensure_contiguous_ndarray(buf).view('u1')
+        width, offset, step = enc[:HEADER_DTYPE.itemsize].view(HEADER_DTYPE)[0].item()
+        quantized = enc[HEADER_DTYPE.itemsize:].view(QUANTIZED_DTYPES[width])
+
+        # setup decoded output
+        if out is None:
+            dec = np.empty(quantized.shape, dtype=self.dtype)
+        else:
+            dec = ensure_contiguous_ndarray(out).view(self.dtype).reshape(-1)
+        dec[:] = quantized * step + offset
+
+        return dec if out is None else out
+
+    def get_config(self):
+        return dict(
+            id=self.codec_id, mode=self.mode, error_bound=self.error_bound, dtype=self.dtype.str,
+            value_range=self.value_range, fill_value=self.fill_value)
+
+    def __repr__(self):
+        r = (f'{type(self).__name__}(mode={self.mode!r}, error_bound={self.error_bound}, dtype={self.dtype.str!r}, '
+             f'value_range={self.value_range}, fill_value={self.fill_value})')
+        return r
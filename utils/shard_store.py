@@ -0,0 +1,391 @@
+"""Sharded directory store for zarr v2, in the style of zarr v3 sharding.
+
+`ShardedStore` packs the chunks of each block of `chunks_per_shard` chunks
+into a single file holding the encoded chunks followed by an index of
+(offset, length) pairs, so that an array of millions of chunks becomes a
+few thousand files. A chunk is read with one positioned read once the index
+of its shard is cached, outside the store lock and through a cache of open
+shard files, so that threads read chunks in parallel. The chunks written to
+a shard are buffered and written together when the shard is complete or the
+store is flushed.
+
+The metadata of a sharded array is kept in a '.zshard' file, holding its
+'.zarray' metadata and its number of chunks per shard, instead of a
+'.zarray' file. Plain zarr v2 readers (`zarr.DirectoryStore`, ome-zarr,
+napari) therefore find no array there rather than decoding each shard as a
+single chunk, and sharded arrays can only be read through `ShardedStore`.
+The arrays with a '.zarray' file are stored as plain files, as in
+`zarr.DirectoryStore`.
+"""
+
+import json
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+from numcodecs.compat import ensure_bytes
+from zarr.storage import DirectoryStore, _listdir_from_keys
+from zarr.util import json_dumps, normalize_storage_path
+
+SHARD_META_KEY = ".zshard" # replaces the '.zarray' file of sharded arrays
+ARRAY_META_KEY = ".zarray"
+MISSING = np.iinfo('<u8').max # (offset, length) of a chunk absent from its shard
+DEFAULT_CHUNKS_PER_SHARD = (1, 1, 2, 4, 4)
+MAX_OPEN_SHARDS = 256 # shard files kept open for reading
+
+def _pread(fname, length, offset):
+    with open(fname, "rb") as f:
+        if hasattr(os, "pread"):
+            return os.pread(f.fileno(), length, offset)
+        f.seek(offset)
+        return f.read(length)
+
+def open_store(path, chunks_per_shard=None):
+    """Return `path` as it is, or a `ShardedStore` at `path` if `chunks_per_shard` is given."""
+    return path if chunks_per_shard is None else ShardedStore(path, chunks_per_shard)
+
+class ShardedStore(DirectoryStore):
+    """Directory store which packs blocks of chunks into shard files.
+
+    Parameters
+    ----------
+    path : str
+        Location of the store directory.
+    chunks_per_shard : tuple of int
+        Number of chunks per shard along the last axes of the arrays created
+        through this store; missing leading axes are 1. Existing arrays keep
+        their layout: sharded arrays the one recorded in their '.zshard',
+        plain arrays stay plain.
+
+    Notes
+    -----
+    Writes are buffered: call `flush` (or `close`) once an array has been
+    written, so that partially written shards reach the disk. The buffer is
+    shared by the threads of one process, but a shard must not be written
+    by several processes at once. Up to `MAX_OPEN_SHARDS` shard files stay
+    open for reading until `close`.
+    """
+
+    def __init__(self, path, chunks_per_shard=DEFAULT_CHUNKS_PER_SHARD, normalize_keys=False):
+        super().__init__(path, normalize_keys=normalize_keys)
+        if any(int(n) < 1 for n in chunks_per_shard):
+            raise ValueError(f"Invalid number of chunks per shard: {chunks_per_shard}")
+        self.chunks_per_shard = tuple(int(n) for n in chunks_per_shard)
+        self._lock = threading.RLock()
+        self._array_meta = {} # array path -> layout, or None if it is not a sharded array
+        self._indices = {} # shard key -> (offset, length) of its chunks
+        self._pending = {} # shard key -> {chunk position in shard: encoded chunk}
+        self._files = OrderedDict() # shard key -> [file descriptor, readers, retired], least recently used first
+
+    # layout
+    def _read_shard_meta(self, path):
+        # contents of the '.zshard' file of an array, or None
+        try:
+            return json.loads(DirectoryStore.__getitem__(self, (path + "/" if path else "") + SHARD_META_KEY))
+        except KeyError:
+            return None
+
+    def _layout(self, path):
+        if path not in self._array_meta:
+            zshard = self._read_shard_meta(path)
+            if zshard is None:
+                self._array_meta[path] = None
+            else:
+                zarray = zshard["zarray"]
+                num_chunks = tuple(-(-s // c) for s, c in zip(zarray["shape"], zarray["chunks"]))
+                self._array_meta[path] = dict(
+                    separator = zarray.get("dimension_separator") or ".",
+                    num_chunks = num_chunks,
+                    chunks_per_shard = tuple(zshard["chunks_per_shard"]))
+        return self._array_meta[path]
+
+    def _split_chunk_key(self, key):
+        # returns (shard key, position of the chunk in the shard, layout), or None for other keys
+        components = key.split("/")
+        if components[-1].startswith("."):
+            return None
+        for i in range(len(components)):
+            layout = self._layout("/".join(components[:i]))
+            if layout is None:
+                continue
+            rest = components[i:]
+            coords = rest if layout["separator"] == "/" else rest[0].split(".") if len(rest) == 1 else []
+            if len(coords) != len(layout["num_chunks"]) or not all(c.isdigit() for c in coords):
+                return None
+            coords = [int(c) for c in coords]
+            shard_coords = [c // n for c, n in zip(coords, layout["chunks_per_shard"])]
+            position = int(np.ravel_multi_index([c % n for c, n in zip(coords, layout["chunks_per_shard"])], layout["chunks_per_shard"]))
+            shard_key = "/".join(components[:i] + [layout["separator"].join(map(str, shard_coords))])
+            return shard_key, position, layout
+        return None
+
+    def _shard_coords(self, shard_key, layout):
+        # array path and shard grid coordinates of a shard key
+        if layout["separator"] == "/":
+            components = shard_key.split("/")
+            ndim = len(layout["num_chunks"])
+            return "/".join(components[:-ndim]), [int(c) for c in components[-ndim:]]
+        path, _, name = shard_key.rpartition("/")
+        return path, [int(c) for c in name.split(".")]
+
+    def _chunk_keys_of_shard(self, shard_key, layout):
+        path, shard_coords = self._shard_coords(shard_key, layout)
+        origin = [c * n for c, n in zip(shard_coords, layout["chunks_per_shard"])]
+        prefix = path + "/" if path else ""
+        for position, offset in enumerate(np.ndindex(*layout["chunks_per_shard"])):
+            yield position, prefix + layout["separator"].join(str(o + d) for o, d in zip(origin, offset))
+
+    def _shard_size(self, shard_key, layout):
+        # number of chunks of the shard inside the array
+        _, shard_coords = self._shard_coords(shard_key, layout)
+        return int(np.prod([
+            min(n, total - c * n) for c, n, total in zip(shard_coords, layout["chunks_per_shard"], layout["num_chunks"])]))
+
+    # shard files
+    def _retire_file(self, shard_key):
+        # close the cached descriptor of a shard once its last reader is done
+        entry = self._files.pop(shard_key, None)
+        if entry is not None:
+            entry[2] = True
+            if entry[1] == 0:
+                os.close(entry[0])
+
+    def _acquire_file(self, shard_key):
+        # cached descriptor of a shard file, counted as read until `_release_file`; call with the lock held
+        entry = self._files.pop(shard_key, None)
+        if entry is None:
+            entry = [os.open(os.path.join(self.path, shard_key), os.O_RDONLY | getattr(os, "O_BINARY", 0)), 0, False]
+        self._files[shard_key] = entry
+        entry[1] += 1
+        while len(self._files) > MAX_OPEN_SHARDS:
+            self._retire_file(next(iter(self._files)))
+        return entry
+
+    def _release_file(self, entry):
+        with self._lock:
+            entry[1] -= 1
+            if entry[2] and entry[1] == 0:
+                os.close(entry[0])
+
+    def _pread_file(self, entry, length, offset):
+        # called without the lock, so that threads read in parallel
+        try:
+            return os.pread(entry[0], length, offset)
+        finally:
+            self._release_file(entry)
+
+    def _pread_shard(self, shard_key, length, offset):
+        if not hasattr(os, "pread"):
+            return _pread(os.path.join(self.path, shard_key), length, offset)
+        with self._lock:
+            entry = self._acquire_file(shard_key)
+        return self._pread_file(entry, length, offset)
+
+    def _read_index(self, shard_key, layout):
+        if shard_key not in self._indices:
+            fname = os.path.join(self.path, shard_key)
+            if not os.path.isfile(fname):
+                return None
+            num = int(np.prod(layout["chunks_per_shard"]))
+            file_size = os.path.getsize(fname)
+            index = np.frombuffer(self._pread_shard(shard_key, 16 * num, file_size - 16 * num), dtype='<u8').reshape(num, 2)
+            self._indices[shard_key] = index
+        return self._indices[shard_key]
+
+    def _chunk_range(self, shard_key, position, layout):
+        # (offset, length) of a chunk in its shard file, or None
+        index = self._read_index(shard_key, layout)
+        if index is None or index[position, 0] == MISSING:
+            return None
+        offset, length = index[position]
+        return int(offset), int(length)
+
+    def _read_chunk(self, shard_key, position, layout):
+        chunk_range = self._chunk_range(shard_key, position, layout)
+        if chunk_range is None:
+            return None
+        offset, length = chunk_range
+        return self._pread_shard(shard_key, length, offset)
+
+    def _write_shard(self, shard_key, layout):
+        chunks = self._pending.pop(shard_key)
+        num = int(np.prod(layout["chunks_per_shard"]))
+        # keep the chunks already on disk which were not rewritten
+        index = self._read_index(shard_key, layout)
+        if index is not None:
+            for position in range(num):
+                if position not in chunks and index[position, 0] != MISSING:
+                    chunks[position] = self._read_chunk(shard_key, position, layout)
+        self._indices.pop(shard_key, None)
+        # the shard file is replaced: readers holding the old one finish with it
+        self._retire_file(shard_key)
+        if not chunks:
+            if index is not None:
+                os.remove(os.path.join(self.path, shard_key))
+            return
+        new_index = np.full((num, 2), MISSING, dtype='<u8')
+        offset = 0
+        for position in sorted(chunks):
+            length = len(chunks[position])
+            new_index[position] = (offset, length)
+            offset += length
+        data = b"".join(bytes(chunks[position]) for position in sorted(chunks)) + new_index.tobytes()
+        DirectoryStore.__setitem__(self, shard_key, data)
+
+    def flush(self):
+        """Write the buffered chunks of every shard."""
+        with self._lock:
+            for shard_key in list(self._pending):
+                self._write_shard(shard_key, self._shard_layout(shard_key))
+
+    def _shard_layout(self, key):
+        # layout of the sharded array a file belongs to, or None
+        components = key.split("/")
+        for i in range(len(components)):
+            layout = self._layout("/".join(components[:i]))
+            if layout is not None:
+                return layout
+        return None
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            for shard_key in list(self._files):
+                self._retire_file(shard_key)
+
+    # mapping interface
+    def _shard_meta_key(self, key):
+        # '.zshard' key standing for the '.zarray' key of a sharded array, or None
+        path, _, name = key.rpartition("/")
+        if name != ARRAY_META_KEY or super().__contains__(key):
+            return None
+        shard_meta_key = (path + "/" if path else "") + SHARD_META_KEY
+        return shard_meta_key if super().__contains__(shard_meta_key) else None
+
+    def __getitem__(self, key):
+        key = self._normalize_key(key)
+        split = self._split_chunk_key(key)
+        if split is None:
+            shard_meta_key = self._shard_meta_key(key)
+            if shard_meta_key is not None:
+                return json_dumps(json.loads(super().__getitem__(shard_meta_key))["zarray"])
+            return super().__getitem__(key)
+        shard_key, position, layout = split
+        with self._lock:
+            pending = self._pending.get(shard_key, {})
+            if position in pending:
+                return bytes(pending[position])
+            chunk_range = self._chunk_range(shard_key, position, layout)
+            if chunk_range is None:
+                raise KeyError(key)
+            if not hasattr(os, "pread"):
+                return self._read_chunk(shard_key, position, layout)
+            # the descriptor is taken with the index, so that a rewrite of the shard does not mix them up
+            entry = self._acquire_file(shard_key)
+        offset, length = chunk_range
+        return self._pread_file(entry, length, offset)
+
+    def __setitem__(self, key, value):
+        key = self._normalize_key(key)
+        split = self._split_chunk_key(key)
+        if split is None:
+            path, _, name = key.rpartition("/")
+            if name != ARRAY_META_KEY or super().__contains__(key):
+                # existing plain arrays stay plain
+                super().__setitem__(key, value)
+                return
+            zarray = json.loads(ensure_bytes(value))
+            with self._lock:
+                zshard = self._read_shard_meta(path)
+                if zshard is None:
+                    # new arrays are sharded
+                    ndim = len(zarray["shape"])
+                    zshard = dict(chunks_per_shard = ((1,) * ndim + self.chunks_per_shard)[-ndim:])
+                # a rewrite (e.g. resize) keeps the layout of the array
+                zshard["zarray"] = zarray
+                super().__setitem__((path + "/" if path else "") + SHARD_META_KEY, json_dumps(zshard))
+                self._array_meta.pop(path, None)
+            return
+        shard_key, position, layout = split
+        with self._lock:
+            pending = self._pending.setdefault(shard_key, {})
+            pending[position] = ensure_bytes(value)
+            if len(pending) == self._shard_size(shard_key, layout):
+                self._write_shard(shard_key, layout)
+
+    def __delitem__(self, key):
+        key = self._normalize_key(key)
+        split = self._split_chunk_key(key)
+        if split is None:
+            shard_meta_key = self._shard_meta_key(key)
+            if shard_meta_key is not None:
+                with self._lock:
+                    super().__delitem__(shard_meta_key)
+                    self._array_meta.pop(key.rpartition("/")[0], None)
+                return
+            return super().__delitem__(key)
+        shard_key, position, layout = split
+        with self._lock:
+            if key not in self:
+                raise KeyError(key)
+            pending = self._pending.setdefault(shard_key, {})
+            pending.pop(position, None)
+            # rewriting without the chunk drops it
+            index = self._read_index(shard_key, layout)
+            if index is not None:
+                index = index.copy()
+                index[position] = MISSING
+                self._indices[shard_key] = index
+            self._write_shard(shard_key, layout)
+
+    def __contains__(self, key):
+        key = self._normalize_key(key)
+        split = self._split_chunk_key(key)
+        if split is None:
+            return super().__contains__(key) or self._shard_meta_key(key) is not None
+        shard_key, position, layout = split
+        with self._lock:
+            if position in self._pending.get(shard_key, {}):
+                return True
+            index = self._read_index(shard_key, layout)
+        return index is not None and index[position, 0] != MISSING
+
+    def keys(self):
+        self.flush()
+        for key in super().keys():
+            path, _, name = key.rpartition("/")
+            if name == SHARD_META_KEY:
+                yield (path + "/" if path else "") + ARRAY_META_KEY
+                continue
+            layout = None if name.startswith(".") else self._shard_layout(key)
+            if layout is None:
+                yield key
+                continue
+            index = self._read_index(key, layout)
+            for position, chunk_key in self._chunk_keys_of_shard(key, layout):
+                if index[position, 0] != MISSING:
+                    yield chunk_key
+
+    def rmdir(self, path=None):
+        path = normalize_storage_path(path)
+        prefix = path + "/" if path else ""
+        with self._lock:
+            # forget the cached state of the removed arrays and shards
+            for cache in (self._array_meta, self._indices, self._pending):
+                for key in [key for key in cache if key == path or key.startswith(prefix)]:
+                    del cache[key]
+            for shard_key in [key for key in self._files if key.startswith(prefix)]:
+                self._retire_file(shard_key)
+            super().rmdir(path)
+
+    def listdir(self, path=None):
+        path = normalize_storage_path(path)
+        layout = self._layout(path)
+        if layout is None or layout["separator"] == ".":
+            return _listdir_from_keys(self, path)
+        # nested chunk keys are listed with '.', as in DirectoryStore
+        prefix = path + "/" if path else ""
+        return sorted({key[len(prefix):].replace("/", ".") for key in self.keys() if key.startswith(prefix)})
+
+    def __eq__(self, other):
+        return isinstance(other, ShardedStore) and self.path == other.path